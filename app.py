@@ -1,32 +1,37 @@
 import streamlit as st
-from scraper.web_scraper import scrape_website
-from utils.helpers import chunk_text_smart, build_idf, select_top_chunks
-import requests
-import json
+from utils.cache import site_cache
+from utils.http import session_stats
+from utils.answer_cache import answer_cache
+from utils.ingest import load_site
+from utils.model_client import model_client
+from utils.service import ChatService
+from utils.tracing import start_metrics_server
 import time
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from config import GEMINI_API_KEY, CONTEXT_MAX_CHARS, MAX_HISTORY_TURNS, GEMINI_TIMEOUT, CHUNK_SIZE, CHUNK_OVERLAP_WORDS
+from config import GEMINI_STREAM
 
-# Networking helpers with retry for transient errors
-def make_session():
-    retry_strategy = Retry(
-        total=3,
-        connect=3,
-        read=3,
-        backoff_factor=1.5,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=frozenset(["GET", "POST"])
+# Prometheus metrics on METRICS_PORT, once per process (no-op when unset)
+start_metrics_server()
+
+def render_crawl_progress(site):
+    """Crawl progress for a site that is still being indexed."""
+    progress = site.progress()
+    if progress["done"]:
+        refreshed = progress["refreshed_at"]
+        note = f" Refreshed at {time.strftime('%H:%M', time.localtime(refreshed))}." if refreshed else ""
+        st.caption(f"Indexed {progress['pages_indexed']} pages ({progress['chunks']} chunks) in {progress['elapsed']:.1f}s.{note}")
+        return
+    total = max(progress["pages_discovered"], 1)
+    st.progress(
+        min(progress["pages_processed"] / total, 1.0),
+        text=f"Crawling: {progress['pages_processed']}/{total} pages fetched, {progress['chunks']} chunks indexed so far",
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session = requests.Session()
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    return session
 
-def post_with_retry(url, headers, payload, timeout):
-    session = make_session()
-    return session.post(url, headers=headers, data=json.dumps(payload), timeout=timeout)
+# Refresh the progress bar on its own while the crawl runs (Streamlit >= 1.37)
+if hasattr(st, "fragment"):
+    render_crawl_progress = st.fragment(run_every=2)(render_crawl_progress)
+
+# One pipeline for the UI and the batch tools; streamed answers are rendered incrementally
+chat_service = ChatService(model_client, stream=GEMINI_STREAM, batch=False)
 
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
@@ -175,26 +180,32 @@ else:
     url = st.text_input("Enter Website URL:")
 
     if url:
+        site = load_site(url)
         with st.spinner("Scraping website..."):
-            content = scrape_website(url)
-        if content.startswith("Error"):
-            st.error(content)
+            # Only wait for the first page; the rest is indexed in the background
+            site.wait_until_ready()
+        if site.error:
+            st.error(site.error)
         else:
-            st.success("Website scraped successfully!")
+            if site.snapshot is not None:
+                built = time.strftime("%Y-%m-%d %H:%M", time.localtime(site.snapshot.created_at))
+                st.success(f"Loaded the saved index of this website (built {built}).")
+            elif site.done:
+                st.success("Website scraped successfully!")
+            else:
+                st.success("First pages scraped! You can start asking while the rest of the website is indexed.")
+            if site.warning:
+                st.warning(site.warning)
             st.info("🎉 Great! I've analyzed the website. Feel free to ask me anything about it, or check out the suggested questions below to get started!")
+            render_crawl_progress(site)
 
             # Initialize or reset session state for chat when URL changes
             if "last_url" not in st.session_state or st.session_state["last_url"] != url:
                 st.session_state["last_url"] = url
                 st.session_state["messages"] = []
 
-            # Prepare retrieval data once and store (sentence-aware chunking with overlap)
-            chunks = chunk_text_smart(content, CHUNK_SIZE, CHUNK_OVERLAP_WORDS)
-            st.session_state["chunks"] = chunks
-            st.session_state["idf"] = build_idf(chunks)
-            st.session_state["site_context"] = "\n\n".join(chunks)  # Full context for debug
-            chunk_lengths = [len(chunk) for chunk in chunks]
-            st.session_state["chunk_lengths"] = chunk_lengths
+            # Retrieval data is built once per site and shared by reference across sessions
+            st.session_state["site"] = site
 
             st.caption("Chat about this website below. The assistant answers using only the scraped content.")
 
@@ -223,16 +234,31 @@ else:
             debug_mode = st.checkbox("Debug mode (show chunk info)")
             show_content = st.checkbox("Show full scraped content")
             if show_content:
-                st.text_area("Scraped website content:", value=st.session_state.get("site_context", ""), height=200)
+                st.text_area("Scraped website content:", value=site.full_text(), height=200)
 
             if debug_mode:
-                chunk_lengths = st.session_state["chunk_lengths"]
-                st.write(f"Total chunks: {len(st.session_state['chunks'])}")
-                st.write(f"Total characters in site context: {len(st.session_state['site_context'])}")
-                st.write(f"Average chunk size: {sum(chunk_lengths) / len(chunk_lengths):.1f} chars")
-                st.write(f"Min chunk size: {min(chunk_lengths)} chars")
-                st.write(f"Max chunk size: {max(chunk_lengths)} chars")
-                st.write(f"Unique words in IDF: {len(st.session_state['idf'])}")
+                # None once refreshes have removed every page
+                chunk_stats = site.chunk_stats()
+                st.write(f"Total chunks: {chunk_stats['chunks'] if chunk_stats else 0}")
+                st.write(f"Total characters in site context: {site.corpus.num_chars}")
+                if chunk_stats is not None:
+                    st.write(f"Average chunk size: {chunk_stats['avg_chars']:.1f} chars")
+                    st.write(f"Min chunk size: {chunk_stats['min_chars']} chars")
+                    st.write(f"Max chunk size: {chunk_stats['max_chars']} chars")
+                st.write(f"Unique words in index: {site.index.vocabulary_size}")
+                cache_stats = site_cache.stats()
+                st.write(f"Pages by fetch status: {dict(site.page_status)}")
+                dedup = site.dedup.stats()
+                st.write(f"Duplicates skipped: {dedup['duplicate_pages']} pages, {dedup['duplicate_chunks']} chunks, {dedup['repeated_block_chars']} characters of repeated blocks")
+                st.write(f"Site cache: {cache_stats['entries']} sites, {cache_stats['bytes'] / 1e6:.1f} MB, {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+                answers = answer_cache.stats()
+                st.write(f"Answer cache: {answers['hits']} hits, {answers['near_hits']} near-duplicate hits, {answers['misses']} misses ({answers['saved_seconds']:.1f}s of generation saved)")
+                model = model_client.stats()
+                st.write(f"Model client: {model['in_flight']} in flight, {model['waiting']} waiting, circuit {model['circuit']} "
+                         f"({model['requests']} requests for {model['calls']} calls, {model['retries']} retries, "
+                         f"{model['hedges']} hedges / {model['hedge_wins']} won, {model['fast_failed']} failed fast)")
+                for name, pool in session_stats().items():
+                    st.write(f"HTTP pool '{name}': {pool['requests']} requests over {pool['connections']} connections ({pool['reused']} reused) to {pool['hosts']} hosts")
 
             # Render chat history
             if "messages" in st.session_state:
@@ -257,110 +283,61 @@ else:
                 with st.chat_message("user"):
                     st.write(prompt)
 
-                with st.spinner("Generating answer..."):
-                    model = "gemini-1.5-flash-latest"
-                    url_endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={GEMINI_API_KEY}"
-                    headers = {"Content-Type": "application/json"}
-
-                    # Select the most relevant website chunks for this question
-                    start_time = time.time()
-                    selected_context = select_top_chunks(
-                        prompt,
-                        st.session_state["chunks"],
-                        st.session_state["idf"],
-                        k=7,
-                        max_chars=CONTEXT_MAX_CHARS
-                    )
-                    end_time = time.time()
-                    processing_time = end_time - start_time
-
-                    if debug_mode:
-                        st.write(f"Total chunks: {len(st.session_state['chunks'])}")
-                        st.write(f"Selected context length: {len(selected_context)} chars")
-                        st.write(f"Number of selected chunks: {selected_context.count('Chunk ')}")
-                        st.write(f"Processing time for chunk selection: {processing_time:.2f} seconds")
-                        st.write("Selected chunks preview:")
-                        st.text(selected_context[:1000] + "..." if len(selected_context) > 1000 else selected_context)
+                # Retrieval, prompt build, answer cache and generation run in ChatService, in one
+                # trace per question; deltas are rendered as they stream in
+                debug_area = st.container()
+                with st.spinner("Generating answer..."), st.chat_message("assistant"):
+                    placeholder = st.empty()
+                    received = []
 
-                    # Build a single focused user message
-                    user_message = (
-                        "You are answering strictly from the provided website snippets.\n"
-                        "Snippets:\n"
-                        f"{selected_context}\n\n"
-                        f"Question: {prompt}\n\n"
-                        "Instructions:\n"
-                        "- If the question is a greeting (like 'hi' or 'hello'), respond with a friendly welcome and invite them to ask about the website.\n"
-                        "- Otherwise, base the answer only on the snippets. Do not use outside knowledge.\n"
-                        "- If the snippets do not contain the answer, say: "
-                        "\"I don't know based on the provided website content.\"\n"
-                        "- Keep the answer concise and relevant."
-                    )
+                    def show_delta(delta):
+                        received.append(delta)
+                        placeholder.markdown("".join(received) + "▌")
 
-                    # Build contents starting with recent conversation history, then the current question
-                    contents = []
-                    history = st.session_state["messages"][-MAX_HISTORY_TURNS:]
-                    for m in history:
-                        contents.append({
-                            "role": "user" if m["role"] == "user" else "model",
-                            "parts": [{"text": m["content"]}]
-                        })
-                    contents.append({
-                        "role": "user",
-                        "parts": [{"text": user_message}]
-                    })
+                    def show_prompt(prompt_build):
+                        if not debug_mode:
+                            return
+                        selected_context = prompt_build["context"]
+                        tokens = prompt_build["tokens"]
+                        with debug_area:
+                            st.write(f"Total chunks: {site.num_chunks}")
+                            st.write(f"Selected context length: {len(selected_context)} chars")
+                            st.write(f"Number of selected excerpts: {selected_context.count('Chunk')}")
+                            st.write(
+                                f"Prompt tokens: {tokens['total']} of {tokens['budget']} "
+                                f"(instructions {tokens['instructions']}, question {tokens['question']}, "
+                                f"snippets {tokens['snippets']}, history {tokens['history']} over {len(prompt_build['history'])} messages)"
+                            )
+                            st.write("Selected chunks preview:")
+                            st.text(selected_context[:1000] + "..." if len(selected_context) > 1000 else selected_context)
 
-                    # Add the current question last to focus the model
-                    contents.append({
-                        "role": "user",
-                        "parts": [
-                            {
-                                "text": (
-                                    f"Question: {prompt}\n\n"
-                                    "- If the question is a greeting (like 'hi' or 'hello'), respond with a friendly welcome and invite them to ask about the website.\n"
-                                    "- Otherwise, base your answer strictly on the snippets above.\n"
-                                    "- If information is missing, say: \"I don't know based on the provided website content.\"\n"
-                                    "- Keep the answer concise and relevant."
-                                )
-                            }
-                        ]
-                    })
+                    result = chat_service.answer(site, prompt, st.session_state["messages"][:-1],
+                                                 on_delta=show_delta, on_prompt=show_prompt)
+                    answer = result["answer"]
+                    if answer:
+                        placeholder.markdown(answer)
+                        st.session_state["messages"].append({"role": "assistant", "content": answer})
+                    else:
+                        placeholder.empty()
 
-                    payload = {
-                        "contents": contents,
-                        "generationConfig": {
-                            "maxOutputTokens": 500,
-                            "temperature": 0.2,
-                            "topP": 0.9,
-                            "topK": 40
-                        }
-                    }
-
-                    try:
-                        api_start = time.time()
-                        response = post_with_retry(url_endpoint, headers, payload, timeout=GEMINI_TIMEOUT)
-                        if response.status_code == 200:
-                            res_json = response.json()
-                            answer = (
-                                res_json.get("candidates", [{}])[0]
-                                .get("content", {})
-                                .get("parts", [{}])[0]
-                                .get("text", "")
-                            ) or "No answer returned."
-
-                            api_end = time.time()
-                            api_time = api_end - api_start
-
-                            st.session_state["messages"].append({"role": "assistant", "content": answer})
-                            with st.chat_message("assistant"):
-                                st.write(answer)
-
-                            if debug_mode:
-                                st.write(f"API response time: {api_time:.2f} seconds")
-                        elif response.status_code == 503:
-                            st.error("The Gemini model is currently overloaded. Please try again in a few minutes.")
-                        else:
-                            st.error(f"API Error: {response.status_code} - {response.text}")
-                    except requests.exceptions.ReadTimeout:
+                error_type = result.get("error_type")
+                if error_type is not None:
+                    if received:
+                        # Whatever arrived before the stream broke off is kept
+                        st.warning(f"The answer was cut short: {result['error']}")
+                    elif result.get("status_code") == 503 or error_type in ("CircuitOpen", "ModelBusy"):
+                        st.error("The Gemini model is currently overloaded. Please try again in a few minutes.")
+                    elif error_type == "GeminiTimeout":
                         st.error("The request to Gemini timed out. The website content may be large. Try asking a shorter question or reduce context.")
-                    except requests.exceptions.RequestException as e:
-                        st.error(f"Request failed: {e}")
+                    else:
+                        st.error(f"Request failed: {result['error']}")
+
+                if debug_mode:
+                    timings = result["timings"]
+                    st.write(f"Processing time for chunk selection: {(timings['retrieval_ms'] + timings['prompt_ms']) / 1000:.2f} seconds")
+                    if result["cached"]:
+                        st.write("Answer served from cache")
+                    if "first_token_ms" in timings:
+                        st.write(f"Time to first token: {timings['first_token_ms'] / 1000:.2f} seconds")
+                    if "generation_ms" in timings:
+                        st.write(f"API response time: {timings['generation_ms'] / 1000:.2f} seconds")
@@ -5,7 +5,78 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "AIzaSyBpQXS0jtOsTwDaLoSNmQZPw69zvJ
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))  # number of words per chunk
 CHUNK_OVERLAP_WORDS = int(os.getenv("CHUNK_OVERLAP_WORDS", "80"))  # word overlap between chunks
 
+# Retrieval
+DENSE_RETRIEVAL = os.getenv("DENSE_RETRIEVAL", "1") == "1"  # fuse BM25 with local hashing-vector similarity (needs NumPy)
+DENSE_DIM = int(os.getenv("DENSE_DIM", "512"))  # dimensions of the hashed chunk vectors
+DENSE_WEIGHT = float(os.getenv("DENSE_WEIGHT", "1.0"))  # weight of the dense ranking in the fusion (BM25 = 1)
+DENSE_MIN_SIMILARITY = float(os.getenv("DENSE_MIN_SIMILARITY", "0.15"))  # cosine below which dense matches are ignored
+
 # Request/latency tuning
-CONTEXT_MAX_CHARS = int(os.getenv("CONTEXT_MAX_CHARS", "15000"))  # cap website context to reduce latency
+CONTEXT_MAX_CHARS = int(os.getenv("CONTEXT_MAX_CHARS", "15000"))  # character cap for callers without a token budget
 MAX_HISTORY_TURNS = int(os.getenv("MAX_HISTORY_TURNS", "6"))      # number of recent turns to include in prompt
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "5000"))     # input tokens for instructions + snippets + history
+PROMPT_HISTORY_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", "0.2"))  # max share of the budget spent on history
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")    # tiktoken encoding used to count tokens
 GEMINI_TIMEOUT = int(os.getenv("GEMINI_TIMEOUT", "90"))            # request timeout in seconds
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash-latest")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")  # point at a mock server for testing
+GEMINI_STREAM = os.getenv("GEMINI_STREAM", "1") == "1"             # stream answers token by token
+
+# Model client (process-wide limits on Gemini calls, see utils/model_client.py)
+MODEL_MAX_CONCURRENT = int(os.getenv("MODEL_MAX_CONCURRENT", "8"))       # Gemini requests in flight; further questions queue
+MODEL_QUEUE_TIMEOUT = float(os.getenv("MODEL_QUEUE_TIMEOUT", "30"))      # seconds a question may wait for a free slot
+MODEL_RATE_PER_MINUTE = float(os.getenv("MODEL_RATE_PER_MINUTE", "60"))  # API quota in requests/minute (0 = unlimited)
+MODEL_BURST = int(os.getenv("MODEL_BURST", "5"))                         # requests allowed back-to-back within the quota
+MODEL_MAX_ATTEMPTS = int(os.getenv("MODEL_MAX_ATTEMPTS", "3"))           # tries per question on 429/5xx/timeouts
+MODEL_HEDGE_AFTER = float(os.getenv("MODEL_HEDGE_AFTER", "8"))           # seconds without a response before a duplicate request (0 = never)
+MODEL_BREAKER_FAILURES = int(os.getenv("MODEL_BREAKER_FAILURES", "5"))   # consecutive 5xx/timeouts that open the circuit
+MODEL_BREAKER_RESET = float(os.getenv("MODEL_BREAKER_RESET", "30"))      # seconds the circuit stays open before a trial request
+
+# Observability (utils/tracing.py)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # serve Prometheus metrics on http://127.0.0.1:<port>/metrics (0 = off)
+METRICS_FILE = os.getenv("METRICS_FILE", "")        # rewrite Prometheus metrics to this file after every question ("" = off)
+TRACE_DIR = os.getenv("TRACE_DIR", "")              # write one JSON trace per question to this directory ("" = off)
+
+# Shared HTTP connection pools (Gemini calls and page fetches)
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))  # number of hosts with a cached pool
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))          # keep-alive connections kept per host
+
+# Shared site cache (crawl results + retrieval index reused across reruns and sessions)
+SITE_CACHE_TTL = int(os.getenv("SITE_CACHE_TTL", "3600"))                # seconds before a cached site is re-crawled
+SITE_CACHE_MAX_ENTRIES = int(os.getenv("SITE_CACHE_MAX_ENTRIES", "16"))  # max number of cached sites (LRU eviction)
+SITE_CACHE_MAX_MB = int(os.getenv("SITE_CACHE_MAX_MB", "512"))            # approximate memory cap for cached sites
+SITE_REFRESH_INTERVAL = int(os.getenv("SITE_REFRESH_INTERVAL", "1800"))  # seconds between background re-crawls of a cached site (0 = off; keep below SITE_CACHE_TTL)
+SITE_REFRESH_WORKERS = int(os.getenv("SITE_REFRESH_WORKERS", "1"))        # background re-crawls running at once
+SITE_REFRESH_REBUILD_RATIO = float(os.getenv("SITE_REFRESH_REBUILD_RATIO", "0.3"))  # rebuild instead of patching once this share of chunks was removed
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "1"))                  # link depth followed from the start URL
+CRAWL_DELAY = float(os.getenv("CRAWL_DELAY", "1.0"))                      # politeness delay between page fetches
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "4"))                      # concurrent page fetches per crawl
+CRAWL_RATE_PER_HOST = float(os.getenv("CRAWL_RATE_PER_HOST", "4"))        # max requests/second to one host (0 = use CRAWL_DELAY)
+CRAWL_BURST = int(os.getenv("CRAWL_BURST", "4"))                          # requests allowed back-to-back before pacing kicks in
+CRAWL_SKIP_NON_HTML = os.getenv("CRAWL_SKIP_NON_HTML", "1") == "1"        # skip links to PDFs, images, archives, ...
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "200"))                # page budget per crawl (0 = no limit)
+CRAWL_RESPECT_ROBOTS = os.getenv("CRAWL_RESPECT_ROBOTS", "1") == "1"      # honour robots.txt Disallow and Crawl-delay
+CRAWL_USE_SITEMAPS = os.getenv("CRAWL_USE_SITEMAPS", "1") == "1"          # seed the crawl from sitemap.xml / sitemap indexes
+CRAWL_MAX_SITEMAPS = int(os.getenv("CRAWL_MAX_SITEMAPS", "20"))           # sitemap documents read per crawl
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", "0"))                # worker processes for parsing/chunking (0 = inline, -1 = one per core)
+CRAWL_MAX_PAGE_BYTES = int(os.getenv("CRAWL_MAX_PAGE_BYTES", str(5 * 1024 * 1024)))  # larger responses are cut off (0 = no limit)
+DEDUP_MIN_BLOCK_CHARS = int(os.getenv("DEDUP_MIN_BLOCK_CHARS", "20"))     # shorter text blocks are never treated as repeated boilerplate
+SIMHASH_MAX_DISTANCE = int(os.getenv("SIMHASH_MAX_DISTANCE", "6"))        # pages/chunks within this many SimHash bits are duplicates
+
+# Headless browser pool used for JavaScript rendering
+PLAYWRIGHT_POOL_SIZE = int(os.getenv("PLAYWRIGHT_POOL_SIZE", "2"))                # concurrent browsers kept alive
+PLAYWRIGHT_PAGES_PER_BROWSER = int(os.getenv("PLAYWRIGHT_PAGES_PER_BROWSER", "50"))  # recycle a browser after this many pages
+PLAYWRIGHT_WAIT_UNTIL = os.getenv("PLAYWRIGHT_WAIT_UNTIL", "networkidle")          # load | domcontentloaded | networkidle
+PLAYWRIGHT_READY_SELECTOR = os.getenv("PLAYWRIGHT_READY_SELECTOR", "")            # optional CSS selector that marks the page as ready
+PLAYWRIGHT_SETTLE_MS = int(os.getenv("PLAYWRIGHT_SETTLE_MS", "0"))                 # extra wait after readiness, in milliseconds
+PLAYWRIGHT_TIMEOUT_MS = int(os.getenv("PLAYWRIGHT_TIMEOUT_MS", "60000"))           # navigation timeout
+PLAYWRIGHT_BLOCK_RESOURCES = os.getenv("PLAYWRIGHT_BLOCK_RESOURCES", "image,font,media")  # resource types not downloaded
+
+# Persistent page cache (conditional revalidation with ETag / Last-Modified)
+PAGE_STORE_PATH = os.getenv("PAGE_STORE_PATH", ".cache/pages.sqlite3")  # empty string disables the on-disk cache
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", ".cache/snapshots")  # prebuilt site indexes (python -m tools.snapshot); empty disables
+
+# Answer cache for repeated / near-duplicate questions
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))                  # retrieval results kept in memory
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))                   # seconds an answer stays valid
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")                           # SQLite file for persistence (empty = memory only)
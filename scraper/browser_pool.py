@@ -0,0 +1,251 @@
+import atexit
+import queue
+import threading
+from concurrent.futures import Future
+
+from playwright.sync_api import sync_playwright
+
+from config import (
+    PLAYWRIGHT_POOL_SIZE,
+    PLAYWRIGHT_PAGES_PER_BROWSER,
+    PLAYWRIGHT_WAIT_UNTIL,
+    PLAYWRIGHT_READY_SELECTOR,
+    PLAYWRIGHT_SETTLE_MS,
+    PLAYWRIGHT_TIMEOUT_MS,
+    PLAYWRIGHT_BLOCK_RESOURCES,
+)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+LAUNCH_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-accelerated-2d-canvas',
+    '--no-first-run',
+    '--no-zygote',
+    '--disable-gpu',
+    '--disable-blink-features=AutomationControlled'
+]
+
+STEALTH_SCRIPT = """
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined,
+    });
+    delete navigator.__proto__.webdriver;
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => [1, 2, 3, 4, 5],
+    });
+    Object.defineProperty(navigator, 'languages', {
+        get: () => ['en-US', 'en'],
+    });
+    window.chrome = {
+        runtime: {},
+    };
+"""
+
+
+class BrowserPool:
+    """
+    Long-lived pool of headless Chromium browsers for JS rendering.
+
+    Playwright's sync API is bound to the thread that started it, so each browser
+    lives on its own worker thread and callers hand URLs over through a queue.
+    Every worker keeps one context/page open between jobs and relaunches its
+    browser after pages_per_browser renders to keep memory bounded.
+    """
+
+    def __init__(self, size=PLAYWRIGHT_POOL_SIZE, pages_per_browser=PLAYWRIGHT_PAGES_PER_BROWSER,
+                 wait_until=PLAYWRIGHT_WAIT_UNTIL, ready_selector=PLAYWRIGHT_READY_SELECTOR,
+                 settle_ms=PLAYWRIGHT_SETTLE_MS, timeout_ms=PLAYWRIGHT_TIMEOUT_MS,
+                 block_resources=PLAYWRIGHT_BLOCK_RESOURCES):
+        self.size = max(1, size)
+        self.pages_per_browser = max(1, pages_per_browser)
+        self.wait_until = wait_until
+        self.ready_selector = ready_selector
+        self.settle_ms = settle_ms
+        self.timeout_ms = timeout_ms
+        if isinstance(block_resources, str):
+            block_resources = [r.strip() for r in block_resources.split(",") if r.strip()]
+        self.block_resources = frozenset(block_resources)
+        self._jobs = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.pages_rendered = 0
+        self.browsers_launched = 0
+
+    def render(self, url, timeout=None):
+        """Render url in a pooled browser and return the page HTML."""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Browser pool is closed")
+            # Start workers lazily, only when no idle worker is available
+            idle = len(self._workers) - self._busy() - self._jobs.qsize()
+            if len(self._workers) < self.size and idle <= 0:
+                worker = threading.Thread(target=self._worker, name=f"browser-pool-{len(self._workers)}", daemon=True)
+                worker.busy = False
+                self._workers.append(worker)
+                worker.start()
+            # Queued under the lock, so a worker that fails to start either sees this job or
+            # a later render() starts a new one for it
+            self._jobs.put((url, future))
+        if timeout is None:
+            timeout = (self.timeout_ms * 2) / 1000.0
+        return future.result(timeout=timeout)
+
+    def _busy(self):
+        return sum(1 for w in self._workers if getattr(w, "busy", False))
+
+    def _route(self, route):
+        if route.request.resource_type in self.block_resources:
+            route.abort()
+        else:
+            route.continue_()
+
+    def _open_page(self, browser):
+        context = browser.new_context(
+            viewport={'width': 1920, 'height': 1080},
+            user_agent=USER_AGENT,
+            extra_http_headers={
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.9',
+                'Accept-Encoding': 'gzip, deflate, br',
+                'Connection': 'keep-alive',
+            },
+            permissions=['geolocation']
+        )
+        context.add_init_script(STEALTH_SCRIPT)
+        if self.block_resources:
+            context.route("**/*", self._route)
+        return context, context.new_page()
+
+    def _load(self, page, url):
+        goto_wait = "load" if self.wait_until == "networkidle" else self.wait_until
+        page.goto(url, wait_until=goto_wait, timeout=self.timeout_ms)
+        if self.wait_until == "networkidle":
+            try:
+                page.wait_for_load_state('networkidle', timeout=self.timeout_ms // 2)
+            except Exception:
+                # Long-polling pages never go idle; what has loaded so far is usable
+                pass
+        if self.ready_selector:
+            page.wait_for_selector(self.ready_selector, timeout=self.timeout_ms // 2)
+        if self.settle_ms > 0:
+            page.wait_for_timeout(self.settle_ms)
+        return page.content()
+
+    def _worker(self):
+        me = threading.current_thread()
+        try:
+            p = sync_playwright().start()
+        except Exception as e:
+            self._retire(me, RuntimeError(f"Could not start Playwright: {e}"))
+            return
+        try:
+            self._serve(me, p)
+        except Exception as e:
+            self._retire(me, e)
+        finally:
+            try:
+                p.stop()
+            except Exception:
+                pass
+
+    def _retire(self, worker, error):
+        """
+        Drop a worker that cannot serve, so the next render() may start another. If it was
+        the last one, fail the queued renders with error instead of leaving them to time out.
+        """
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            if self._workers:
+                return
+            while True:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None and job[1].set_running_or_notify_cancel():
+                    job[1].set_exception(error)
+
+    def _serve(self, me, p):
+        browser = context = page = None
+        served = 0
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                url, future = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+                me.busy = True
+                try:
+                    if browser is None or served >= self.pages_per_browser:
+                        self._shutdown(browser)
+                        browser = p.chromium.launch(headless=True, args=LAUNCH_ARGS)
+                        context, page = self._open_page(browser)
+                        served = 0
+                        self.browsers_launched += 1
+                    html = self._load(page, url)
+                    served += 1
+                    self.pages_rendered += 1
+                    future.set_result(html)
+                except Exception as e:
+                    future.set_exception(e)
+                    # Never reuse a page left in an unknown state; relaunch only if the browser died
+                    try:
+                        context.close()
+                        context, page = self._open_page(browser)
+                    except Exception:
+                        self._shutdown(browser)
+                        browser = context = page = None
+                finally:
+                    me.busy = False
+        finally:
+            self._shutdown(browser)
+
+    @staticmethod
+    def _shutdown(browser):
+        if browser is None:
+            return
+        try:
+            browser.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers)
+        for _ in workers:
+            self._jobs.put(None)
+        for w in workers:
+            w.join(timeout=10)
+
+    def stats(self):
+        return {
+            "browsers": len(self._workers),
+            "browsers_launched": self.browsers_launched,
+            "pages_rendered": self.pages_rendered,
+            "queued": self._jobs.qsize(),
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """Process-wide browser pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.close)
+        return _pool
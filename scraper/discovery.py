@@ -0,0 +1,210 @@
+import gzip
+import io
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from datetime import datetime, timezone
+from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+from scraper.urls import canonicalize_url, is_probably_html
+
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024  # sitemap protocol limit, uncompressed
+
+# One <url> of a sitemap; lastmod is a Unix timestamp or None, priority defaults to 0.5
+SitemapEntry = namedtuple("SitemapEntry", "url lastmod priority")
+
+
+def parse_lastmod(value):
+    """W3C datetime (2024-05-01, 2024-05-01T10:00:00+02:00, ...Z) as a Unix timestamp, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def decompress_sitemap(body, max_bytes=MAX_SITEMAP_BYTES):
+    """Body of a sitemap, gunzipped when it is gzip data (sitemap.xml.gz), at most max_bytes."""
+    if body[:2] != b"\x1f\x8b":
+        return body[:max_bytes]
+    with gzip.GzipFile(fileobj=io.BytesIO(body)) as f:
+        return f.read(max_bytes)
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_sitemap(body):
+    """
+    Parse a sitemap or sitemap index (gzipped or not).
+    Returns (entries, child sitemap URLs); malformed documents yield what was parsed before the error.
+    """
+    entries, children = [], []
+    fields = {}
+    try:
+        for _, elem in ET.iterparse(io.BytesIO(decompress_sitemap(body)), events=("end",)):
+            name = _local(elem.tag)
+            if name in ("loc", "lastmod", "priority"):
+                fields[name] = (elem.text or "").strip()
+            elif name == "url":
+                if fields.get("loc"):
+                    try:
+                        priority = float(fields.get("priority") or 0.5)
+                    except ValueError:
+                        priority = 0.5
+                    entries.append(SitemapEntry(fields["loc"], parse_lastmod(fields.get("lastmod")), priority))
+                fields = {}
+                elem.clear()
+            elif name == "sitemap":
+                if fields.get("loc"):
+                    children.append(fields["loc"])
+                fields = {}
+                elem.clear()
+    except (ET.ParseError, OSError, EOFError) as e:
+        print(f"Warning: could not fully parse sitemap ({e}).")
+    return entries, children
+
+
+def parse_crawl_delays(text):
+    """Crawl-delay per lowercased user-agent; unlike urllib.robotparser, fractional values are kept."""
+    delays, agents, in_rules = {}, [], False
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if ":" not in line:
+            continue
+        field, value = (part.strip() for part in line.split(":", 1))
+        field = field.lower()
+        if field == "user-agent":
+            if in_rules:
+                agents, in_rules = [], False
+            agents.append(value.lower())
+            continue
+        in_rules = True
+        if field == "crawl-delay":
+            try:
+                delay = float(value)
+            except ValueError:
+                continue
+            for agent in agents:
+                delays[agent] = delay
+    return delays
+
+
+class RobotsPolicy:
+    """robots.txt rules for one host, as seen by user_agent."""
+
+    def __init__(self, text, user_agent):
+        self.user_agent = user_agent
+        self.parser = RobotFileParser()
+        self.parser.parse(text.splitlines())
+        # can_fetch() refuses everything until a fetch time is recorded
+        self.parser.modified()
+        self.delays = parse_crawl_delays(text)
+
+    def can_fetch(self, url):
+        return self.parser.can_fetch(self.user_agent, url)
+
+    @property
+    def crawl_delay(self):
+        """Seconds between requests asked for by the site (Crawl-delay or Request-rate), or None."""
+        # Same matching as RobotFileParser: the agent name is the user agent's first token
+        token = self.user_agent.split("/")[0].lower()
+        agent = next((a for a in self.delays if a != "*" and a in token), "*")
+        delay = self.delays.get(agent)
+        rate = self.parser.request_rate(self.user_agent)
+        if rate is not None and rate.requests:
+            delay = max(delay or 0, rate.seconds / rate.requests)
+        return float(delay) if delay else None
+
+    @property
+    def sitemaps(self):
+        return self.parser.site_maps() or []
+
+
+def load_robots(origin, get, user_agent):
+    """
+    Fetch and parse origin/robots.txt with get(url) -> (status, body).
+    Missing robots.txt allows everything; 401/403 is treated as "disallow all" like most crawlers,
+    and other failures as "allow all".
+    """
+    try:
+        status, body = get(urljoin(origin, "/robots.txt"))
+    except Exception as e:
+        print(f"Warning: could not fetch robots.txt ({e}).")
+        return RobotsPolicy("", user_agent)
+    if status in (401, 403):
+        return RobotsPolicy("User-agent: *\nDisallow: /", user_agent)
+    if status != 200:
+        return RobotsPolicy("", user_agent)
+    return RobotsPolicy(body.decode("utf-8", "replace"), user_agent)
+
+
+def expand_sitemaps(urls, get, max_sitemaps=20):
+    """
+    Fetch sitemaps breadth-first, following sitemap indexes, up to max_sitemaps documents.
+    Returns (entries, sitemap URLs actually read).
+    """
+    entries, read = [], []
+    queue = list(dict.fromkeys(urls))
+    queued = set(queue)
+    while queue and len(read) < max_sitemaps:
+        url = queue.pop(0)
+        try:
+            status, body = get(url)
+        except Exception as e:
+            print(f"Warning: could not fetch sitemap {url} ({e}).")
+            continue
+        if status != 200:
+            continue
+        read.append(url)
+        found, children = parse_sitemap(body)
+        entries.extend(found)
+        for child in children:
+            if child not in queued:
+                queued.add(child)
+                queue.append(child)
+    return entries, read
+
+
+def prioritize(entries, domain, robots=None, skip_non_html=True, limit=None):
+    """
+    Allowed sitemap entries on the canonical host domain, most important first: higher
+    priority, then more recently modified. Entries are kept as listed; of those with the
+    same canonical URL, the first one is kept.
+    """
+    best = {}
+    for entry in entries:
+        if urlparse(entry.url).scheme not in ("http", "https"):
+            continue
+        key = canonicalize_url(entry.url)
+        if urlparse(key).netloc != domain:
+            continue
+        if skip_non_html and not is_probably_html(key):
+            continue
+        if key in best or (robots is not None and not robots.can_fetch(entry.url)):
+            continue
+        best[key] = entry
+    ranked = sorted(best.values(), key=lambda e: (-e.priority, -(e.lastmod or 0)))
+    return ranked[:limit] if limit else ranked
+
+
+def discover_sitemaps(start_url, get, robots=None, max_sitemaps=20, skip_non_html=True, limit=None):
+    """
+    Pages listed in the sitemaps robots.txt declares (or /sitemap.xml), allowed by robots and
+    prioritized by priority and lastmod. Returns (entries, sitemap URLs actually read).
+    """
+    parsed = urlparse(start_url)
+    origin = f"{parsed.scheme}://{parsed.netloc}"
+    sitemap_urls = robots.sitemaps if robots is not None else []
+    if not sitemap_urls:
+        sitemap_urls = [urljoin(origin, "/sitemap.xml")]
+    entries, read = expand_sitemaps(sitemap_urls, get, max_sitemaps)
+    return prioritize(entries, urlparse(canonicalize_url(start_url)).netloc, robots, skip_non_html, limit), read
@@ -0,0 +1,213 @@
+import codecs
+import re
+from collections import namedtuple
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree  # Optional, much faster event parser
+except ImportError:  # pragma: no cover - depends on the environment
+    etree = None
+
+# Never part of the readable text
+NON_TEXT_TAGS = {"script", "style", "noscript", "template", "svg", "iframe"}
+# Site chrome repeated on every page; header/footer only count outside <article>/<main>
+BOILERPLATE_TAGS = {"nav", "aside", "header", "footer"}
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary"}
+BOILERPLATE_MARKERS = re.compile(r"cookie|consent|gdpr|newsletter|share-?buttons|breadcrumb", re.I)
+CONTENT_TAGS = {"article", "main"}
+# Elements that start a new text block
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "body", "dd", "details", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "form", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "li", "main",
+    "ol", "p", "pre", "section", "summary", "table", "tbody", "td", "th", "thead", "tr", "ul", "br",
+}
+# Elements that never have an end tag
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param",
+    "source", "track", "wbr",
+}
+
+BACKEND = "lxml" if etree is not None else "html.parser"
+
+# Visible text (one block per line), raw href values in document order and the <base href>, if any
+Extraction = namedtuple("Extraction", "text links base truncated")
+
+
+def is_boilerplate(name, attrs, in_content=False):
+    """Navigation, banners, sidebars, footers and cookie/consent notices."""
+    if name in ("header", "footer"):
+        if not in_content:
+            return True
+    elif name in BOILERPLATE_TAGS:
+        return True
+    if attrs.get("role") in BOILERPLATE_ROLES:
+        return True
+    classes = attrs.get("class") or ""
+    if not isinstance(classes, str):
+        classes = " ".join(classes)  # BeautifulSoup splits class into a list
+    marker = f"{attrs.get('id') or ''} {classes}".strip()
+    return bool(marker) and BOILERPLATE_MARKERS.search(marker) is not None
+
+
+class TextLinkCollector:
+    """
+    Parser-independent sink for start/end/data events.
+    Builds the text blocks and collects links in the same pass; boilerplate subtrees
+    are skipped for text, but links inside them (menus) are still collected.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.current = []
+        self.links = []
+        self.base = None
+        # Open elements as (tag, skipping, in_content)
+        self.stack = [(None, False, False)]
+
+    def _flush(self):
+        # Data events may split a word wherever the input was fed; tags separate words
+        text = " ".join("".join(self.current).split())
+        if text:
+            self.blocks.append(text)
+        self.current.clear()
+
+    def start(self, tag, attrs):
+        _, skipping, in_content = self.stack[-1]
+        if tag == "a" and attrs.get("href"):
+            self.links.append(attrs["href"])
+        elif tag == "base" and attrs.get("href") and self.base is None:
+            self.base = attrs["href"]
+        if tag in BLOCK_TAGS and not skipping:
+            self._flush()
+        elif self.current:
+            self.current.append(" ")
+        if tag in VOID_TAGS:
+            return
+        skipping = skipping or tag in NON_TEXT_TAGS or is_boilerplate(tag, attrs, in_content)
+        self.stack.append((tag, skipping, in_content or tag in CONTENT_TAGS))
+
+    def end(self, tag):
+        if tag in VOID_TAGS:
+            return
+        # Close the most recent matching element; stray end tags are ignored
+        for pos in range(len(self.stack) - 1, 0, -1):
+            if self.stack[pos][0] == tag:
+                closing = self.stack[pos:]
+                del self.stack[pos:]
+                if any(name in BLOCK_TAGS for name, _, _ in closing):
+                    self._flush()
+                elif self.current:
+                    self.current.append(" ")
+                return
+
+    def data(self, text):
+        if not self.stack[-1][1]:
+            self.current.append(text)
+
+    def close(self, truncated=False):
+        self._flush()
+        return Extraction("\n".join(self.blocks), self.links, self.base, truncated)
+
+
+class _StdlibParser(HTMLParser):
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, {k: v or "" for k, v in attrs})
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+class _LxmlTarget:
+    def __init__(self, collector):
+        self.collector = collector
+
+    def start(self, tag, attrib):
+        if isinstance(tag, str):  # comments and processing instructions are not elements
+            self.collector.start(tag.lower(), dict(attrib))
+
+    def end(self, tag):
+        if isinstance(tag, str):
+            self.collector.end(tag.lower())
+
+    def data(self, data):
+        self.collector.data(data)
+
+    def close(self):
+        return None
+
+
+class StreamExtractor:
+    """
+    Single-pass extraction of visible text and links from HTML fed in pieces.
+    Uses lxml's event parser when installed, else the standard library HTMLParser;
+    no document tree is built, so memory does not grow with the size of the markup.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or BACKEND
+        self.collector = TextLinkCollector()
+        if self.backend == "lxml":
+            self._parser = etree.HTMLParser(target=_LxmlTarget(self.collector), recover=True)
+        else:
+            self._parser = _StdlibParser(self.collector)
+        self._started = False
+
+    def feed(self, text):
+        if text:
+            self._started = True
+            self._parser.feed(text)
+
+    def close(self, truncated=False):
+        if self._started:
+            self._parser.close()
+        return self.collector.close(truncated)
+
+
+def extract(html, backend=None):
+    """Extraction of a complete HTML document (see StreamExtractor)."""
+    extractor = StreamExtractor(backend)
+    extractor.feed(html)
+    return extractor.close()
+
+
+def read_body(response, max_bytes, extractor=None, chunk_size=64 * 1024):
+    """
+    Read a streamed requests response up to max_bytes (0 = no limit), feeding the decoded
+    text to extractor as it arrives. Returns (body bytes, truncated).
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    body = bytearray()
+    truncated = False
+    for chunk in response.iter_content(chunk_size):
+        if max_bytes and len(body) + len(chunk) > max_bytes:
+            chunk = chunk[:max_bytes - len(body)]
+            truncated = True
+        body += chunk
+        if extractor is not None:
+            extractor.feed(decoder.decode(chunk))
+        if truncated:
+            break
+    if extractor is not None:
+        extractor.feed(decoder.decode(b"", final=True))
+    return bytes(body), truncated
+
+
+def decode_body(body, encoding):
+    try:
+        return body.decode(encoding or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
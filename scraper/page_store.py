@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+# One stored page: what the crawler needs to skip re-downloading and re-parsing it
+StoredPage = namedtuple("StoredPage", "url etag last_modified content_hash text links fetched_at")
+
+
+def content_hash(body):
+    """Stable hash of a response body (bytes or str)."""
+    if isinstance(body, str):
+        body = body.encode("utf-8", "replace")
+    return hashlib.sha256(body).hexdigest()
+
+
+class PageStore:
+    """
+    SQLite-backed page cache keyed by canonical URL.
+    - pages: compressed response body, extracted text and links, content hash and
+      HTTP validators (ETag / Last-Modified) for conditional revalidation.
+    - page_chunks: chunks and per-chunk term counts keyed by content hash and chunking
+      parameters, so unchanged pages are never re-chunked or re-tokenized.
+    Safe to share between threads; a single connection is guarded by a lock.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT,"
+                " body BLOB, text TEXT, links TEXT, fetched_at REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS page_chunks ("
+                " content_hash TEXT, params TEXT, chunks TEXT, terms TEXT,"
+                " PRIMARY KEY (content_hash, params))"
+            )
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, etag, last_modified, content_hash, text, links, fetched_at FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        return StoredPage(row[0], row[1], row[2], row[3], row[4], json.loads(row[5] or "[]"), row[6])
+
+    def get_body(self, url):
+        with self._lock:
+            row = self._conn.execute("SELECT body FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return zlib.decompress(row[0])
+
+    def put(self, url, text, links, content_hash, etag=None, last_modified=None, body=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8", "replace")
+        blob = zlib.compress(body) if body is not None else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, body, text, links, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash, blob, text, json.dumps(links), time.time()),
+            )
+
+    def touch(self, url, etag=None, last_modified=None):
+        """Record a successful revalidation, refreshing validators the server sent back."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE pages SET fetched_at = ?, etag = COALESCE(?, etag),"
+                " last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (time.time(), etag, last_modified, url),
+            )
+
+    def delete(self, url):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+
+    def get_chunks(self, content_hash, params):
+        """Chunks and their term counts for a page version, or None if not stored."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chunks, terms FROM page_chunks WHERE content_hash = ? AND params = ?",
+                (content_hash, params),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), json.loads(row[1])
+
+    def put_chunks(self, content_hash, params, chunks, terms):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO page_chunks (content_hash, params, chunks, terms) VALUES (?, ?, ?, ?)",
+                (content_hash, params, json.dumps(chunks), json.dumps(terms)),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_page_store(path):
+    """Process-wide PageStore per database path (None when the path is empty)."""
+    if not path:
+        return None
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = PageStore(path)
+            _stores[path] = store
+        return store
@@ -0,0 +1,65 @@
+import posixpath
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track campaigns/clicks and never change page content
+TRACKING_PARAMS = {
+    "gclid", "dclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "igshid", "ref_src", "spm",
+}
+TRACKING_PREFIXES = ("utm_",)
+
+# Links with these extensions are not HTML pages and are skipped before any request
+NON_HTML_EXTENSIONS = {
+    ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".odt", ".rtf",
+    ".jpg", ".jpeg", ".png", ".gif", ".bmp", ".svg", ".webp", ".ico", ".tif", ".tiff", ".avif",
+    ".mp3", ".mp4", ".m4a", ".wav", ".ogg", ".webm", ".avi", ".mov", ".mkv", ".flv",
+    ".zip", ".tar", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".dmg", ".exe", ".msi", ".apk", ".iso",
+    ".css", ".js", ".json", ".xml", ".rss", ".atom", ".woff", ".woff2", ".ttf", ".eot", ".otf",
+}
+
+
+def canonicalize_url(url):
+    """
+    Canonical form of an absolute http(s) URL used to deduplicate the crawl frontier.
+    - lowercases scheme and host, drops default ports and the fragment
+    - removes tracking parameters (utm_*, gclid, ...) and sorts the remaining query
+    - collapses dot segments, duplicate slashes and the trailing slash, so /docs and
+      /docs/ are one page
+    - keeps the brackets of IPv6 hosts
+    It is a key, not an address: fetch the URL as linked, since relative links on the page
+    resolve against it (/docs/ + intro is /docs/intro, /docs + intro is /intro).
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    # parts.hostname would drop IPv6 brackets; take the host from the netloc instead
+    host = parts.netloc.rpartition("@")[2]
+    host = host[:host.find("]") + 1] if host.startswith("[") else host.partition(":")[0]
+    host = host.lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+
+    path = parts.path or "/"
+    while "//" in path:
+        path = path.replace("//", "/")
+    if path != "/":
+        path = posixpath.normpath(path)
+        if path in (".", ""):
+            path = "/"
+
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)
+    ]
+    query.sort()
+    return urlunsplit((scheme, host, path, urlencode(query, doseq=True), ""))
+
+
+def is_probably_html(url):
+    """False for URLs whose path ends in a known non-HTML file extension."""
+    path = urlsplit(url).path.lower()
+    ext = posixpath.splitext(path)[1]
+    return ext not in NON_HTML_EXTENSIONS
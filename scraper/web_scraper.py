@@ -1,200 +1,398 @@
-import requests
 from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright
+from bs4.element import NavigableString, PreformattedString, Tag
 import re
 import sys
 import time
-from urllib.parse import urljoin, urlparse
-from collections import deque
-
-def get_page_content(url):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-    }
+from urllib.parse import urldefrag, urljoin, urlparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from config import CRAWL_MAX_PAGE_BYTES
+from scraper.browser_pool import get_browser_pool, USER_AGENT
+from scraper.discovery import MAX_SITEMAP_BYTES, discover_sitemaps, load_robots
+from scraper.extract import (
+    BLOCK_TAGS, CONTENT_TAGS, NON_TEXT_TAGS, StreamExtractor, decode_body, extract, is_boilerplate, read_body,
+)
+from scraper.page_store import content_hash
+from scraper.urls import canonicalize_url, is_probably_html
+from utils.http import get_session
+from utils.rate_limit import HostRateLimiter, parse_retry_after
+from utils.tracing import span
+
+RETRY_STATUSES = (429, 503)
+# The page no longer exists; a browser would get the same answer
+GONE_STATUSES = (404, 410)
+MAX_RETRY_AFTER = 120  # seconds; never park a crawl worker longer than this
+
+REQUEST_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+# A fetched page; status is fetched | rendered | not_modified | unchanged | fresh | gone | error
+# (fresh: the sitemap lastmod is older than the stored copy, so no request was made;
+# gone: the server answered 404/410)
+Page = namedtuple("Page", "url text links content_hash status soup")
+
+
+def text_blocks(soup):
+    """
+    Readable text of a page as a list of blocks (paragraphs, list items, headings, cells...).
+    Scripts, styles and boilerplate (see is_boilerplate) are skipped; the soup is not modified,
+    so links in navigation menus can still be followed.
+    """
+    blocks, current = [], []
+
+    def flush():
+        text = " ".join(" ".join(current).split())
+        if text:
+            blocks.append(text)
+        current.clear()
+
+    # Iterative walk; None marks the end of a block element
+    stack = [(child, False) for child in reversed(list(soup.children))]
+    while stack:
+        node, in_content = stack.pop()
+        if node is None:
+            flush()
+        elif isinstance(node, Tag):
+            if node.name in NON_TEXT_TAGS or is_boilerplate(node.name, node.attrs, in_content):
+                continue
+            in_content = in_content or node.name in CONTENT_TAGS
+            if node.name in BLOCK_TAGS:
+                flush()
+                stack.append((None, in_content))
+            stack.extend((child, in_content) for child in reversed(list(node.children)))
+        elif isinstance(node, NavigableString) and not isinstance(node, PreformattedString):
+            current.append(str(node))
+    flush()
+    return blocks
+
+
+def html_to_text(html):
+    """
+    Readable text of an HTML document, one block per line, and its parsed soup.
+    The crawler uses the single-pass scraper.extract instead; this is for callers that want the soup.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    return "\n".join(text_blocks(soup)), soup
+
+
+def render_page(url):
+    """Render url with the shared headless browser pool and return the resulting HTML."""
+    with span("fetch", url=url, method="playwright") as fetch_span:
+        html = get_browser_pool().render(url)
+        fetch_span.set(bytes=len(html))
+        return html
+
+
+def fetch(url, headers, limiter=None, max_retries=3):
+    """
+    GET url, waiting on the per-host rate limiter first.
+    429/503 responses are retried after Retry-After (or an exponential backoff),
+    and the limiter slows the host down for every other worker too.
+    """
+    host = urlparse(url).netloc
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire(host)
+        # Streamed, so the caller can cap how much of the body is read
+        response = get_session("crawler").get(url, headers=headers, timeout=10, stream=True)
+        if response.status_code in RETRY_STATUSES and attempt < max_retries:
+            response.close()
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                retry_after = min(retry_after, MAX_RETRY_AFTER)
+            if limiter is not None:
+                limiter.backoff(host, retry_after)
+            else:
+                time.sleep(retry_after if retry_after is not None else 2 ** attempt)
+            continue
+        if limiter is not None and response.ok:
+            limiter.success(host)
+        return response
+    return response
+
+
+def needs_javascript(text):
+    """Detect pages whose static HTML only asks the visitor to enable JavaScript."""
+    js_required_patterns = [
+        r"enable javascript",
+        r"javascript to run this app",
+        r"you need to enable javascript",
+        r"javascript is disabled"
+    ]
+    lowered = text.lower()
+    return any(re.search(pattern, lowered) for pattern in js_required_patterns)
+
+
+def parse_page(url, html, domain, skip_non_html=True, keep_soup=False):
+    """(text, links, soup) of an HTML document; the soup is only built when keep_soup is set."""
+    if keep_soup:
+        text, soup = html_to_text(html)
+        return text, extract_links(url, soup, domain, skip_non_html), soup
+    result = extract(html)
+    return result.text, filter_links(url, result.links, domain, skip_non_html, result.base), None
+
+
+def fetch_page(url, limiter=None, store=None, domain=None, skip_non_html=True, keep_soup=False,
+               max_bytes=CRAWL_MAX_PAGE_BYTES, executor=None, lastmod=None):
+    """
+    Fetch one page and return a Page with its text and internal links.
+    With a PageStore the request is conditional (If-None-Match / If-Modified-Since);
+    on 304, or when the body hash is unchanged, the stored extraction is reused.
+    The body is read as a stream of at most max_bytes and, for new pages, parsed while it
+    downloads in one pass that yields both text and links (scraper.extract).
+    With a process pool executor the body is downloaded first and parsed in a worker process.
+    lastmod (from a sitemap) lets a stored copy fetched after that time be reused without a request.
+    url is requested as given; the Page and the stored copy are keyed by its canonical form.
+    """
+    key = canonicalize_url(url)
+    if domain is None:
+        domain = urlparse(key).netloc
+    cached = store.get(key) if store is not None else None
+    if cached is not None and lastmod is not None and cached.fetched_at >= lastmod and not keep_soup:
+        return Page(key, cached.text, cached.links, cached.content_hash, "fresh", None)
+    headers = dict(REQUEST_HEADERS)
+    if cached is not None:
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
     soup = None
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        html = response.text
-        soup = BeautifulSoup(html, "html.parser")
-        # Remove scripts and styles for text extraction
-        for script in soup(["script", "style"]):
-            script.decompose()
-        static_text = soup.get_text(separator=" ", strip=True)
-        
-        # Detect if JavaScript is required
-        js_required_patterns = [
-            r"enable javascript",
-            r"javascript to run this app",
-            r"you need to enable javascript",
-            r"javascript is disabled"
-        ]
-        if any(re.search(pattern, static_text.lower()) for pattern in js_required_patterns):
+        with span("fetch", url=url, method="static") as fetch_span:
+            response = fetch(url, headers, limiter)
+            try:
+                # Links resolve against where the page actually is, after any redirect
+                base_url = response.url or url
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                fetch_span.set(status=response.status_code)
+                if response.status_code == 304 and cached is not None:
+                    store.touch(key, etag, last_modified)
+                    return Page(key, cached.text, cached.links, cached.content_hash, "not_modified", None)
+                response.raise_for_status()
+                # A stored copy may turn out unchanged, so only parse while streaming when there is none
+                extractor = StreamExtractor() if cached is None and not keep_soup and executor is None else None
+                body, truncated = read_body(response, max_bytes, extractor)
+                # With an extractor most of the parsing happened during this span
+                fetch_span.set(bytes=len(body), truncated=truncated, streamed_parse=extractor is not None)
+            finally:
+                response.close()
+        if truncated:
+            print(f"Warning: {url} is larger than {max_bytes} bytes; only the first {max_bytes} bytes are used.")
+        body_hash = content_hash(body)
+        if cached is not None and cached.content_hash == body_hash and not keep_soup:
+            store.touch(key, etag, last_modified)
+            return Page(key, cached.text, cached.links, body_hash, "unchanged", None)
+
+        with span("parse", url=url, bytes=len(body), streamed=extractor is not None) as parse_span:
+            if extractor is not None:
+                result = extractor.close(truncated)
+                text = result.text
+                links = filter_links(base_url, result.links, domain, skip_non_html, result.base)
+            elif executor is not None and not keep_soup:
+                html = decode_body(body, response.encoding)
+                text, links, soup = executor.submit(parse_page, base_url, html, domain, skip_non_html).result()
+            else:
+                text, links, soup = parse_page(base_url, decode_body(body, response.encoding), domain, skip_non_html,
+                                               keep_soup)
+            parse_span.set(chars=len(text), links=len(links))
+        status = "fetched"
+        if needs_javascript(text):
             # Fallback to Playwright for JS rendering
             try:
-                with sync_playwright() as p:
-                    browser = p.chromium.launch(
-                        headless=True,
-                        args=[
-                            '--no-sandbox',
-                            '--disable-setuid-sandbox',
-                            '--disable-dev-shm-usage',
-                            '--disable-accelerated-2d-canvas',
-                            '--no-first-run',
-                            '--no-zygote',
-                            '--disable-gpu',
-                            '--disable-blink-features=AutomationControlled'
-                        ]
-                    )
-                    context = browser.new_context(
-                        viewport={'width': 1920, 'height': 1080},
-                        user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                        extra_http_headers={
-                            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-                            'Accept-Language': 'en-US,en;q=0.9',
-                            'Accept-Encoding': 'gzip, deflate, br',
-                            'Connection': 'keep-alive',
-                        },
-                        permissions=['geolocation']
-                    )
-                    page = context.new_page()
-                    page.add_init_script("""
-                        Object.defineProperty(navigator, 'webdriver', {
-                            get: () => undefined,
-                        });
-                        delete navigator.__proto__.webdriver;
-                        Object.defineProperty(navigator, 'plugins', {
-                            get: () => [1, 2, 3, 4, 5],
-                        });
-                        Object.defineProperty(navigator, 'languages', {
-                            get: () => ['en-US', 'en'],
-                        });
-                        window.chrome = {
-                            runtime: {},
-                        };
-                    """)
-                    page.goto(url, wait_until='load', timeout=60000)
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)  # Reduced sleep for efficiency
-                    html = page.content()
-                    soup = BeautifulSoup(html, "html.parser")
-                    # Remove scripts and styles
-                    for script in soup(["script", "style"]):
-                        script.decompose()
-                    text = soup.get_text(separator=" ", strip=True).strip()
-                    browser.close()
-                return text, soup
+                if limiter is not None:
+                    limiter.acquire(urlparse(url).netloc)
+                text, links, soup = parse_page(url, render_page(url), domain, skip_non_html, keep_soup)
+                status = "rendered"
             except Exception as e:
                 print(f"Warning: Could not render JavaScript ({e}). Falling back to static content.")
-                text = static_text
-                return text, soup
-        else:
-            text = static_text
-            return text, soup
+        if store is not None:
+            store.put(key, text, links, body_hash, etag, last_modified, body)
+        return Page(key, text, links, body_hash, status, soup)
     except Exception as e:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+        if status in RETRY_STATUSES:
+            # Still throttled after backing off; a browser would only hit the host harder
+            error_msg = f"Error fetching the website: {e}"
+            print(error_msg)
+            return Page(key, error_msg, [], None, "error", None)
+        if status in GONE_STATUSES:
+            print(f"Error fetching the website: {e}")
+            return Page(key, str(e), [], None, "gone", None)
         # Fallback to Playwright if requests fails
         try:
-            with sync_playwright() as p:
-                browser = p.chromium.launch(
-                    headless=True,
-                    args=[
-                        '--no-sandbox',
-                        '--disable-setuid-sandbox',
-                        '--disable-dev-shm-usage',
-                        '--disable-accelerated-2d-canvas',
-                        '--no-first-run',
-                        '--no-zygote',
-                        '--disable-gpu',
-                        '--disable-blink-features=AutomationControlled'
-                    ]
-                )
-                context = browser.new_context(
-                    viewport={'width': 1920, 'height': 1080},
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    extra_http_headers={
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-                        'Accept-Language': 'en-US,en;q=0.9',
-                        'Accept-Encoding': 'gzip, deflate, br',
-                        'Connection': 'keep-alive',
-                    },
-                    permissions=['geolocation']
-                )
-                page = context.new_page()
-                page.add_init_script("""
-                    Object.defineProperty(navigator, 'webdriver', {
-                        get: () => undefined,
-                    });
-                    delete navigator.__proto__.webdriver;
-                    Object.defineProperty(navigator, 'plugins', {
-                        get: () => [1, 2, 3, 4, 5],
-                    });
-                    Object.defineProperty(navigator, 'languages', {
-                        get: () => ['en-US', 'en'],
-                    });
-                    window.chrome = {
-                        runtime: {},
-                    };
-                """)
-                page.goto(url, wait_until='load', timeout=60000)
-                page.wait_for_load_state('networkidle', timeout=30000)
-                time.sleep(2)  # Reduced sleep
-                html = page.content()
-                soup = BeautifulSoup(html, "html.parser")
-                # Remove scripts and styles
-                for script in soup(["script", "style"]):
-                    script.decompose()
-                text = soup.get_text(separator=" ", strip=True).strip()
-                browser.close()
-            return text, soup
+            if limiter is not None:
+                limiter.acquire(urlparse(url).netloc)
+            text, links, soup = parse_page(url, render_page(url), domain, skip_non_html, keep_soup)
+            return Page(key, text, links, content_hash(text), "rendered", soup)
         except Exception as pw_e:
             error_msg = f"Error fetching the website with both methods: {e} (requests), {pw_e} (Playwright)"
             print(error_msg)
-            return error_msg, None
+            return Page(key, error_msg, [], None, "error", None)
+
+
+def get_page_content(url, limiter=None):
+    """Fetch a single page; returns (text, soup), or (error message, None) on failure."""
+    page = fetch_page(url, limiter=limiter, keep_soup=True)
+    return page.text, page.soup
 
 
-def scrape_website(start_url, max_depth=1, delay=1.0):
+def filter_links(url, hrefs, domain, skip_non_html=True, base=None):
     """
-    Scrapes the starting URL and follows internal links up to max_depth.
-    Returns combined text from all visited pages.
+    Internal http(s) links among raw href values, in document order: absolute URLs without
+    their fragment, as linked (deduplicate them by canonicalize_url).
     """
-    domain = urlparse(start_url).netloc
-    visited = set()
-    to_visit = deque([(start_url, 0)])  # (url, depth)
-    all_text = []
-
-    while to_visit:
-        url, depth = to_visit.popleft()
-        if url in visited or depth > max_depth:
+    if base:
+        url = urljoin(url, base)
+    links = []
+    for href in hrefs:
+        href = href.strip()
+        if href.startswith('#') or href.startswith('javascript:'):
+            continue
+        full_url = urldefrag(urljoin(url, href))[0]
+        if urlparse(full_url).scheme not in ('http', 'https'):
+            continue
+        canonical = canonicalize_url(full_url)
+        if urlparse(canonical).netloc != domain:
+            continue
+        if skip_non_html and not is_probably_html(canonical):
             continue
-        visited.add(url)
+        links.append(full_url)
+    return links
 
-        text, soup = get_page_content(url)
-        if isinstance(text, str) and not text.startswith("Error"):
-            all_text.append(text)
-        else:
-            print(f"Skipping {url} due to error.")
 
-        if depth >= max_depth or soup is None:
-            time.sleep(delay)
-            continue
+def extract_links(url, soup, domain, skip_non_html=True):
+    """Internal http(s) links found on a parsed page, in document order (see filter_links)."""
+    base = soup.find('base', href=True)
+    return filter_links(url, [link['href'] for link in soup.find_all('a', href=True)], domain, skip_non_html,
+                        base['href'] if base is not None else None)
 
-        # Extract internal links
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if href.startswith('#') or href.startswith('javascript:'):
-                continue
-            full_url = urljoin(url, href)
-            parsed_url = urlparse(full_url)
-            if (parsed_url.scheme in ('http', 'https') and
-                parsed_url.netloc == domain and
-                full_url not in visited):
-                to_visit.append((full_url, depth + 1))
 
-        time.sleep(delay)
+def fetch_resource(url, limiter=None, max_bytes=MAX_SITEMAP_BYTES):
+    """GET a non-HTML resource (robots.txt, sitemaps) through the crawler's session; returns (status, body)."""
+    response = fetch(url, dict(REQUEST_HEADERS, Accept='*/*'), limiter)
+    try:
+        body = read_body(response, max_bytes)[0] if response.status_code == 200 else b""
+    finally:
+        response.close()
+    return response.status_code, body
+
+
+def iter_crawl(start_url, max_depth=1, delay=1.0, workers=1, rate=None, burst=None, skip_non_html=True,
+               store=None, progress=None, executor=None, max_pages=None, respect_robots=True,
+               use_sitemaps=True, max_sitemaps=20, on_error=None):
+    """
+    Crawls the starting URL and follows internal links up to max_depth,
+    yielding each successfully fetched page (a Page tuple) as soon as it arrives.
+    - robots.txt is read first (respect_robots): disallowed URLs are never fetched and its
+      Crawl-delay caps the request rate. The site's sitemaps (use_sitemaps) are only read once
+      the start page has been yielded, so the first page never waits on them; the pages they
+      list are crawled next, highest priority and most recent lastmod first.
+    - At most max_pages pages are fetched (None = no limit).
+    - Pages of the same depth are fetched concurrently by `workers` threads.
+    - Requests are paced per host by a token bucket of `rate` requests/second
+      (defaults to one request per `delay` seconds), which backs off on 429/503.
+    - URLs are deduplicated by their canonical form when enqueued, so each page is fetched
+      once, but requested as linked; yielded pages carry the canonical URL.
+    - With a PageStore, pages are revalidated instead of re-downloaded and re-parsed; pages whose
+      sitemap lastmod predates the stored copy are not requested at all.
+    - progress(processed, discovered) is called after every page, including failed ones;
+      on_error(url) is called for each page that could not be fetched, except pages that
+      are gone (404/410), which are skipped like links that were never found.
+    - With a process pool `executor`, pages are parsed in worker processes.
+    - Output order matches a sequential breadth-first crawl.
+    """
+    start_url = urldefrag(start_url.strip())[0]
+    domain = urlparse(canonicalize_url(start_url)).netloc
+    if rate is None:
+        rate = 1.0 / delay if delay > 0 else 0
+    limiter = HostRateLimiter(rate, burst)
 
-    return '\n\n---\n\n'.join(all_text)
+    def get(url):
+        return fetch_resource(url, limiter)
+
+    parsed = urlparse(start_url)
+    robots = load_robots(f"{parsed.scheme}://{parsed.netloc}", get, USER_AGENT) if respect_robots else None
+    if robots is not None and robots.crawl_delay:
+        limiter.cap(domain, 1.0 / robots.crawl_delay)
+    lastmods = {}
+
+    seen = set()  # canonical form of every URL ever considered
+    frontier = []
+    processed = queued = 0
+
+    def enqueue(url, queue):
+        nonlocal queued
+        key = canonicalize_url(url)
+        if key in seen:
+            return
+        seen.add(key)
+        if robots is not None and not robots.can_fetch(url):
+            print(f"Skipping {url}: disallowed by robots.txt.")
+            return
+        if max_pages and queued >= max_pages:
+            return
+        queued += 1
+        queue.append(url)
+
+    enqueue(start_url, frontier)
+
+    def fetch_one(url):
+        return fetch_page(url, limiter=limiter, store=store, domain=domain, skip_non_html=skip_non_html,
+                          executor=executor, lastmod=lastmods.get(canonicalize_url(url)))
+
+    def crawl_batch(pool, batch, depth, next_frontier):
+        nonlocal processed
+        # map() yields in submission order, so results stay in crawl order
+        for page in pool.map(fetch_one, batch):
+            processed += 1
+            if depth < max_depth:
+                # Enqueue each internal link only once
+                for link in page.links:
+                    enqueue(link, next_frontier)
+            if progress is not None:
+                progress(processed, queued)
+            if page.status == "gone":
+                print(f"Skipping {page.url}: not found.")
+            elif page.status != "error":
+                yield page
+            else:
+                print(f"Skipping {page.url} due to error.")
+                if on_error is not None:
+                    on_error(page.url)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for depth in range(max_depth + 1):
+            if not frontier:
+                break
+            next_frontier = []
+            yield from crawl_batch(pool, frontier, depth, next_frontier)
+            if depth == 0 and use_sitemaps:
+                entries, _ = discover_sitemaps(start_url, get, robots, max_sitemaps, skip_non_html, limit=max_pages)
+                lastmods.update((canonicalize_url(entry.url), entry.lastmod)
+                                for entry in entries if entry.lastmod is not None)
+                listed = []
+                for entry in entries:
+                    enqueue(entry.url, listed)
+                yield from crawl_batch(pool, listed, depth, next_frontier)
+            frontier = next_frontier
+
+
+def crawl_site(start_url, max_depth=1, delay=1.0, workers=1, rate=None, burst=None, skip_non_html=True, store=None):
+    """All successfully fetched pages of a crawl, in crawl order (see iter_crawl)."""
+    return list(iter_crawl(start_url, max_depth, delay, workers, rate, burst, skip_non_html, store))
+
+
+def scrape_website(start_url, max_depth=1, delay=1.0, workers=1, rate=None, burst=None, skip_non_html=True, store=None):
+    """
+    Scrapes the starting URL and follows internal links up to max_depth.
+    Returns combined text from all visited pages (see crawl_site for the options).
+    """
+    pages = crawl_site(start_url, max_depth, delay, workers, rate, burst, skip_non_html, store)
+    return '\n\n---\n\n'.join(page.text for page in pages)
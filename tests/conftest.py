@@ -0,0 +1,45 @@
+"""
+Run from the repository root with `python -m pytest` (pytest is not part of requirements.txt).
+Crawl and ingest tests use local HTTP servers (tools.bench.SyntheticSite, tools.mock_gemini).
+"""
+import os
+import sys
+
+import pytest
+
+# The app is run from the repository root (streamlit run app.py), not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests crawl local servers: as fast as they answer, inline, without the page store, snapshots
+# or background re-crawls. Set before the project modules read config.py.
+for _name, _value in {
+    "CRAWL_RATE_PER_HOST": "10000",
+    "CRAWL_BURST": "10000",
+    "CRAWL_DELAY": "0",
+    "CRAWL_MAX_PAGES": "0",
+    "INGEST_PROCESSES": "0",
+    "PAGE_STORE_PATH": "",
+    "SNAPSHOT_DIR": "",
+    "SITE_REFRESH_INTERVAL": "0",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+
+@pytest.fixture
+def mock_gemini_server(request):
+    """(server, base URL) of a local mock Gemini server; settings come from the mock_settings marker."""
+    from tools.mock_gemini import start_in_thread
+
+    marker = request.node.get_closest_marker("mock_settings")
+    settings = dict(token_delay=0.0, words_per_event=2)
+    settings.update(marker.kwargs if marker else {})
+    server, base_url = start_in_thread(port=0, **settings)
+    yield server, base_url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def mock_gemini(mock_gemini_server):
+    """Base URL of a local mock Gemini server."""
+    return mock_gemini_server[1]
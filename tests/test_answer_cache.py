@@ -0,0 +1,40 @@
+from utils.answer_cache import AnswerCache
+
+CONTEXT = "[1] Shipping rates for Canada and Mexico ..."
+
+
+def test_identical_questions_hit():
+    cache = AnswerCache(path="")
+    cache.put("What are the shipping rates to Canada?", CONTEXT, "Canada answer")
+    assert cache.get("what are the shipping rates to canada", CONTEXT) == "Canada answer"
+    assert cache.stats()["hits"] == 1
+
+
+def test_questions_differing_in_one_entity_miss():
+    cache = AnswerCache(path="")
+    cache.put("What are the shipping rates to Canada?", CONTEXT, "Canada answer")
+    assert cache.get("What are the shipping rates to Mexico?", CONTEXT) is None
+    assert cache.get("What are the shipping rates?", CONTEXT) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["near_hits"], stats["misses"]) == (0, 0, 2)
+
+
+def test_plural_forms_are_near_hits():
+    cache = AnswerCache(path="")
+    cache.put("How do I reset my password?", CONTEXT, "Reset answer")
+    assert cache.get("How do I reset my passwords?", CONTEXT) == "Reset answer"
+    assert cache.stats()["near_hits"] == 1
+
+
+def test_answers_are_scoped_to_the_context():
+    cache = AnswerCache(path="")
+    cache.put("What are the shipping rates to Canada?", CONTEXT, "Canada answer")
+    assert cache.get("What are the shipping rates to Canada?", CONTEXT + " changed") is None
+
+
+def test_persisted_answers_survive_a_restart(tmp_path):
+    path = str(tmp_path / "answers.sqlite3")
+    AnswerCache(path=path).put("What are the shipping rates to Canada?", CONTEXT, "Canada answer")
+    cache = AnswerCache(path=path)
+    assert cache.get("What are the shipping rates to Canada?", CONTEXT) == "Canada answer"
+    assert cache.get("What are the shipping rates to Mexico?", CONTEXT) is None
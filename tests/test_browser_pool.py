@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+
+from scraper import browser_pool
+from scraper.browser_pool import BrowserPool
+
+
+def broken_playwright():
+    raise OSError("Executable doesn't exist")
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(browser_pool, "sync_playwright", broken_playwright)
+    pool = BrowserPool(size=2, timeout_ms=60000)
+    yield pool
+    pool.close()
+
+
+def test_render_fails_fast_when_playwright_cannot_start(pool):
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match="Could not start Playwright"):
+        pool.render("http://example.com/")
+    assert time.monotonic() - started < 5
+    # The dead worker is dropped, and the next render tries to start a new one
+    assert pool.stats()["browsers"] == 0
+    with pytest.raises(RuntimeError, match="Could not start Playwright"):
+        pool.render("http://example.com/")
+
+
+def test_queued_renders_fail_with_the_worker(pool):
+    errors = []
+
+    def render():
+        try:
+            pool.render("http://example.com/", timeout=10)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=render) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(15)
+    assert len(errors) == 6
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert pool.stats()["queued"] == 0
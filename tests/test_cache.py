@@ -0,0 +1,37 @@
+import time
+
+from utils.cache import TTLCache
+
+
+def test_get_counts_hits_and_misses():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    assert cache.get("a") == 1 and cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_peek_and_contains_leave_stats_and_order_alone():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.peek("a") == 1 and cache.peek("c", "none") == "none"
+    assert "a" in cache and "c" not in cache
+    assert (cache.hits, cache.misses) == (0, 0)
+    # "a" was not marked as recently used, so it is evicted first
+    cache.set("c", 3)
+    assert "a" not in cache and "b" in cache
+
+
+def test_expired_entries_are_missing():
+    cache = TTLCache(ttl_seconds=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.peek("a") is None and "a" not in cache and cache.get("a") is None
+
+
+def test_get_or_create_builds_once():
+    cache = TTLCache()
+    calls = []
+    for _ in range(3):
+        assert cache.get_or_create("k", lambda: calls.append(1) or "v") == "v"
+    assert len(calls) == 1
@@ -0,0 +1,30 @@
+from utils.corpus import Corpus
+from utils.helpers import chunk_spans, term_counts
+
+
+def add(corpus, url, text):
+    spans = chunk_spans(text, chunk_size_words=4, overlap_words=0)
+    return corpus.add_page(url, text, spans, [term_counts(text[start:end]) for start, end in spans], None)
+
+
+def test_removed_pages_leave_no_live_chunks():
+    corpus = Corpus()
+    first = add(corpus, "http://example.com/a", "Apples are red. Bananas are yellow.")
+    second = add(corpus, "http://example.com/b", "Cherries are dark red.")
+    corpus.freeze()
+    assert corpus.chunk_lengths() == [len("Apples are red."), len("Bananas are yellow."), len("Cherries are dark red.")]
+    corpus.remove_page(first)
+    assert corpus.chunk_lengths() == [len("Cherries are dark red.")]
+    assert "Bananas" not in corpus.select("bananas")
+    corpus.remove_page(second)
+    # What app.py's debug view works from once every page is gone
+    assert corpus.chunk_lengths() == [] and corpus.live_chunks == 0
+
+
+def test_chunk_stats():
+    corpus = Corpus()
+    page = add(corpus, "http://example.com/a", "Apples are red. Bananas are yellow.")
+    corpus.freeze()
+    assert corpus.chunk_stats() == {"chunks": 2, "avg_chars": 17.0, "min_chars": 15, "max_chars": 19}
+    corpus.remove_page(page)
+    assert corpus.chunk_stats() is None
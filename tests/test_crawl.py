@@ -0,0 +1,66 @@
+import pytest
+
+from scraper import web_scraper
+from scraper.web_scraper import iter_crawl
+from tools.bench import SyntheticCorpus, SyntheticSite
+
+PAGES = 6
+
+
+class RecordingSite(SyntheticSite):
+    """A SyntheticSite that records the paths it was asked for, in order; extra maps paths to HTML."""
+
+    def __init__(self, corpus):
+        super().__init__(corpus)
+        self.paths = []
+        self.extra = {}
+
+    def respond(self, path):
+        self.paths.append(path)
+        if path in self.extra:
+            return 200, "text/html; charset=utf-8", self.extra[path]
+        return super().respond(path)
+
+
+@pytest.fixture
+def site(monkeypatch):
+    def no_browser(url):
+        raise RuntimeError("no browser in tests")
+
+    monkeypatch.setattr(web_scraper, "render_page", no_browser)
+    server = RecordingSite(SyntheticCorpus(pages=PAGES, words_per_page=100, seed=5)).start()
+    yield server
+    server.stop()
+
+
+def test_start_page_is_yielded_before_sitemaps_are_read(site):
+    crawl = iter_crawl(site.base_url + "/", max_depth=0, delay=0)
+    first = next(crawl)
+    assert first.url == site.base_url + "/"
+    assert site.paths == ["/robots.txt", "/"]
+    rest = list(crawl)
+    # Sitemap pages are still crawled at depth 0, right after the start page
+    assert site.paths[2] == "/sitemap.xml"
+    assert sorted(page.url for page in rest) == sorted(f"{site.base_url}/page/{i}" for i in range(PAGES))
+
+
+def test_without_sitemaps_only_links_are_followed(site):
+    pages = list(iter_crawl(site.base_url + "/", max_depth=1, delay=0, use_sitemaps=False))
+    assert "/sitemap.xml" not in site.paths
+    assert pages[0].url == site.base_url + "/" and len(pages) > 1
+
+
+def test_directory_urls_are_fetched_once_and_as_linked(site):
+    docs = "<html><body><main><p>Documentation index for the product.</p><a href='intro'>Intro</a></main></body></html>"
+    site.extra = {
+        "/": "<html><body><main><p>Home page of the product.</p>"
+             "<a href='/docs/'>Docs</a> <a href='/docs'>Docs again</a></main></body></html>",
+        "/docs/": docs,
+        "/docs": docs,
+        "/docs/intro": "<html><body><main><p>Introduction to the product.</p></main></body></html>",
+    }
+    pages = list(iter_crawl(site.base_url + "/", max_depth=2, delay=0, use_sitemaps=False))
+    assert site.paths.count("/docs/") == 1 and "/docs" not in site.paths
+    # intro resolves against /docs/, as the page was fetched
+    assert "/docs/intro" in site.paths and "/intro" not in site.paths
+    assert [page.url for page in pages] == [site.base_url + "/", site.base_url + "/docs", site.base_url + "/docs/intro"]
@@ -0,0 +1,56 @@
+import random
+
+from utils.dedup import SIMHASH_BITS, Deduplicator, _hash64, hamming, shingles, simhash
+
+
+def reference_simhash(text):
+    """SimHash computed bit by bit, as defined."""
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles(text):
+        h = _hash64(shingle)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, w in enumerate(weights) if w > 0)
+
+
+def test_simhash_matches_the_bitwise_definition():
+    rng = random.Random(7)
+    words = [f"word{i}" for i in range(500)]
+    texts = ["", "one", "two words", "exactly three words", "Four words, with punctuation!"]
+    texts += [" ".join(rng.choices(words, k=rng.randint(1, 2000))) for _ in range(30)]
+    texts += ["same shingle " * 50]
+    for text in texts:
+        assert simhash(text) == reference_simhash(text)
+
+
+def test_similar_texts_have_close_fingerprints():
+    rng = random.Random(3)
+    words = [f"w{i}" for i in range(2000)]
+    text = " ".join(rng.choices(words, k=800))
+    edited = text.replace(text.split()[400], "changed", 1)
+    other = " ".join(rng.choices(words, k=800))
+    assert hamming(simhash(text), simhash(edited)) <= 6
+    assert hamming(simhash(text), simhash(other)) > 6
+
+
+def test_repeated_blocks_are_claimed_once_and_forgotten():
+    dedup = Deduplicator(min_block_chars=10)
+    banner = "Site-wide announcement banner"
+    text, blocks = dedup.claim_blocks(f"{banner}\nFirst page content here")
+    assert banner in text and len(blocks) == 2
+    text, _ = dedup.claim_blocks(f"{banner}\nSecond page content here")
+    assert text == "Second page content here"
+    dedup.forget(blocks)
+    assert banner in dedup.remove_repeated_blocks(f"{banner}\nThird page content here")
+
+
+def test_copy_is_independent():
+    dedup = Deduplicator()
+    fingerprint = simhash("a page about something in particular, long enough to matter")
+    assert not dedup.is_duplicate_page(fingerprint)
+    copy = dedup.copy()
+    copy.forget(page_fingerprint=fingerprint)
+    assert not copy.is_duplicate_page(fingerprint)
+    assert dedup.is_duplicate_page(fingerprint)
+    assert copy.filter_chunks([0, 2 ** 64 - 1]) == [0, 1]
+    assert dedup.filter_chunks([0, 2 ** 64 - 1]) == [0, 1]
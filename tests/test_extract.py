@@ -0,0 +1,74 @@
+import random
+
+import pytest
+from bs4 import BeautifulSoup
+
+from scraper import extract as extract_module
+from scraper.extract import StreamExtractor, extract
+from scraper.web_scraper import text_blocks
+
+BACKENDS = ["html.parser"] + (["lxml"] if extract_module.etree is not None else [])
+
+HTML = """<!DOCTYPE html>
+<html><head><title>Docs</title><base href="/docs/"><style>p { color: red }</style></head>
+<body>
+<nav><a href="/">Home</a> <a href="/pricing">Pricing</a></nav>
+<div id="cookie-banner">We use cookies &amp; similar tech.</div>
+<main>
+  <h1>Hello world &amp; more</h1>
+  <p>First paragraph with <b>bold</b>text, an <a href="intro.html">inline link</a>and a line<br>break.</p>
+  <ul><li>One</li><li>Two <em>items</em></li></ul>
+  <script>var ignored = "not text";</script>
+  <table><tr><td>Cell&nbsp;A</td><td>Cell B</td></tr></table>
+  <p>Café naïve résumé — long enough to be split in many places.</p>
+</main>
+<footer>(c) Example</footer>
+</body></html>"""
+
+
+def feed_in_pieces(html, sizes, backend):
+    extractor = StreamExtractor(backend)
+    pos = 0
+    for size in sizes:
+        extractor.feed(html[pos:pos + size])
+        pos += size
+    extractor.feed(html[pos:])
+    return extractor.close()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_extract_text_and_links(backend):
+    result = extract(HTML, backend)
+    assert result.text.splitlines() == [
+        "Docs",
+        "Hello world & more",
+        "First paragraph with bold text, an inline link and a line",
+        "break.",
+        "One",
+        "Two items",
+        "Cell A",
+        "Cell B",
+        "Café naïve résumé — long enough to be split in many places.",
+    ]
+    assert result.links == ["/", "/pricing", "intro.html"]
+    assert result.base == "/docs/"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("seed", range(5))
+def test_streamed_extraction_matches_whole_document(backend, seed):
+    expected = extract(HTML, backend)
+    rng = random.Random(seed)
+    sizes = [rng.randint(1, 12) for _ in range(len(HTML))]
+    assert feed_in_pieces(HTML, sizes, backend) == expected
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_one_character_at_a_time(backend):
+    assert feed_in_pieces(HTML, [1] * len(HTML), backend) == extract(HTML, backend)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_matches_text_blocks_of_the_soup(backend):
+    soup = BeautifulSoup(HTML, "html.parser")
+    assert extract(HTML, backend).text == "\n".join(text_blocks(soup))
@@ -0,0 +1,80 @@
+import pytest
+
+from tools.mock_gemini import DEFAULT_ANSWER
+from utils.gemini import (
+    GeminiHTTPError,
+    GeminiStreamError,
+    GeminiTimeout,
+    build_payload,
+    generate,
+    iter_sse,
+    stream_generate,
+)
+from utils.model_client import CircuitBreaker, ModelClient
+
+PAYLOAD = build_payload([{"role": "user", "parts": [{"text": "Hello?"}]}])
+
+
+def test_iter_sse():
+    lines = [": keep-alive", "data: one", "", "event: message", "data: two", "data:  three\r", "", "", "data: four"]
+    assert list(iter_sse(iter(lines))) == ["one", "two\n three", "four"]
+
+
+def test_stream_yields_the_answer_incrementally(mock_gemini):
+    stream = stream_generate(PAYLOAD, timeout=10, base_url=mock_gemini)
+    deltas = list(stream)
+    assert len(deltas) > 1
+    assert "".join(deltas) == stream.text == DEFAULT_ANSWER
+    assert stream.finish_reason == "STOP"
+    assert 0 <= stream.time_to_first_token <= stream.total_time
+
+
+@pytest.mark.mock_settings(fail_after=4)
+def test_error_mid_stream_keeps_the_partial_answer(mock_gemini):
+    stream = stream_generate(PAYLOAD, timeout=10, base_url=mock_gemini)
+    with pytest.raises(GeminiStreamError, match="Mock stream failure"):
+        for _ in stream:
+            pass
+    assert stream.text == " ".join(DEFAULT_ANSWER.split(" ")[:4]) + " "
+    assert stream.total_time is not None
+
+
+@pytest.mark.mock_settings(token_delay=0.2, words_per_event=1)
+def test_stream_that_runs_past_its_deadline_times_out(mock_gemini):
+    stream = stream_generate(PAYLOAD, timeout=0.5, base_url=mock_gemini)
+    with pytest.raises((GeminiTimeout, GeminiStreamError)):
+        for _ in stream:
+            pass
+    assert stream.text and stream.text != DEFAULT_ANSWER
+
+
+def test_model_client_streams_and_frees_its_slot(mock_gemini):
+    client = ModelClient(max_concurrent=1, rate_per_minute=6000, hedge_after=0)
+    for _ in range(2):
+        stream = client.stream_generate(PAYLOAD, timeout=10, base_url=mock_gemini)
+        assert "".join(stream) == DEFAULT_ANSWER
+    assert client.in_flight == 0
+    assert client.counts["requests"] == 2
+
+
+@pytest.mark.mock_settings(overload_rate=1.0)
+def test_model_client_reports_overload_and_opens_the_circuit(mock_gemini):
+    client = ModelClient(max_attempts=1, rate_per_minute=6000, hedge_after=0,
+                         breaker=CircuitBreaker(failure_threshold=2, reset_after=60))
+    for _ in range(2):
+        with pytest.raises(GeminiHTTPError) as e:
+            client.stream_generate(PAYLOAD, timeout=10, base_url=mock_gemini)
+        assert e.value.status_code == 503
+    assert client.breaker.state == "open"
+    assert client.in_flight == 0
+
+
+@pytest.mark.mock_settings(overload_rate=1.0)
+def test_direct_calls_do_not_retry_overloaded_responses(mock_gemini_server):
+    server, base_url = mock_gemini_server
+    # Only utils.model_client retries 429/5xx, with the shared quota and circuit in mind
+    for call in (generate, stream_generate):
+        with pytest.raises(GeminiHTTPError) as e:
+            call(PAYLOAD, timeout=10, base_url=base_url)
+        assert e.value.status_code == 503
+    assert server.stats["requests"] == 2
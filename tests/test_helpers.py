@@ -0,0 +1,69 @@
+from utils.helpers import chunk_spans, coalesce_chunks, select_excerpts
+
+TEXT = "Alpha one two. Beta three four. Gamma five six. Delta seven eight."
+# Four chunks of one sentence each, without overlap
+SPANS = [(0, start, end) for start, end in chunk_spans(TEXT, chunk_size_words=3, overlap_words=0)]
+
+
+def span_text(page, start, end):
+    return TEXT[start:end]
+
+
+class Search:
+    """Minimal index: fixed (chunk id, score) results."""
+
+    def __init__(self, ranked):
+        self.ranked = ranked
+
+    def search(self, question, k=None):
+        return self.ranked[:k]
+
+
+def test_chunk_spans_without_overlap():
+    assert [span_text(*span) for span in SPANS] == [
+        "Alpha one two.", "Beta three four.", "Gamma five six.", "Delta seven eight."]
+
+
+def test_coalesce_merges_overlapping_and_adjacent_chunks():
+    spans = [(0, 0, 10), (0, 5, 20), (0, 30, 40), (1, 0, 10)]
+    assert coalesce_chunks([3, 1, 0, 2], spans) == [([0, 1], 0, 0, 20), ([2], 0, 30, 40), ([3], 1, 0, 10)]
+    assert coalesce_chunks([0, 1], SPANS, span_text) == [([0, 1], 0, 0, SPANS[1][2])]
+
+
+def test_coalesce_keeps_chunks_apart_when_a_dropped_chunk_was_between():
+    # Chunk 1 was dropped as a duplicate: the chunks of ids 0 and 1 are the first and third sentence
+    spans = [SPANS[0], SPANS[2]]
+    assert coalesce_chunks([0, 1], spans, span_text) == [([0], *SPANS[0]), ([1], *SPANS[2])]
+    assert coalesce_chunks([0, 1], spans) == [([0], *SPANS[0]), ([1], *SPANS[2])]
+
+
+def test_select_excerpts_ranks_and_merges():
+    context = select_excerpts("gamma", SPANS, span_text, k=2, index=Search([(2, 1.0), (1, 0.5)]))
+    # The lead chunk is added and, being adjacent, merged into the same excerpt
+    assert context == "Chunks 1-3:\nAlpha one two. Beta three four. Gamma five six.\n"
+
+
+def test_select_excerpts_skips_removed_chunks():
+    context = select_excerpts("x", SPANS, span_text, k=2, index=Search([(3, 1.0)]), removed={0, 1}, lead=2)
+    assert "Alpha" not in context and "Beta" not in context
+    assert "Gamma" in context and "Delta" in context
+
+
+class CountingRemoved(set):
+    """Removed chunk ids that count how often they are checked."""
+
+    checks = 0
+
+    def __contains__(self, i):
+        self.checks += 1
+        return super().__contains__(i)
+
+
+def test_select_excerpts_pads_lazily():
+    spans = [(i, 0, 10) for i in range(10 ** 6)]
+    removed = CountingRemoved({1})
+    context = select_excerpts("x", spans, lambda page, start, end: f"page {page}", k=3,
+                              index=Search([(500, 2.0)]), removed=removed)
+    assert context == "Chunk 501:\npage 500\n\nChunk 1:\npage 0\n\nChunk 3:\npage 2\n"
+    # Padding stopped once k chunks were chosen instead of listing every chunk
+    assert removed.checks < 10
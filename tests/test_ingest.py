@@ -0,0 +1,66 @@
+from scraper.page_store import PageStore
+from scraper.web_scraper import Page
+from utils.ingest import SiteIngest
+
+SHELL_HASH = "hash-of-the-shared-html-shell"
+
+
+def rendered(url, text):
+    return Page(url, text, [], SHELL_HASH, "rendered", None)
+
+
+def test_rendered_pages_sharing_one_shell_keep_their_own_chunks(tmp_path):
+    store = PageStore(str(tmp_path / "pages.sqlite3"))
+    shop = " ".join(["We sell bicycles, helmets and spare parts for every kind of bicycle."] * 20)
+    contact = "Write to us or call the office on weekdays."
+    site = SiteIngest("http://spa.example/", store)
+    site.add_page(rendered("http://spa.example/", shop))
+    site.add_page(rendered("http://spa.example/contact", contact))
+    site.corpus.freeze()
+
+    ids = site.corpus.page_chunks(1)
+    assert [site.chunk_text(i) for i in ids] == [contact]
+    assert {doc for doc, _ in site.index.search("bicycles")} == set(site.corpus.page_chunks(0))
+    # A later crawl reuses each page's own stored chunks
+    again = SiteIngest("http://spa.example/", store)
+    again.add_page(rendered("http://spa.example/contact", contact))
+    assert [again.chunk_text(i) for i in range(again.corpus.num_chunks)] == [contact]
+    store.close()
+
+
+def failing_crawl(pages):
+    def crawl(executor, progress=None, on_error=None):
+        yield from pages
+        raise ConnectionError("connection reset")
+    return crawl
+
+
+def test_crawl_failing_after_some_pages_keeps_them(monkeypatch):
+    site = SiteIngest("http://shop.example/", None)
+    page = Page("http://shop.example/", "We sell bicycles and helmets.", [], "hash", "ok", None)
+    monkeypatch.setattr(site, "_crawl", failing_crawl([page]))
+    site.run()
+    assert site.error is None
+    assert "connection reset" in site.warning
+    assert site.num_chunks == 1 and site.index.search("bicycles")
+
+
+def test_crawl_failing_before_any_page_is_an_error(monkeypatch):
+    site = SiteIngest("http://shop.example/", None)
+    monkeypatch.setattr(site, "_crawl", failing_crawl([]))
+    site.run()
+    assert site.warning is None
+    assert "connection reset" in site.error
+
+
+def test_chunk_stats_once_every_page_is_removed():
+    site = SiteIngest("http://shop.example/", None)
+    for i, text in enumerate(["We sell bicycles and helmets.", "Shipping takes three days."]):
+        site.add_page(Page(f"http://shop.example/{i}", text, [], f"hash-{i}", "ok", None))
+    site.corpus.freeze()
+    assert site.chunk_stats()["chunks"] == 2
+    with site.lock:
+        for page_id in range(site.corpus.num_pages):
+            site.corpus.remove_page(page_id)
+    # What app.py's debug view renders: no sizes, and nothing to divide by zero
+    assert site.chunk_lengths() == [] and site.chunk_stats() is None
@@ -0,0 +1,51 @@
+import math
+
+import pytest
+
+from utils.helpers import term_counts
+from utils.index import InvertedIndex
+
+CHUNKS = [
+    "Refunds are issued within 14 days of the return.",
+    "Shipping is free for orders over 50 dollars.",
+    "Returned items must be unused; refunds exclude shipping.",
+    "Our support team answers questions every weekday.",
+]
+
+
+def test_search_ranks_matching_chunks():
+    index = InvertedIndex.build(CHUNKS)
+    ranked = index.search("refunds for returned items")
+    assert ranked[0][0] == 2
+    assert {doc for doc, _ in ranked} == {0, 2}
+    assert index.search("nothing matches this") == []
+
+
+def test_scores_follow_bm25():
+    index = InvertedIndex.build(CHUNKS, k1=1.2, b=0.75)
+    lengths = [term_counts(chunk)[1] for chunk in CHUNKS]
+    avgdl = sum(lengths) / len(lengths)
+    # "shipping" occurs once in chunks 1 and 2
+    idf = math.log(1.0 + (4 - 2 + 0.5) / (2 + 0.5))
+    expected = {doc: idf * 2.2 / (1 + 1.2 * (0.25 + 0.75 * lengths[doc] / avgdl)) for doc in (1, 2)}
+    assert dict(index.search("shipping")) == pytest.approx(expected)
+
+
+def test_top_k_matches_the_full_ranking():
+    index = InvertedIndex.build(CHUNKS)
+    ranked = index.search("refunds shipping weekday")
+    assert len(ranked) == 4
+    assert index.search("refunds shipping weekday", k=2) == ranked[:2]
+
+
+def test_removed_chunks_match_an_index_built_without_them():
+    index = InvertedIndex.build(CHUNKS)
+    index.remove_term_counts(0, term_counts(CHUNKS[0])[0])
+    rebuilt = InvertedIndex.build(CHUNKS[1:])
+    assert index.num_docs == rebuilt.num_docs == 3
+    assert index.avg_doc_length == pytest.approx(rebuilt.avg_doc_length)
+    for term in ("refunds", "shipping", "days", "support"):
+        assert index.df(term) == rebuilt.df(term)
+        assert index.idf(term) == pytest.approx(rebuilt.idf(term))
+    for query in ("refunds", "shipping refunds", "days of return"):
+        assert [(doc + 1, pytest.approx(score)) for doc, score in rebuilt.search(query)] == index.search(query)
@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+from utils.gemini import GeminiHTTPError
+from utils.model_client import CircuitBreaker, CircuitOpen, ModelClient
+
+RESET_AFTER = 0.05
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = "{}"
+        self.content = b"{}"
+
+    def close(self):
+        pass
+
+
+class ScriptedClient(ModelClient):
+    """Answers each request with the next status in `statuses`; an exception in it is raised."""
+
+    def __init__(self, statuses, **kwargs):
+        kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=2, reset_after=RESET_AFTER))
+        super().__init__(max_attempts=1, hedge_after=0, rate_per_minute=60000, burst=100, **kwargs)
+        self.statuses = list(statuses)
+
+    def _send(self, method, payload, timeout, stream, endpoint_kwargs):
+        status = self.statuses.pop(0)
+        if isinstance(status, BaseException):
+            raise status
+        return FakeResponse(status, {"Retry-After": "0"} if status == 429 else None)
+
+
+def call(client):
+    return client._call("generateContent", {}, 5, False, {})
+
+
+def open_circuit(client):
+    for _ in range(2):
+        with pytest.raises(GeminiHTTPError):
+            call(client)
+    assert client.breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        call(client)
+
+
+def test_breaker_opens_after_consecutive_failures_and_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=2, reset_after=RESET_AFTER)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(RESET_AFTER)
+    assert breaker.allow() and breaker.state == "half_open"
+    # Only one trial call at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0 and breaker.allow()
+
+
+def test_failed_trial_opens_the_circuit_again():
+    client = ScriptedClient([503, 503, 503])
+    open_circuit(client)
+    time.sleep(RESET_AFTER)
+    with pytest.raises(GeminiHTTPError):
+        call(client)
+    assert client.breaker.state == "open"
+    assert client.breaker.opens == 2
+
+
+def test_throttled_trial_does_not_leave_the_circuit_half_open():
+    client = ScriptedClient([503, 503, 429, 200])
+    open_circuit(client)
+    time.sleep(RESET_AFTER)
+    with pytest.raises(GeminiHTTPError) as e:
+        call(client)
+    assert e.value.status_code == 429
+    assert client.breaker.state == "open"
+    # The next call is the trial, right away, and closes the circuit
+    response, release = call(client)
+    release()
+    assert response.status_code == 200
+    assert client.breaker.state == "closed"
+
+
+def test_unexpected_error_in_trial_does_not_leave_the_circuit_half_open():
+    client = ScriptedClient([503, 503, ValueError("bad request body"), 200])
+    open_circuit(client)
+    time.sleep(RESET_AFTER)
+    with pytest.raises(ValueError):
+        call(client)
+    assert client.breaker.state == "open"
+    response, release = call(client)
+    release()
+    assert client.breaker.state == "closed"
+
+
+def test_client_error_counts_as_an_answer():
+    client = ScriptedClient([503, 400])
+    with pytest.raises(GeminiHTTPError):
+        call(client)
+    with pytest.raises(GeminiHTTPError):
+        call(client)
+    assert client.breaker.state == "closed" and client.breaker.failures == 0
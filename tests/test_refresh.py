@@ -0,0 +1,134 @@
+import pytest
+
+from scraper import web_scraper
+from tools.bench import SyntheticCorpus, SyntheticSite
+from utils import ingest
+from utils.corpus import PAGE_SEPARATOR
+from utils.ingest import SiteIngest
+
+PAGES = 10
+NEW_TEXT = ["Zebra quokka marmot refreshed sentence number %d, unlike anything else here." % i for i in range(40)]
+
+
+class MutableSite(SyntheticSite):
+    """A SyntheticSite whose pages can be made to answer with an HTTP error status."""
+
+    def __init__(self, corpus):
+        super().__init__(corpus)
+        self.statuses = {}
+
+    def respond(self, path):
+        if path in self.statuses:
+            return self.statuses[path], "text/plain", "Unavailable"
+        return super().respond(path)
+
+
+@pytest.fixture
+def site(monkeypatch):
+    # A page that fails to fetch would otherwise be retried in a browser
+    def no_browser(url):
+        raise RuntimeError("no browser in tests")
+
+    monkeypatch.setattr(web_scraper, "render_page", no_browser)
+    server = MutableSite(SyntheticCorpus(pages=PAGES, words_per_page=300, seed=3)).start()
+    yield server
+    server.stop()
+
+
+def build(server):
+    site = SiteIngest(server.base_url + "/").run()
+    assert site.error is None
+    return site
+
+
+def page_url(server, i):
+    return f"{server.base_url}/page/{i}"
+
+
+def assert_same_index(site, server):
+    """The refreshed site indexes what a fresh crawl would, though pages may be in another order."""
+    fresh = build(server)
+    assert sorted(site.full_text().split(PAGE_SEPARATOR)) == sorted(fresh.full_text().split(PAGE_SEPARATOR))
+    assert site.num_chunks == fresh.num_chunks
+    assert site.index.avg_doc_length == pytest.approx(fresh.index.avg_doc_length)
+    for question in server.corpus.questions(20) + ["zebra quokka marmot"]:
+        scores = [round(score, 6) for _, score in site.index.search(question, k=5)]
+        assert scores == [round(score, 6) for _, score in fresh.index.search(question, k=5)]
+
+
+def test_refresh_without_changes(site):
+    indexed = build(site)
+    version = indexed.version
+    result = indexed.refresh()
+    # / serves the same page as /page/0
+    assert result == {"pages": PAGES + 1, "changed": 0, "new": 0, "removed": 0, "failed": 0, "indexed": 0}
+    assert indexed.version == version
+    assert indexed.refreshes == 1
+
+
+def test_refresh_applies_changed_and_new_pages(site):
+    indexed = build(site)
+    corpus = site.corpus
+    corpus.pages[4] = NEW_TEXT
+    corpus.titles.append("Brand New Page")
+    corpus.pages.append(["Okapi narwhal axolotl sentence %d on a page added later." % i for i in range(30)])
+    result = indexed.refresh()
+    # Pages that link to their neighbours changed too
+    assert (result["new"], result["removed"]) == (1, 0) and result["changed"] >= 1
+    assert "Zebra quokka marmot" in indexed.select("zebra quokka marmot")
+    assert_same_index(indexed, site)
+
+
+def test_gone_pages_are_removed(site):
+    indexed = build(site)
+    site.statuses["/page/7"] = 404
+    site.statuses["/page/8"] = 410
+    result = indexed.refresh()
+    assert (result["removed"], result["failed"]) == (2, 0)
+    assert page_url(site, 7) not in indexed.pages
+    assert indexed.page_status["removed"] == 2
+    # Still linked and listed in the sitemap, so a fresh crawl tries them too
+    assert_same_index(indexed, site)
+
+
+def test_pages_that_fail_to_fetch_are_kept(site):
+    indexed = build(site)
+    before = indexed.full_text()
+    site.statuses["/page/3"] = 403
+    result = indexed.refresh()
+    assert (result["removed"], result["failed"]) == (0, 1)
+    assert page_url(site, 3) in indexed.pages
+    assert indexed.full_text() == before
+
+
+def test_failed_refresh_changes_nothing(site, monkeypatch):
+    indexed = build(site)
+    dedup, pages, version, text = indexed.dedup, dict(indexed.pages), indexed.version, indexed.full_text()
+    site.corpus.pages[2] = NEW_TEXT
+    site.statuses["/page/5"] = 404
+
+    def broken(*args, **kwargs):
+        raise MemoryError("out of memory")
+
+    analyze_page = ingest.analyze_page
+    monkeypatch.setattr(ingest, "analyze_page", broken)
+    with pytest.raises(MemoryError):
+        indexed.refresh()
+    assert indexed.dedup is dedup
+    assert indexed.pages == pages
+    assert (indexed.version, indexed.full_text()) == (version, text)
+
+    monkeypatch.setattr(ingest, "analyze_page", analyze_page)
+    result = indexed.refresh()
+    assert (result["changed"], result["removed"]) == (1, 1)
+    assert_same_index(indexed, site)
+
+
+def test_rebuild_keeps_the_site_lock(site):
+    indexed = build(site)
+    lock = indexed.lock
+    old_corpus = indexed.corpus
+    result = indexed.rebuild()
+    assert result["rebuilt"] == indexed.corpus.live_pages
+    assert indexed.corpus is not old_corpus
+    assert indexed.lock is lock and indexed.corpus.lock is lock
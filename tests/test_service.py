@@ -0,0 +1,46 @@
+import pytest
+
+from scraper.web_scraper import Page
+from tools.mock_gemini import DEFAULT_ANSWER
+from utils.ingest import SiteIngest
+from utils.model_client import ModelClient
+from utils.service import ChatService
+
+
+@pytest.fixture
+def site():
+    site = SiteIngest("http://shop.example/", None)
+    site.add_page(Page("http://shop.example/", "We sell bicycles and helmets. Shipping takes three days.",
+                       [], "hash", "ok", None))
+    site.corpus.freeze()
+    return site
+
+
+def service(base_url):
+    client = ModelClient(max_concurrent=1, rate_per_minute=6000, hedge_after=0, max_attempts=1)
+    return ChatService(client, stream=True, use_answer_cache=False, timeout=10, base_url=base_url)
+
+
+def test_streamed_answer_reports_every_delta(mock_gemini, site):
+    deltas, prompts = [], []
+    result = service(mock_gemini).answer(site, "How long does shipping take?",
+                                         on_delta=deltas.append, on_prompt=prompts.append)
+    assert result["error"] is None and result["answer"] == DEFAULT_ANSWER
+    assert len(deltas) > 1 and "".join(deltas) == DEFAULT_ANSWER
+    assert "Shipping takes three days" in prompts[0]["context"]
+    assert "first_token_ms" in result["timings"]
+
+
+@pytest.mark.mock_settings(fail_after=4)
+def test_broken_stream_keeps_the_partial_answer(mock_gemini, site):
+    deltas = []
+    result = service(mock_gemini).answer(site, "How long does shipping take?", on_delta=deltas.append)
+    assert result["error_type"] == "GeminiStreamError"
+    assert result["answer"] == "".join(deltas) == " ".join(DEFAULT_ANSWER.split(" ")[:4]) + " "
+
+
+@pytest.mark.mock_settings(overload_rate=1.0)
+def test_http_errors_carry_their_status(mock_gemini, site):
+    result = service(mock_gemini).answer(site, "How long does shipping take?")
+    assert result["answer"] is None
+    assert (result["error_type"], result["status_code"]) == ("GeminiHTTPError", 503)
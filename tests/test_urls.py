@@ -0,0 +1,65 @@
+import pytest
+
+from scraper.urls import canonicalize_url, is_probably_html
+from scraper.web_scraper import filter_links
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTP://Example.COM/Docs", "http://example.com/Docs"),
+    ("http://example.com", "http://example.com/"),
+    ("http://example.com:80/a", "http://example.com/a"),
+    ("https://example.com:443/a", "https://example.com/a"),
+    ("https://example.com:8443/a", "https://example.com:8443/a"),
+    ("http://example.com/a#section", "http://example.com/a"),
+    ("http://example.com/a?utm_source=x&b=2&gclid=1&a=1", "http://example.com/a?a=1&b=2"),
+    ("http://example.com//a//b", "http://example.com/a/b"),
+    ("http://example.com/a/./b/../c", "http://example.com/a/c"),
+    ("http://example.com/docs/", "http://example.com/docs"),
+    ("http://example.com/a/b/..", "http://example.com/a"),
+    ("http://example.com/..", "http://example.com/"),
+    ("http://[::1]:8080/a", "http://[::1]:8080/a"),
+    ("http://[2001:DB8::1]/", "http://[2001:db8::1]/"),
+    ("http://user:pw@example.com/a", "http://example.com/a"),
+])
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url) == expected
+
+
+def test_canonicalize_url_is_idempotent():
+    for url in ("http://example.com/docs/", "http://[::1]:8080/a/b?z=1&a=2", "https://example.com/"):
+        assert canonicalize_url(canonicalize_url(url)) == canonicalize_url(url)
+
+
+def test_is_probably_html():
+    assert is_probably_html("http://example.com/page")
+    assert is_probably_html("http://example.com/page.html")
+    assert not is_probably_html("http://example.com/file.PDF")
+    assert not is_probably_html("http://example.com/img/logo.png?v=2")
+
+
+def test_filter_links_resolves_relative_links_under_a_directory():
+    links = filter_links("http://example.com/docs/", ["intro.html", "../about", "./faq/#top"], "example.com")
+    # Links are kept as linked; only their canonical forms are compared when deduplicating
+    assert links == ["http://example.com/docs/intro.html", "http://example.com/about", "http://example.com/docs/faq/"]
+    assert canonicalize_url(links[2]) == canonicalize_url("http://example.com/docs/faq")
+
+
+def test_filter_links_keeps_internal_html_links_only():
+    hrefs = [
+        "#top", "javascript:void(0)", "mailto:a@example.com",
+        "https://other.com/x", "/report.pdf", "/page?utm_medium=mail", "HTTP://EXAMPLE.COM:80/b",
+    ]
+    assert filter_links("http://example.com/", hrefs, "example.com") == [
+        "http://example.com/page?utm_medium=mail", "http://EXAMPLE.COM:80/b"]
+    assert "http://example.com/report.pdf" in filter_links("http://example.com/", hrefs, "example.com",
+                                                           skip_non_html=False)
+
+
+def test_filter_links_uses_base_href():
+    assert filter_links("http://example.com/a/page", ["c"], "example.com", base="/b/") == ["http://example.com/b/c"]
+
+
+def test_filter_links_on_an_ipv6_host():
+    domain = "[::1]:8080"
+    assert filter_links("http://[::1]:8080/docs/", ["intro", "/x"], domain) == [
+        "http://[::1]:8080/docs/intro", "http://[::1]:8080/x"]
@@ -0,0 +1,119 @@
+"""
+Answer a file of questions about one website, concurrently, without the UI.
+
+    python -m tools.ask https://example.com questions.txt -o answers.jsonl
+    python -m tools.ask https://example.com questions.jsonl --concurrency 32 --rate 600
+    python -m tools.ask https://example.com - < questions.txt
+
+The questions file has one question per line, or one JSON object per line with a
+"question" and optionally an "id" that is copied to the result. The site is crawled and
+indexed once (or loaded from its snapshot) and every question is answered against that
+index; model calls share one ModelClient, so --model-concurrency and --rate bound what
+is sent to Gemini. Results are written as JSONL in input order, each line as soon as it
+and the lines before it are answered: question, answer, error, cached, prompt tokens and
+per-stage timings in ms (retrieval, prompt, first_token with --stream, generation, total).
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, List, TextIO
+
+from config import GEMINI_STREAM, GEMINI_TIMEOUT, MODEL_HEDGE_AFTER, MODEL_MAX_CONCURRENT, MODEL_RATE_PER_MINUTE
+from utils.model_client import ModelClient
+from utils.service import ChatService, ServiceError
+
+
+def read_questions(f: TextIO) -> List[Dict[str, Any]]:
+    """Questions from plain-text or JSONL lines; blank lines and lines starting with # are skipped."""
+    questions = []
+    for line_no, line in enumerate(f, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise SystemExit(f"Line {line_no}: invalid JSON ({e})")
+            if not isinstance(item.get("question"), str) or not item["question"].strip():
+                raise SystemExit(f"Line {line_no}: missing \"question\"")
+            questions.append(item)
+        else:
+            questions.append({"question": line})
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions about a website")
+    parser.add_argument("url", help="website to answer from")
+    parser.add_argument("questions", help="questions file (text or JSONL), - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=8, help="questions answered at once")
+    parser.add_argument("--stream", action="store_true", default=GEMINI_STREAM,
+                        help="use streamGenerateContent (records time to first token)")
+    parser.add_argument("--no-stream", dest="stream", action="store_false")
+    parser.add_argument("--no-answer-cache", dest="answer_cache", action="store_false",
+                        help="always ask the model, even for repeated questions")
+    parser.add_argument("--k", type=int, default=7, help="excerpts retrieved per question")
+    parser.add_argument("--timeout", type=float, default=GEMINI_TIMEOUT, help="Gemini timeout per question (s)")
+    parser.add_argument("--ingest-timeout", type=float, default=None, help="give up if the crawl takes longer (s)")
+    parser.add_argument("--gemini-url", help="Gemini API base URL (e.g. a local tools.mock_gemini)")
+    client_group = parser.add_argument_group("model client (defaults from config.py)")
+    client_group.add_argument("--model-concurrency", type=int, default=MODEL_MAX_CONCURRENT, help="requests in flight")
+    client_group.add_argument("--rate", type=float, default=MODEL_RATE_PER_MINUTE, help="quota in requests/minute")
+    client_group.add_argument("--hedge-after", type=float, default=MODEL_HEDGE_AFTER,
+                              help="seconds before a hedged request")
+    args = parser.parse_args()
+
+    if args.questions == "-":
+        items = read_questions(sys.stdin)
+    else:
+        with open(args.questions, encoding="utf-8") as f:
+            items = read_questions(f)
+    if not items:
+        raise SystemExit("No questions to answer.")
+
+    endpoint_kwargs = {"base_url": args.gemini_url} if args.gemini_url else {}
+    client = ModelClient(max_concurrent=args.model_concurrency, rate_per_minute=args.rate,
+                         hedge_after=args.hedge_after)
+    service = ChatService(client, stream=args.stream, use_answer_cache=args.answer_cache, k=args.k,
+                          timeout=args.timeout, **endpoint_kwargs)
+
+    started = time.perf_counter()
+    try:
+        site = service.load(args.url, timeout=args.ingest_timeout)
+    except ServiceError as e:
+        raise SystemExit(str(e))
+    progress = site.progress()
+    print(f"Indexed {progress['pages_indexed']} pages ({progress['chunks']} chunks) in "
+          f"{time.perf_counter() - started:.1f}s; answering {len(items)} questions, "
+          f"{args.concurrency} at a time", file=sys.stderr)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    answered = failed = 0
+    started = time.perf_counter()
+    try:
+        for result in service.answer_many(site, (item["question"] for item in items), args.concurrency):
+            item = items[result["index"]]
+            if "id" in item:
+                result = dict(id=item["id"], **result)
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            if result["error"]:
+                failed += 1
+            else:
+                answered += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - started
+    print(f"{answered} answered, {failed} failed in {elapsed:.1f}s "
+          f"({60 * len(items) / max(elapsed, 1e-9):.0f} questions/min)", file=sys.stderr)
+    print("Model client: " + ", ".join(f"{k} {v}" for k, v in client.stats().items()), file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,470 @@
+"""
+Benchmarks for chunking, indexing, retrieval and a full crawl of a synthetic site.
+
+    python -m tools.bench                          # run everything, compare with the baseline
+    python -m tools.bench --only retrieval --pages 1000
+    python -m tools.bench --save-baseline          # record the current numbers as the baseline
+
+Corpora are generated from a fixed seed (Zipf-distributed pseudo-words), and the crawl
+benchmark serves them as a multi-page site with robots.txt and a sitemap from a local
+HTTP server, so runs are comparable across machines and commits. Results are compared
+with the saved baseline; metrics worse than --tolerance are flagged and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The synthetic site is local: crawl it as fast as it answers, without the page store, snapshots
+# or background re-crawls.
+# Set before the project modules read config.py; explicit environment variables still win.
+for _name, _value in {
+    "CRAWL_RATE_PER_HOST": "10000",
+    "CRAWL_BURST": "10000",
+    "CRAWL_DELAY": "0",
+    "CRAWL_MAX_PAGES": "0",
+    "PAGE_STORE_PATH": "",
+    "SNAPSHOT_DIR": "",
+    "SITE_REFRESH_INTERVAL": "0",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from config import CHUNK_OVERLAP_WORDS, CHUNK_SIZE, INGEST_PROCESSES  # noqa: E402
+from utils.corpus import Corpus  # noqa: E402
+from utils.helpers import build_idf, chunk_spans, chunk_text_smart, select_excerpts, select_top_chunks  # noqa: E402
+from utils.ingest import SiteIngest, analyze_page  # noqa: E402
+from utils.prompt import build_prompt  # noqa: E402
+
+try:
+    import resource  # Unix only, for peak RSS
+except ImportError:  # pragma: no cover - depends on the platform
+    resource = None
+
+DEFAULT_BASELINE = os.path.join(".cache", "bench", "baseline.json")
+BENCHMARKS = ("chunking", "index", "retrieval", "crawl")
+
+# metric -> (unit, higher is better)
+METRICS = {
+    "chunking.smart_mb_s": ("MB/s", True),
+    "chunking.spans_mb_s": ("MB/s", True),
+    "index.legacy_idf_s": ("s", False),
+    "index.analyze_s": ("s", False),
+    "index.build_s": ("s", False),
+    "index.peak_mb": ("MB", False),
+    "index.corpus_mb": ("MB", False),
+    "retrieval.legacy_p50_ms": ("ms", False),
+    "retrieval.bm25_p50_ms": ("ms", False),
+    "retrieval.bm25_p95_ms": ("ms", False),
+    "retrieval.bm25_p99_ms": ("ms", False),
+    "retrieval.select_p50_ms": ("ms", False),
+    "retrieval.select_p95_ms": ("ms", False),
+    "retrieval.select_p99_ms": ("ms", False),
+    "retrieval.prompt_tokens_mean": ("tokens", False),
+    "retrieval.prompt_tokens_max": ("tokens", False),
+    "crawl.pages_s": ("pages/s", True),
+    "crawl.mb_s": ("MB/s", True),
+    "crawl.seconds": ("s", False),
+    "crawl.peak_rss_mb": ("MB", False),
+}
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of samples (0 < p <= 100)."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# --- Synthetic corpora -------------------------------------------------------------------------
+
+def make_vocabulary(size, rng):
+    consonants, vowels = "bcdfghklmnprstvz", "aeiou"
+    words = set()
+    while len(words) < size:
+        syllables = rng.randint(1, 4)
+        words.add("".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(syllables)))
+    return sorted(words)
+
+
+class SyntheticCorpus:
+    """Deterministic pages of Zipf-distributed pseudo-words, and questions about them."""
+
+    def __init__(self, pages=200, words_per_page=800, vocabulary=5000, seed=1):
+        rng = random.Random(seed)
+        self.words = make_vocabulary(vocabulary, rng)
+        # Zipf weights: a few very common words, a long tail of rare ones
+        self.weights = [1.0 / (rank + 1) for rank in range(vocabulary)]
+        self.titles = []
+        self.pages = []
+        for i in range(pages):
+            self.titles.append(" ".join(rng.choices(self.words[100:], k=3)).title())
+            self.pages.append(self._page(rng, words_per_page))
+        self.seed = seed
+
+    def _sentence(self, rng):
+        words = rng.choices(self.words, weights=self.weights, k=rng.randint(8, 20))
+        return " ".join(words).capitalize() + "."
+
+    def _page(self, rng, words_per_page):
+        paragraphs, count = [], 0
+        while count < words_per_page:
+            paragraph = " ".join(self._sentence(rng) for _ in range(rng.randint(3, 6)))
+            count += len(paragraph.split())
+            paragraphs.append(paragraph)
+        return paragraphs
+
+    def text(self, i):
+        return "\n".join([self.titles[i]] + self.pages[i])
+
+    @property
+    def num_bytes(self):
+        return sum(len(self.text(i).encode("utf-8")) for i in range(len(self.pages)))
+
+    def questions(self, count, seed=2):
+        """Questions made of a few words from a random page, some with words found nowhere."""
+        rng = random.Random(seed)
+        questions = []
+        for n in range(count):
+            words = rng.choice(rng.choice(self.pages)).rstrip(".").split()
+            picked = rng.sample(words, min(len(words), rng.randint(2, 5)))
+            if n % 10 == 9:
+                picked.append("xyzzy")
+            questions.append("What about " + " ".join(w.lower().strip(".") for w in picked) + "?")
+        return questions
+
+
+# --- Synthetic site ----------------------------------------------------------------------------
+
+class SyntheticSite:
+    """
+    Serve a SyntheticCorpus as a site: / and /page/<i> with navigation, a footer and links
+    to neighbouring pages, plus /robots.txt and /sitemap.xml listing every page.
+    """
+
+    def __init__(self, corpus, links_per_page=5):
+        self.corpus = corpus
+        self.links_per_page = links_per_page
+        self.bytes_served = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def page_html(self, i):
+        corpus = self.corpus
+        n = len(corpus.pages)
+        nav = "".join(f'<li><a href="/page/{j}">{corpus.titles[j]}</a></li>' for j in range(min(n, 8)))
+        related = "".join(f'<a href="/page/{(i + k) % n}">{corpus.titles[(i + k) % n]}</a> '
+                          for k in range(1, self.links_per_page + 1))
+        body = "".join(f"<p>{p}</p>" for p in corpus.pages[i])
+        return (f"<!doctype html><html><head><title>{corpus.titles[i]}</title></head><body>"
+                f"<header><nav><ul>{nav}</ul></nav></header>"
+                f"<main><h1>{corpus.titles[i]}</h1>{body}<p>Related: {related}</p></main>"
+                f"<footer>Synthetic site for benchmarks. All rights reserved.</footer></body></html>")
+
+    def sitemap_xml(self):
+        urls = "".join(f"<url><loc>{self.base_url}/page/{i}</loc></url>" for i in range(len(self.corpus.pages)))
+        return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+
+    def respond(self, path):
+        """(status, content type, body) for a request path."""
+        if path == "/robots.txt":
+            return 200, "text/plain", f"User-agent: *\nAllow: /\nSitemap: {self.base_url}/sitemap.xml\n"
+        if path == "/sitemap.xml":
+            return 200, "application/xml", self.sitemap_xml()
+        if path == "/":
+            return 200, "text/html; charset=utf-8", self.page_html(0)
+        if path.startswith("/page/"):
+            try:
+                i = int(path[len("/page/"):])
+            except ValueError:
+                i = -1
+            if 0 <= i < len(self.corpus.pages):
+                return 200, "text/html; charset=utf-8", self.page_html(i)
+        return 404, "text/plain", "Not found"
+
+    def start(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                status, content_type, text = site.respond(self.path.split("?", 1)[0])
+                data = text.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                with site._lock:
+                    site.bytes_served += len(data)
+                    site.requests += 1
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+# --- Benchmarks --------------------------------------------------------------------------------
+
+def bench_chunking(corpus, args):
+    texts = [corpus.text(i) for i in range(len(corpus.pages))]
+    mb = corpus.num_bytes / (1024 * 1024)
+    started = time.perf_counter()
+    for text in texts:
+        chunk_text_smart(text, CHUNK_SIZE, CHUNK_OVERLAP_WORDS)
+    smart = time.perf_counter() - started
+    started = time.perf_counter()
+    for text in texts:
+        chunk_spans(text, CHUNK_SIZE, CHUNK_OVERLAP_WORDS)
+    spans = time.perf_counter() - started
+    return {"chunking.smart_mb_s": mb / smart, "chunking.spans_mb_s": mb / spans}
+
+
+def build_corpus(corpus):
+    """Analyze and index every page like SiteIngest does; returns (Corpus, analyze seconds, build seconds)."""
+    index = Corpus()
+    dense_dim = index.dense.dim if index.dense is not None else 0
+    analyze = build = 0.0
+    for i in range(len(corpus.pages)):
+        text = corpus.text(i)
+        started = time.perf_counter()
+        analysis = analyze_page(text, text, dense_dim=dense_dim)
+        analyze += time.perf_counter() - started
+        started = time.perf_counter()
+        index.add_page(f"/page/{i}", text, analysis.spans, analysis.terms, analysis.vectors)
+        build += time.perf_counter() - started
+    started = time.perf_counter()
+    index.freeze()
+    build += time.perf_counter() - started
+    return index, analyze, build
+
+
+def bench_index(corpus, args):
+    chunks = [c for i in range(len(corpus.pages)) for c in chunk_text_smart(corpus.text(i), CHUNK_SIZE, CHUNK_OVERLAP_WORDS)]
+    started = time.perf_counter()
+    build_idf(chunks)
+    legacy = time.perf_counter() - started
+
+    _, analyze, build = build_corpus(corpus)
+    # Peak Python heap of a second, traced build (tracing slows it down, so it is not timed)
+    tracemalloc.start()
+    index, _, _ = build_corpus(corpus)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "index.legacy_idf_s": legacy,
+        "index.analyze_s": analyze,
+        "index.build_s": build,
+        "index.peak_mb": peak / (1024 * 1024),
+        "index.corpus_mb": index.approx_bytes() / (1024 * 1024),
+    }
+
+
+def _latencies(questions, select):
+    samples = []
+    for question in questions:
+        started = time.perf_counter()
+        select(question)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def bench_retrieval(corpus, args):
+    index, _, _ = build_corpus(corpus)
+    questions = corpus.questions(args.questions)
+    metrics = {}
+
+    # The pre-index path: chunk strings, an IDF dict and a full scan per question (a sample only)
+    chunks = [index.chunk_text(i) for i in range(index.num_chunks)]
+    idf = build_idf(chunks)
+    legacy = _latencies(questions[:max(1, len(questions) // 10)],
+                        lambda q: select_top_chunks(q, chunks, idf, k=7, max_chars=args.max_chars))
+    metrics["retrieval.legacy_p50_ms"] = percentile(legacy, 50)
+
+    bm25 = _latencies(questions, lambda q: select_excerpts(q, index.spans, index.span_text, k=7,
+                                                            max_chars=args.max_chars, index=index.index))
+    selected = _latencies(questions, lambda q: index.select(q, k=7, max_chars=args.max_chars))
+    for name, samples in (("bm25", bm25), ("select", selected)):
+        for p in (50, 95, 99):
+            metrics[f"retrieval.{name}_p{p}_ms"] = percentile(samples, p)
+
+    tokens = [build_prompt(q, lambda budget, measure: index.select(q, k=7, max_chars=budget, measure=measure))["tokens"]["total"]
+              for q in questions]
+    metrics["retrieval.prompt_tokens_mean"] = sum(tokens) / len(tokens)
+    metrics["retrieval.prompt_tokens_max"] = max(tokens)
+    return metrics
+
+
+def bench_crawl(corpus, args):
+    site = SyntheticSite(corpus).start()
+    try:
+        started = time.perf_counter()
+        ingest = SiteIngest(site.base_url + "/", None, processes=args.processes).run()
+        elapsed = time.perf_counter() - started
+    finally:
+        site.stop()
+    if ingest.error:
+        raise RuntimeError(ingest.error)
+    metrics = {
+        "crawl.pages_s": ingest.pages_processed / elapsed,
+        "crawl.mb_s": site.bytes_served / (1024 * 1024) / elapsed,
+        "crawl.seconds": elapsed,
+    }
+    rss = peak_rss_mb()
+    if rss is not None:
+        metrics["crawl.peak_rss_mb"] = rss
+    print(f"  crawled {ingest.pages_processed} pages ({site.requests} requests), "
+          f"indexed {ingest.corpus.num_pages} pages / {ingest.num_chunks} chunks")
+    return metrics
+
+
+RUNNERS = {
+    "chunking": bench_chunking,
+    "index": bench_index,
+    "retrieval": bench_retrieval,
+    "crawl": bench_crawl,
+}
+
+
+# --- Baselines ---------------------------------------------------------------------------------
+
+def run_params(args):
+    """Settings that must match for two runs to be comparable."""
+    return {
+        "pages": args.pages,
+        "words_per_page": args.words_per_page,
+        "vocabulary": args.vocabulary,
+        "questions": args.questions,
+        "max_chars": args.max_chars,
+        "processes": args.processes,
+        "chunk_size": CHUNK_SIZE,
+        "overlap": CHUNK_OVERLAP_WORDS,
+    }
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path, params, metrics):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    data = {
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "params": params,
+        "metrics": metrics,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def compare(metrics, baseline, tolerance):
+    """Rows of (metric, value, unit, baseline value, relative change, regressed)."""
+    rows = []
+    for name, value in metrics.items():
+        unit, higher_is_better = METRICS[name]
+        base = (baseline or {}).get(name)
+        change = regressed = None
+        if base:
+            change = (value - base) / base
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+        rows.append((name, value, unit, base, change, regressed))
+    return rows
+
+
+def print_report(rows):
+    print(f"\n{'metric':34} {'value':>12} {'unit':8} {'baseline':>12} {'change':>8}")
+    for name, value, unit, base, change, regressed in rows:
+        base_text = f"{base:12.3f}" if base is not None else f"{'-':>12}"
+        change_text = f"{change:+8.1%}" if change is not None else f"{'':>8}"
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:34} {value:12.3f} {unit:8} {base_text} {change_text}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunking, indexing, retrieval and crawling")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="benchmark to run (repeatable; default all)")
+    parser.add_argument("--pages", type=int, default=200, help="pages in the synthetic corpus / site")
+    parser.add_argument("--words-per-page", type=int, default=800)
+    parser.add_argument("--vocabulary", type=int, default=5000, help="distinct words in the synthetic language")
+    parser.add_argument("--questions", type=int, default=200, help="questions for the retrieval benchmark")
+    parser.add_argument("--max-chars", type=int, default=4000, help="excerpt budget per question")
+    parser.add_argument("--processes", type=int, default=INGEST_PROCESSES, help="ingest worker processes for the crawl")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help=f"baseline file (default: {DEFAULT_BASELINE})")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown flagged as a regression")
+    parser.add_argument("--json", help="also write this run's metrics to a JSON file")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    corpus = SyntheticCorpus(args.pages, args.words_per_page, args.vocabulary, args.seed)
+    print(f"Synthetic corpus: {args.pages} pages, {corpus.num_bytes / (1024 * 1024):.1f} MB "
+          f"(generated in {time.perf_counter() - started:.1f}s)")
+
+    metrics = {}
+    for name in args.only or BENCHMARKS:
+        print(f"Running {name}...")
+        metrics.update(RUNNERS[name](corpus, args))
+
+    params = run_params(args)
+    baseline = load_baseline(args.baseline)
+    if baseline is not None and baseline.get("params") != params:
+        print(f"Baseline {args.baseline} was recorded with other settings ({baseline.get('params')}); not comparing.")
+        baseline = None
+    rows = compare(metrics, baseline and baseline["metrics"], args.tolerance)
+    print_report(rows)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"params": params, "metrics": metrics}, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        if baseline is not None:
+            metrics = dict(baseline["metrics"], **metrics)
+        save_baseline(args.baseline, params, metrics)
+        print(f"\nSaved baseline to {args.baseline}")
+        return
+    regressions = [row[0] for row in rows if row[5]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Load test: many concurrent chat sessions against a local mock Gemini server and a synthetic site.
+
+    python -m tools.loadtest --sessions 50 --questions 5
+    python -m tools.loadtest --sessions 200 --latency 0.5 --throttle-rate 0.05 --overload-rate 0.02
+    python -m tools.loadtest --url https://example.com --gemini-url http://127.0.0.1:8765/v1beta
+
+Each session runs the app's path headlessly: load_site() and wait_until_ready(), then for
+every question build_prompt() (retrieval included) and a streamed or plain Gemini call,
+keeping the chat history like app.py does. Per-stage latency percentiles, throughput,
+errors, what the mock saw and peak RSS are reported. --client direct bypasses the shared
+model client (utils.model_client) to compare against plain calls: no shared concurrency
+limit, quota, retries or circuit breaker, only the same connect-only transport retries.
+"""
+import argparse
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Also sets the crawl defaults for a local site (no pacing, no page store, no snapshots)
+from tools.bench import SyntheticCorpus, SyntheticSite, peak_rss_mb, percentile
+from tools import mock_gemini
+
+from config import (  # noqa: E402
+    GEMINI_STREAM,
+    MAX_HISTORY_TURNS,
+    MODEL_HEDGE_AFTER,
+    MODEL_MAX_CONCURRENT,
+    MODEL_RATE_PER_MINUTE,
+)
+from utils.answer_cache import answer_cache  # noqa: E402
+from utils import gemini  # noqa: E402
+from utils.gemini import GeminiError, GeminiHTTPError, build_payload  # noqa: E402
+from utils.ingest import load_site  # noqa: E402
+from utils.model_client import ModelClient  # noqa: E402
+from utils.prompt import build_prompt  # noqa: E402
+
+import requests  # noqa: E402
+
+# "failed" is the time until a question that got no answer gave up
+STAGES = ("ingest", "retrieve", "prompt", "first_token", "answer", "question", "failed")
+
+
+class Recorder:
+    """Thread-safe latency samples per stage and outcome counts."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.outcomes = Counter()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    def count(self, outcome):
+        with self.lock:
+            self.outcomes[outcome] += 1
+
+
+def error_kind(error):
+    if isinstance(error, GeminiHTTPError):
+        return f"http_{error.status_code}"
+    return type(error).__name__
+
+
+def ask(site, question, history, recorder, args):
+    """One question through retrieval, prompt assembly and the model, as app.py does it."""
+    started = time.perf_counter()
+    retrieve = []
+
+    def select(budget, measure):
+        t = time.perf_counter()
+        context = site.select(question, k=7, max_chars=budget, measure=measure)
+        retrieve.append(time.perf_counter() - t)
+        return context
+
+    prompt_build = build_prompt(question, select, history[-MAX_HISTORY_TURNS:])
+    built = time.perf_counter()
+    recorder.record("retrieve", sum(retrieve))
+    recorder.record("prompt", built - started - sum(retrieve))
+
+    context, cache_history = prompt_build["context"], prompt_build["history"]
+    if args.answer_cache:
+        cached = answer_cache.get(question, context, cache_history)
+        if cached is not None:
+            recorder.count("cached")
+            recorder.record("question", time.perf_counter() - started)
+            return cached
+
+    payload = build_payload(prompt_build["contents"])
+    try:
+        if args.stream:
+            stream = args.model.stream_generate(payload, timeout=args.timeout, base_url=args.gemini_url)
+            try:
+                for _ in stream:
+                    pass
+            finally:
+                if stream.time_to_first_token is not None:
+                    recorder.record("first_token", stream.time_to_first_token)
+            answer = stream.text
+        else:
+            answer = args.model.generate(payload, timeout=args.timeout, base_url=args.gemini_url)
+    except (GeminiError, requests.exceptions.RequestException) as e:
+        recorder.count(error_kind(e))
+        recorder.record("failed", time.perf_counter() - started)
+        return None
+    finished = time.perf_counter()
+    recorder.record("answer", finished - built)
+    recorder.record("question", finished - started)
+    recorder.count("ok")
+    if args.answer_cache and answer:
+        answer_cache.put(question, context, answer, cache_history, finished - built)
+    return answer
+
+
+def run_session(n, url, questions, recorder, args):
+    rng = random.Random(args.seed + n)
+    time.sleep(args.ramp * n / max(args.sessions, 1))
+    started = time.perf_counter()
+    site = load_site(url)
+    site.wait_until_ready()
+    recorder.record("ingest", time.perf_counter() - started)
+    if site.error:
+        recorder.count("ingest_error")
+        return
+    history = []
+    for _ in range(args.questions):
+        question = rng.choice(questions)
+        history.append({"role": "user", "content": question})
+        answer = ask(site, question, history[:-1], recorder, args)
+        if answer:
+            history.append({"role": "assistant", "content": answer})
+        if args.think:
+            time.sleep(rng.uniform(0, 2 * args.think))
+
+
+def report(recorder, elapsed, args, mock=None, site=None):
+    answered = recorder.outcomes["ok"] + recorder.outcomes["cached"]
+    total = sum(recorder.outcomes.values()) - recorder.outcomes["ingest_error"]
+    print(f"\n{args.sessions} sessions x {args.questions} questions in {elapsed:.1f}s: "
+          f"{answered}/{total} answered, {answered / elapsed:.2f} answers/s")
+    print(f"\n{'stage':12} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for stage in STAGES:
+        samples = recorder.samples.get(stage)
+        if not samples:
+            continue
+        ms = [s * 1000 for s in samples]
+        print(f"{stage:12} {len(ms):7d} {percentile(ms, 50):10.1f} {percentile(ms, 95):10.1f} "
+              f"{percentile(ms, 99):10.1f} {max(ms):10.1f}")
+    print("\nOutcomes: " + ", ".join(f"{k} {v}" for k, v in recorder.outcomes.most_common()))
+    if mock is not None:
+        statuses = ", ".join(f"{k}: {v}" for k, v in sorted(mock.stats.items(), key=str) if k != "requests")
+        print(f"Mock Gemini: {mock.stats['requests']} requests ({statuses}), peak {mock.peak_active} concurrent")
+    if site is not None:
+        print(f"Synthetic site: {site.requests} requests, {site.bytes_served / (1024 * 1024):.1f} MB served")
+    if isinstance(args.model, ModelClient):
+        print("Model client: " + ", ".join(f"{k} {v}" for k, v in args.model.stats().items()))
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"Peak RSS: {rss:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent chat sessions end to end")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent simulated sessions")
+    parser.add_argument("--questions", type=int, default=5, help="questions per session")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between a session's questions (s)")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which sessions start")
+    parser.add_argument("--no-stream", dest="stream", action="store_false", default=GEMINI_STREAM,
+                        help="use generateContent instead of streaming")
+    parser.add_argument("--answer-cache", action="store_true", help="serve repeated questions from the answer cache")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Gemini timeout per question (s)")
+    parser.add_argument("--client", choices=("model", "direct"), default="model",
+                        help="call Gemini through the shared model client or directly")
+    parser.add_argument("--seed", type=int, default=1)
+    client_group = parser.add_argument_group("model client (defaults from config.py)")
+    client_group.add_argument("--concurrency", type=int, default=MODEL_MAX_CONCURRENT, help="requests in flight")
+    client_group.add_argument("--rate", type=float, default=MODEL_RATE_PER_MINUTE, help="quota in requests/minute")
+    client_group.add_argument("--hedge-after", type=float, default=MODEL_HEDGE_AFTER, help="seconds before a hedged request")
+    site_group = parser.add_argument_group("website")
+    site_group.add_argument("--url", help="crawl this site instead of a local synthetic one")
+    site_group.add_argument("--pages", type=int, default=100, help="pages of the synthetic site")
+    site_group.add_argument("--words-per-page", type=int, default=800)
+    model_group = parser.add_argument_group("mock Gemini (ignored with --gemini-url)")
+    model_group.add_argument("--gemini-url", help="use this Gemini base URL instead of starting a mock")
+    model_group.add_argument("--latency", type=float, default=0.2, help="seconds before the first byte")
+    model_group.add_argument("--latency-jitter", type=float, default=0.1)
+    model_group.add_argument("--token-delay", type=float, default=0.02, help="seconds between stream events")
+    model_group.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests with --slow-latency extra")
+    model_group.add_argument("--slow-latency", type=float, default=5.0)
+    model_group.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    model_group.add_argument("--throttle-rate", type=float, default=0.0, help="fraction answered with 429")
+    model_group.add_argument("--overload-rate", type=float, default=0.0, help="fraction answered with 503")
+    model_group.add_argument("--max-concurrent", type=int, default=0, help="429 above this many requests in progress")
+    model_group.add_argument("--retry-after", type=int, default=None, help="Retry-After seconds sent with 429/503")
+    args = parser.parse_args()
+
+    corpus = SyntheticCorpus(args.pages, args.words_per_page, seed=args.seed)
+    site = None
+    url = args.url
+    if url is None:
+        site = SyntheticSite(corpus).start()
+        url = site.base_url + "/"
+    mock = None
+    if args.gemini_url is None:
+        mock, args.gemini_url = mock_gemini.start_in_thread(
+            port=0, latency=args.latency, latency_jitter=args.latency_jitter, token_delay=args.token_delay,
+            slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+            error_rate=args.error_rate, throttle_rate=args.throttle_rate, overload_rate=args.overload_rate,
+            max_concurrent=args.max_concurrent, retry_after=args.retry_after, seed=args.seed)
+    # utils.gemini has the same two calls, without the shared limits
+    if args.client == "model":
+        args.model = ModelClient(max_concurrent=args.concurrency, rate_per_minute=args.rate, hedge_after=args.hedge_after)
+    else:
+        args.model = gemini
+    questions = corpus.questions(max(50, args.questions * 10), seed=args.seed)
+    print(f"Load test: {args.sessions} sessions against {url}, model at {args.gemini_url}")
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.sessions, thread_name_prefix="session") as pool:
+            futures = [pool.submit(run_session, n, url, questions, recorder, args) for n in range(args.sessions)]
+            for future in futures:
+                future.result()
+    finally:
+        elapsed = time.perf_counter() - started
+        if site is not None:
+            site.stop()
+        if mock is not None:
+            mock.shutdown()
+    report(recorder, elapsed, args, mock, site)
+
+
+if __name__ == "__main__":
+    main()
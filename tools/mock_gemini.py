@@ -0,0 +1,226 @@
+"""
+Local stand-in for the Gemini REST API.
+
+Serves :generateContent (one JSON body) and :streamGenerateContent?alt=sse
+(chunked server-sent events, one event per few words). Point the app at it with
+
+    GEMINI_BASE_URL=http://127.0.0.1:8765/v1beta streamlit run app.py
+
+and start it with
+
+    python -m tools.mock_gemini --port 8765 --token-delay 0.05
+
+For load tests it can inject failures: --error-rate (500), --throttle-rate (429),
+--overload-rate (503), each a fraction of requests, and --max-concurrent, above which
+requests are refused with 429 like an exhausted quota. --slow-rate makes that fraction of
+requests wait --slow-latency extra seconds, a latency tail for testing hedged requests.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = (
+    "This is a mock answer generated from the provided website snippets. "
+    "It streams a few words at a time so clients can render tokens incrementally."
+)
+
+# status -> (Gemini error status, message) for injected failures
+FAULTS = {
+    429: ("RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota)."),
+    500: ("INTERNAL", "An internal error has occurred."),
+    503: ("UNAVAILABLE", "The model is overloaded. Please try again later."),
+}
+
+PATH_RE = re.compile(r"^/v1beta/models/(?P<model>[^:/]+):(?P<method>generateContent|streamGenerateContent)")
+
+
+def response_event(text, finish_reason=None):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    return {"candidates": [candidate]}
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set on the server instance by make_server()
+    settings = None
+
+    def log_message(self, format, *args):
+        if self.server.settings.get("verbose"):
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_fault(self, status):
+        code, message = FAULTS[status]
+        retry_after = self.server.settings["retry_after"]
+        headers = [("Retry-After", str(retry_after))] if retry_after is not None and status in (429, 503) else []
+        self._send_json(status, {"error": {"code": status, "message": message, "status": code}}, headers)
+
+    def _pick_fault(self, active):
+        """Status of the failure to inject for this request, or None to answer normally."""
+        settings = self.server.settings
+        if settings["max_concurrent"] and active > settings["max_concurrent"]:
+            return 429
+        with self.server.lock:
+            roll = self.server.random.random()
+        for status, rate in ((429, settings["throttle_rate"]), (503, settings["overload_rate"]),
+                             (500, settings["error_rate"])):
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        settings = self.server.settings
+        match = PATH_RE.match(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        if not match:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+            return
+
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.stats["requests"] += 1
+            server.peak_active = max(server.peak_active, server.active)
+            active = server.active
+        try:
+            fault = self._pick_fault(active)
+            with server.lock:
+                server.stats[fault or 200] += 1
+            if fault:
+                self._send_fault(fault)
+                return
+            self._respond(match, settings)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up, e.g. the losing request of a hedged pair
+            self.close_connection = True
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _respond(self, match, settings):
+        with self.server.lock:
+            jitter = self.server.random.uniform(0, settings["latency_jitter"])
+            if self.server.random.random() < settings["slow_rate"]:
+                jitter += settings["slow_latency"]
+        time.sleep(settings["latency"] + jitter)
+        words = settings["answer"].split(" ")
+        if match.group("method") == "generateContent":
+            time.sleep(settings["token_delay"] * len(words))
+            self._send_json(200, response_event(settings["answer"], "STOP"))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = max(1, settings["words_per_event"])
+        for i in range(0, len(words), step):
+            piece = " ".join(words[i:i + step]) + (" " if i + step < len(words) else "")
+            done = i + step >= len(words)
+            if settings["fail_after"] is not None and i >= settings["fail_after"]:
+                error = {"error": {"code": 500, "message": "Mock stream failure", "status": "INTERNAL"}}
+                self._write_chunk(f"data: {json.dumps(error)}\r\n\r\n".encode("utf-8"))
+                break
+            event = response_event(piece, "STOP" if done else None)
+            self._write_chunk(f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8"))
+            time.sleep(settings["token_delay"])
+        self._write_chunk(b"")  # terminating zero-length chunk
+
+
+def make_server(host="127.0.0.1", port=8765, **settings):
+    """Create (but do not start) a mock server; port 0 picks a free port."""
+    defaults = {
+        "latency": 0.0,
+        "token_delay": 0.05,
+        "words_per_event": 3,
+        "answer": DEFAULT_ANSWER,
+        "fail_after": None,
+        "latency_jitter": 0.0,
+        "slow_rate": 0.0,
+        "slow_latency": 5.0,
+        "error_rate": 0.0,
+        "throttle_rate": 0.0,
+        "overload_rate": 0.0,
+        "max_concurrent": 0,
+        "retry_after": None,
+        "seed": None,
+        "verbose": False,
+    }
+    defaults.update(settings)
+    server = ThreadingHTTPServer((host, port), MockGeminiHandler)
+    server.daemon_threads = True
+    server.settings = defaults
+    server.lock = threading.Lock()
+    server.random = random.Random(defaults["seed"])
+    # Requests seen and responses by status; active/peak_active count requests in progress
+    server.stats = Counter()
+    server.active = 0
+    server.peak_active = 0
+    return server
+
+
+def start_in_thread(**kwargs):
+    """Start a mock server on a background thread; returns (server, base_url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1beta"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Gemini generateContent / streamGenerateContent server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first byte")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="seconds between stream events")
+    parser.add_argument("--words-per-event", type=int, default=3)
+    parser.add_argument("--fail-after", type=int, default=None, help="emit a stream error after this many words")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="extra random latency, up to this many seconds")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="extra seconds for slow requests")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--overload-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="answer 429 above this many requests in progress")
+    parser.add_argument("--retry-after", type=int, default=None, help="Retry-After seconds sent with 429/503")
+    parser.add_argument("--seed", type=int, default=None, help="seed for injected latency and failures")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, latency=args.latency, token_delay=args.token_delay,
+                         words_per_event=args.words_per_event, fail_after=args.fail_after,
+                         latency_jitter=args.latency_jitter, slow_rate=args.slow_rate,
+                         slow_latency=args.slow_latency, error_rate=args.error_rate,
+                         throttle_rate=args.throttle_rate, overload_rate=args.overload_rate,
+                         max_concurrent=args.max_concurrent, retry_after=args.retry_after, seed=args.seed,
+                         verbose=args.verbose)
+    print(f"Mock Gemini listening on http://{args.host}:{server.server_address[1]}/v1beta")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Build site snapshots offline so the app opens them instantly instead of crawling.
+
+    python -m tools.snapshot build https://example.com https://example.org
+    python -m tools.snapshot info https://example.com
+
+Snapshots are written to SNAPSHOT_DIR (default .cache/snapshots), where load_site()
+looks for them; crawl and chunking settings come from config.py / the environment.
+"""
+import argparse
+import os
+import sys
+import time
+
+from config import PAGE_STORE_PATH, SNAPSHOT_DIR
+from scraper.page_store import get_page_store
+from utils.ingest import build_site
+from utils.snapshot import load_snapshot, save_snapshot, snapshot_path
+
+
+def build(url, directory):
+    started = time.time()
+    site = build_site(url, get_page_store(PAGE_STORE_PATH))
+    if site.error or site.warning:
+        print(f"{url}: {site.error or site.warning}", file=sys.stderr)
+        return False
+    path = save_snapshot(site.corpus, url, snapshot_path(url, directory), meta=site.snapshot_meta())
+    print(f"{url}: {site.corpus.num_pages} pages, {site.num_chunks} chunks, "
+          f"{site.index.vocabulary_size} terms in {time.time() - started:.1f}s -> {path} "
+          f"({os.path.getsize(path) / 1024:.0f} KiB)")
+    return True
+
+
+def info(url, directory):
+    path = snapshot_path(url, directory)
+    if not os.path.exists(path):
+        print(f"{url}: no snapshot at {path}", file=sys.stderr)
+        return False
+    started = time.perf_counter()
+    snapshot = load_snapshot(path)
+    opened = time.perf_counter() - started
+    corpus = snapshot.corpus
+    print(f"{url}: {path}")
+    print(f"  built {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.created_at))}, "
+          f"opened in {opened * 1000:.1f} ms")
+    print(f"  {corpus.num_pages} pages, {corpus.num_chunks} chunks, {corpus.num_chars} characters, "
+          f"{corpus.index.vocabulary_size} terms")
+    if corpus.dense is not None:
+        print(f"  dense vectors: {corpus.dense.size} x {corpus.dense.dim}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and inspect site index snapshots")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="snapshot directory (default: SNAPSHOT_DIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="crawl, index and snapshot sites")
+    build_parser.add_argument("urls", nargs="+")
+    info_parser = commands.add_parser("info", help="show the snapshot of sites")
+    info_parser.add_argument("urls", nargs="+")
+    args = parser.parse_args()
+    command = build if args.command == "build" else info
+    ok = all([command(url, args.dir) for url in args.urls])
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_PATH
+from utils.cache import TTLCache
+from utils.helpers import tokenize
+from utils.tracing import current_span, metrics
+
+# Answers kept per retrieval result; near-duplicate questions are compared against these
+MAX_ANSWERS_PER_CONTEXT = 8
+
+
+def _digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8", "replace"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _fold(token: str) -> str:
+    """Singular form of a plural token; anything else is returned as is."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def _folded(tokens: FrozenSet[str]) -> FrozenSet[str]:
+    return frozenset(_fold(t) for t in tokens)
+
+
+class AnswerCache:
+    """
+    Cache of generated answers keyed by what the model actually saw.
+    - The context key is a digest of the selected snippets (chunk ids and their text, so it
+      changes whenever the corpus does) plus the conversation history sent with them.
+    - Within a context, a question hits if its normalized tokens (utils.helpers.tokenize,
+      which drops stopwords) are identical to a cached question's, and near-hits if they
+      only differ in plural forms. A question differing in any content token ("Canada"
+      vs "Mexico") always misses, however many other tokens it shares.
+    - Bounded by entries and TTL; optionally persisted to SQLite so restarts keep answers.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL,
+                 path: str = ANSWER_CACHE_PATH):
+        self.ttl_seconds = ttl_seconds
+        self._memory = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    " context_key TEXT, tokens TEXT, answer TEXT, latency REAL, created_at REAL,"
+                    " PRIMARY KEY (context_key, tokens))"
+                )
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def context_key(context: str, history: Sequence[Dict[str, str]] = ()) -> str:
+        history_text = json.dumps([[m.get("role"), m.get("content")] for m in history])
+        return _digest(context, history_text)
+
+    @staticmethod
+    def question_tokens(question: str) -> FrozenSet[str]:
+        return frozenset(tokenize(question))
+
+    def _entries(self, key: str) -> List[Tuple[FrozenSet[str], str, float]]:
+        entries = self._memory.get(key)
+        if entries is not None or self._conn is None:
+            return entries or []
+        cutoff = time.time() - self.ttl_seconds if self.ttl_seconds > 0 else 0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT tokens, answer, latency FROM answers WHERE context_key = ? AND created_at >= ?",
+                (key, cutoff),
+            ).fetchall()
+        entries = [(frozenset(json.loads(t)), a, l or 0.0) for t, a, l in rows][-MAX_ANSWERS_PER_CONTEXT:]
+        if entries:
+            self._memory.set(key, entries)
+        return entries
+
+    def get(self, question: str, context: str, history: Sequence[Dict[str, str]] = ()) -> Optional[str]:
+        """Cached answer for this question and retrieval result, or None."""
+        tokens = self.question_tokens(question)
+        if not tokens:
+            return None
+        key = self.context_key(context, history)
+        folded = _folded(tokens)
+        best = None
+        result = "miss"
+        for cached_tokens, answer, latency in self._entries(key):
+            if cached_tokens == tokens:
+                best, result = (answer, latency), "hit"
+                break
+            if best is None and _folded(cached_tokens) == folded:
+                best, result = (answer, latency), "near_hit"
+        with self._lock:
+            if result == "hit":
+                self.hits += 1
+            elif result == "near_hit":
+                self.near_hits += 1
+            else:
+                self.misses += 1
+            if best is not None:
+                self.saved_seconds += best[1]
+        metrics.inc("answer_cache_lookups_total", result=result)
+        parent = current_span()
+        if parent is not None:
+            parent.set(cache_hit=result != "miss")
+        return best[0] if result != "miss" else None
+
+    def put(self, question: str, context: str, answer: str, history: Sequence[Dict[str, str]] = (),
+            latency: float = 0.0) -> None:
+        tokens = self.question_tokens(question)
+        if not tokens or not answer:
+            return
+        key = self.context_key(context, history)
+        entries = [e for e in self._entries(key) if e[0] != tokens]
+        entries.append((tokens, answer, latency))
+        self._memory.set(key, entries[-MAX_ANSWERS_PER_CONTEXT:])
+        if self._conn is not None:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers (context_key, tokens, answer, latency, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, json.dumps(sorted(tokens)), answer, latency, time.time()),
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "contexts": len(self._memory),
+            }
+
+
+# Shared by every session in the process
+answer_cache = AnswerCache()
+metrics.describe("answer_cache_lookups_total", "Answer cache lookups by result (hit, near_hit, miss).")
@@ -0,0 +1,173 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from scraper.urls import canonicalize_url
+from config import SITE_CACHE_TTL, SITE_CACHE_MAX_ENTRIES, SITE_CACHE_MAX_MB
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a user-entered start URL so equivalent inputs share a cache entry."""
+    url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    return canonicalize_url(url)
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """Approximate the memory footprint of a cached value in bytes."""
+    approx = getattr(value, "approx_bytes", None)
+    if callable(approx):
+        return approx()
+    if _depth > 4:
+        return sys.getsizeof(value)
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v, _depth + 1) for v in value)
+    return sys.getsizeof(value)
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL and an approximate memory cap.
+    - Entries older than ttl_seconds are treated as missing.
+    - The least recently used entries are evicted once max_entries or max_bytes is exceeded.
+    - get_or_create() runs the factory once per key even when several sessions ask at the same time.
+    """
+
+    def __init__(self, max_entries: int = 16, ttl_seconds: float = 3600, max_bytes: int = 0,
+                 sizeof: Callable[[Any], int] = estimate_size):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and (time.time() - stored_at) > self.ttl_seconds
+
+    def _drop(self, key: Hashable) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, stored_at, _ = entry
+            if self._expired(stored_at):
+                self._drop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """get() without counting a hit or miss or refreshing the entry's LRU position."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry[1]):
+                return default
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        if size is None:
+            size = self._sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, time.time(), size)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._data and (
+            (self.max_entries > 0 and len(self._data) > self.max_entries)
+            or (self.max_bytes > 0 and self._bytes > self.max_bytes and len(self._data) > 1)
+        ):
+            oldest = next(iter(self._data))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any],
+                      cache_if: Callable[[Any], bool] = lambda v: True) -> Any:
+        """Return the cached value for key, building it with factory() on a miss (single-flight)."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another session may have built it while we waited
+            with self._lock:
+                entry = self._data.get(key)
+                if entry is not None and not self._expired(entry[1]):
+                    self._data.move_to_end(key)
+                    return entry[0]
+            value = factory()
+            if cache_if(value):
+                self.set(key, value)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry[1])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_MISSING = object()
+
+# Process-wide cache of scraped sites; Streamlit imports this module once, so every
+# session and rerun in the process shares the same instance.
+site_cache = TTLCache(
+    max_entries=SITE_CACHE_MAX_ENTRIES,
+    ttl_seconds=SITE_CACHE_TTL,
+    max_bytes=SITE_CACHE_MAX_MB * 1024 * 1024,
+)
+
+
+def site_cache_key(url: str, **params: Any) -> Tuple:
+    """Cache key for a site: normalized start URL plus the crawl/chunking parameters."""
+    return (normalize_url(url),) + tuple(sorted(params.items()))
@@ -0,0 +1,238 @@
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from utils.dense import DenseIndex, HybridRetriever, dense_enabled, embed_many
+from utils.helpers import select_excerpts, term_counts
+from utils.index import InvertedIndex
+from utils.tracing import span
+
+PAGE_SEPARATOR = "\n\n---\n\n"
+
+
+class ChunkSpans:
+    """Read-only sequence of (page, start, end) chunk spans backed by three arrays."""
+
+    def __init__(self, pages: array, starts: array, ends: array):
+        self.pages = pages
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __getitem__(self, i: int) -> Tuple[int, int, int]:
+        return self.pages[i], self.starts[i], self.ends[i]
+
+    def __iter__(self):
+        return zip(self.pages, self.starts, self.ends)
+
+
+class Corpus:
+    """
+    Text and index of one site, shared by reference by every session that uses the site.
+    - Page texts live in one buffer, separated by PAGE_SEPARATOR; page_starts holds each
+      page's offset, so the full-content view is the buffer itself and is never copied.
+    - Chunks are (page, start, end) offsets in parallel arrays, not strings.
+    - While pages are still being added they are kept as separate strings (appending to
+      one str would copy it every time); freeze() joins them once and makes the corpus immutable.
+    - With dense retrieval enabled (utils.dense), chunk vectors are kept alongside the
+      postings and select() ranks chunks with both.
+    - remove_page() takes a page out of retrieval without touching other ids: its chunks are
+      tombstoned in the index and skipped by select(). To add pages after freeze(), thaw()
+      first; that also drops the text of removed pages.
+    """
+
+    def __init__(self, index: Optional[InvertedIndex] = None, dense: Optional[DenseIndex] = None):
+        self.lock = threading.RLock()
+        self.index = index if index is not None else InvertedIndex()
+        if dense is None and index is None and dense_enabled():
+            dense = DenseIndex()
+        self.dense = dense
+        self.urls: List[str] = []
+        self.page_starts = array("q")
+        self.chunk_pages = array("I")
+        self.chunk_starts = array("I")
+        self.chunk_ends = array("I")
+        self.spans = ChunkSpans(self.chunk_pages, self.chunk_starts, self.chunk_ends)
+        self._parts: Optional[List[str]] = []
+        self._text: Optional[str] = None
+        self._length = 0
+        self.deleted_pages: Set[int] = set()
+        self.deleted_chunks: Set[int] = set()
+        # Chunk that leads every context: the first of the start page
+        self.lead_chunk = 0
+
+    @property
+    def frozen(self) -> bool:
+        return self._text is not None
+
+    def add_page(self, url: str, text: str, spans: Sequence[Tuple[int, int]],
+                 terms: Iterable[Tuple[Dict[str, int], int]], vectors=None) -> int:
+        """
+        Append a page with its chunk spans and per-chunk term counts; returns the page id.
+        vectors are the chunks' dense vectors, computed here if needed and not given.
+        """
+        if self.dense is not None and vectors is None:
+            vectors = embed_many([text[start:end] for start, end in spans], self.dense.dim)
+        with self.lock:
+            if self.frozen:
+                raise ValueError("Corpus is frozen")
+            page_id = len(self.page_starts)
+            if page_id:
+                self._length += len(PAGE_SEPARATOR)
+            self.page_starts.append(self._length)
+            self._parts.append(text)
+            self._length += len(text)
+            self.urls.append(url)
+            for tf, length in terms:
+                self.index.add_term_counts(tf, length)
+            for start, end in spans:
+                self.chunk_pages.append(page_id)
+                self.chunk_starts.append(start)
+                self.chunk_ends.append(end)
+            if self.dense is not None:
+                self.dense.add(vectors)
+            if self.deleted_pages:
+                self._update_lead()
+            return page_id
+
+    def remove_page(self, page: int) -> None:
+        """Take a page out of retrieval; its chunk ids are not reused."""
+        with self.lock:
+            if page in self.deleted_pages:
+                return
+            chunk_ids = self.page_chunks(page)
+            for chunk_id in chunk_ids:
+                # The same term counts the chunk was indexed with
+                tf, _ = term_counts(self.chunk_text(chunk_id))
+                self.index.remove_term_counts(chunk_id, tf)
+            if self.dense is not None:
+                self.dense.remove(chunk_ids)
+            self.deleted_pages.add(page)
+            self.deleted_chunks.update(chunk_ids)
+            self._update_lead()
+
+    def _update_lead(self) -> None:
+        # A changed start page is re-added at the end, so look for its newest live copy
+        start_url = self.urls[0] if self.urls else None
+        for page in range(self.num_pages - 1, -1, -1):
+            if page not in self.deleted_pages and self.urls[page] == start_url and self.page_chunks(page):
+                self.lead_chunk = self.page_chunks(page)[0]
+                return
+        self.lead_chunk = next((i for i in range(self.num_chunks) if i not in self.deleted_chunks), 0)
+
+    def freeze(self) -> "Corpus":
+        """Join the pages into the single text buffer; no pages can be added afterwards."""
+        with self.lock:
+            if not self.frozen:
+                if self.deleted_pages:
+                    # thaw() emptied removed pages, which moves every later page; the offsets
+                    # are replaced before the text, which lock-free readers check first
+                    self.page_starts = array("q")
+                    self._length = 0
+                    for page, text in enumerate(self._parts):
+                        if page:
+                            self._length += len(PAGE_SEPARATOR)
+                        self.page_starts.append(self._length)
+                        self._length += len(text)
+                self._text = PAGE_SEPARATOR.join(self._parts)
+                self._parts = None
+            return self
+
+    def thaw(self) -> "Corpus":
+        """Split a frozen corpus back into pages so add_page() works again; freeze() when done."""
+        with self.lock:
+            if self.frozen:
+                self._parts = ["" if page in self.deleted_pages else self.page_text(page)
+                               for page in range(self.num_pages)]
+                self._text = None
+            return self
+
+    @property
+    def num_pages(self) -> int:
+        return len(self.page_starts)
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self.chunk_pages)
+
+    @property
+    def live_pages(self) -> int:
+        """Pages not removed (num_pages counts every page id)."""
+        return self.num_pages - len(self.deleted_pages)
+
+    @property
+    def live_chunks(self) -> int:
+        return self.num_chunks - len(self.deleted_chunks)
+
+    def page_chunks(self, page: int) -> range:
+        """Chunk ids of a page (chunks are stored in page order)."""
+        return range(bisect_left(self.chunk_pages, page), bisect_left(self.chunk_pages, page + 1))
+
+    @property
+    def num_chars(self) -> int:
+        """Characters of page text, separators excluded."""
+        return self._length - len(PAGE_SEPARATOR) * max(self.num_pages - 1, 0)
+
+    def span_text(self, page: int, start: int, end: int) -> str:
+        text = self._text
+        if text is not None:
+            offset = self.page_starts[page]
+            return text[offset + start:offset + end]
+        with self.lock:
+            if self._text is not None:
+                return self.span_text(page, start, end)
+            return self._parts[page][start:end]
+
+    def page_text(self, page: int) -> str:
+        end = self.page_starts[page + 1] - len(PAGE_SEPARATOR) if page + 1 < self.num_pages else self._length
+        return self.span_text(page, 0, end - self.page_starts[page])
+
+    def chunk_text(self, chunk_id: int) -> str:
+        return self.span_text(*self.spans[chunk_id])
+
+    def chunk_lengths(self) -> List[int]:
+        with self.lock:
+            return [end - start for chunk_id, (start, end) in enumerate(zip(self.chunk_starts, self.chunk_ends))
+                    if chunk_id not in self.deleted_chunks]
+
+    def chunk_stats(self) -> Optional[Dict[str, float]]:
+        """Count and average / min / max length in characters of the live chunks; None when there are none."""
+        lengths = self.chunk_lengths()
+        if not lengths:
+            return None
+        return {"chunks": len(lengths), "avg_chars": sum(lengths) / len(lengths),
+                "min_chars": min(lengths), "max_chars": max(lengths)}
+
+    def full_text(self) -> str:
+        """All pages, separated by PAGE_SEPARATOR. Free once frozen; joined on demand before."""
+        with self.lock:
+            if self.deleted_pages:
+                return PAGE_SEPARATOR.join(self.page_text(page) for page in range(self.num_pages)
+                                           if page not in self.deleted_pages)
+            if self._text is not None:
+                return self._text
+            return PAGE_SEPARATOR.join(self._parts)
+
+    @property
+    def retriever(self):
+        """What select() ranks chunks with: BM25 alone, or fused with dense similarity."""
+        return HybridRetriever(self.index, self.dense) if self.dense is not None else self.index
+
+    def select(self, question: str, k: int = 7, max_chars: int = 4000, measure: Callable[[str], int] = len) -> str:
+        with span("retrieval", chunks=self.live_chunks, dense=self.dense is not None) as s, self.lock:
+            context = select_excerpts(question, self.spans, self.span_text, k=k, max_chars=max_chars,
+                                      index=self.retriever, measure=measure,
+                                      removed=self.deleted_chunks, lead=self.lead_chunk)
+            s.set(chars=len(context))
+            return context
+
+    def approx_bytes(self) -> int:
+        with self.lock:
+            offsets = sum(a.buffer_info()[1] * a.itemsize
+                          for a in (self.page_starts, self.chunk_pages, self.chunk_starts, self.chunk_ends))
+            urls = sum(len(u) + 50 for u in self.urls)
+            dense = self.dense.approx_bytes() if self.dense is not None else 0
+            return self._length + offsets + urls + self.index.approx_bytes() + dense
@@ -0,0 +1,201 @@
+import hashlib
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import DEDUP_MIN_BLOCK_CHARS, SIMHASH_MAX_DISTANCE
+
+SIMHASH_BITS = 64
+SHINGLE_WORDS = 3
+
+_WORD = re.compile(r"\w+")
+
+
+# simhash() counts set bits with big-integer additions: _SPREAD[byte] holds the byte's bits,
+# most significant first, in separate _FIELD-bit counters, so one addition per byte of a
+# hash counts eight bit positions at once
+_FIELD = 32
+_FIELD_MASK = (1 << _FIELD) - 1
+_SPREAD = [sum((value >> (7 - bit) & 1) << (_FIELD * bit) for bit in range(8)) for value in range(256)]
+
+
+def _digest64(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(_digest64(text), "big")
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> List[str]:
+    """Overlapping word n-grams of the lowercased text (the text itself if it is shorter)."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of the text's word shingles; similar texts differ in few bits.
+    A bit is set when it is set in the hashes of more than half of the shingles. Each
+    shingle is hashed once and the bits are counted a byte column at a time (see _SPREAD).
+    """
+    hashes = b"".join(map(_digest64, shingles(text)))
+    count = len(hashes) // 8
+    fingerprint = 0
+    for column in range(8):
+        totals = sum(map(_SPREAD.__getitem__, hashes[column::8]))
+        for bit in range(8):
+            fingerprint = fingerprint << 1 | (2 * (totals >> (_FIELD * bit) & _FIELD_MASK) > count)
+    return fingerprint
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex:
+    """
+    Near-duplicate lookup for SimHash fingerprints.
+    Fingerprints are split into max_distance + 1 bands; two fingerprints within max_distance
+    bits must agree exactly on at least one band, so only those candidates are compared.
+    """
+
+    def __init__(self, max_distance: int = SIMHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = -(-SIMHASH_BITS // self.bands)
+        self.tables: List[Dict[int, List[int]]] = [{} for _ in range(self.bands)]
+
+    def _keys(self, fingerprint: int):
+        mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            yield band, fingerprint >> (band * self.band_bits) & mask
+
+    def find(self, fingerprint: int) -> bool:
+        """True if a fingerprint within max_distance bits has been added."""
+        for band, key in self._keys(fingerprint):
+            for other in self.tables[band].get(key, ()):
+                if hamming(fingerprint, other) <= self.max_distance:
+                    return True
+        return False
+
+    def add(self, fingerprint: int) -> None:
+        for band, key in self._keys(fingerprint):
+            self.tables[band].setdefault(key, []).append(fingerprint)
+
+    def remove(self, fingerprint: int) -> None:
+        for band, key in self._keys(fingerprint):
+            bucket = self.tables[band].get(key)
+            if bucket and fingerprint in bucket:
+                bucket.remove(fingerprint)
+
+    def copy(self) -> "SimHashIndex":
+        other = SimHashIndex(self.max_distance)
+        other.tables = [{key: list(bucket) for key, bucket in table.items()} for table in self.tables]
+        return other
+
+    def add_if_new(self, fingerprint: int) -> bool:
+        """Add the fingerprint unless it is a near duplicate; returns True if it was added."""
+        if self.find(fingerprint):
+            return False
+        self.add(fingerprint)
+        return True
+
+
+class Deduplicator:
+    """
+    Per-site duplicate filter applied to pages as they are indexed.
+    - Text blocks (lines of the extracted text, see scraper.extract) that
+      already appeared on an earlier page are dropped, so site-wide banners, menus and
+      sidebars that survive tag-based cleanup are indexed only once.
+    - Pages and chunks whose SimHash is within max_distance bits of one already indexed are skipped.
+    Fingerprints are computed by the caller (see utils.ingest.analyze_page), possibly in
+    another process; the decisions are made here, in page order.
+    forget() undoes what a page contributed, so a changed page is not a duplicate of its old version.
+    """
+
+    def __init__(self, max_distance: int = SIMHASH_MAX_DISTANCE, min_block_chars: int = DEDUP_MIN_BLOCK_CHARS):
+        self.min_block_chars = min_block_chars
+        self.lock = threading.Lock()
+        self._blocks: Set[int] = set()
+        self._pages = SimHashIndex(max_distance)
+        self._chunks = SimHashIndex(max_distance)
+        self.duplicate_pages = 0
+        self.duplicate_chunks = 0
+        self.repeated_block_chars = 0
+
+    def remove_repeated_blocks(self, text: str) -> str:
+        return self.claim_blocks(text)[0]
+
+    def claim_blocks(self, text: str) -> Tuple[str, Set[int]]:
+        """remove_repeated_blocks() that also returns the keys of the blocks this page introduced."""
+        kept = []
+        page_blocks = set()
+        with self.lock:
+            for line in text.split("\n"):
+                block = line.strip()
+                if not block:
+                    continue
+                if len(block) >= self.min_block_chars:
+                    key = _hash64(" ".join(block.lower().split()))
+                    if key in self._blocks:
+                        self.repeated_block_chars += len(block)
+                        continue
+                    page_blocks.add(key)
+                kept.append(block)
+            self._blocks |= page_blocks
+        return "\n".join(kept), page_blocks
+
+    def is_duplicate_page(self, fingerprint: int) -> bool:
+        """Record a page's SimHash and return True if a near-identical page was already seen."""
+        with self.lock:
+            if self._pages.add_if_new(fingerprint):
+                return False
+            self.duplicate_pages += 1
+            return True
+
+    def filter_chunks(self, fingerprints: List[int]) -> List[int]:
+        """Positions of the chunks to index: those whose SimHash is not near one already indexed."""
+        kept = []
+        with self.lock:
+            for i, fingerprint in enumerate(fingerprints):
+                if self._chunks.add_if_new(fingerprint):
+                    kept.append(i)
+                else:
+                    self.duplicate_chunks += 1
+        return kept
+
+    def forget(self, blocks: Iterable[int] = (), page_fingerprint: Optional[int] = None,
+               chunk_fingerprints: Iterable[int] = ()) -> None:
+        """
+        Drop what a removed page contributed. Blocks it introduced that were already dropped
+        from later pages stay dropped until the site is rebuilt.
+        """
+        with self.lock:
+            self._blocks.difference_update(blocks)
+            if page_fingerprint is not None:
+                self._pages.remove(page_fingerprint)
+            for fingerprint in chunk_fingerprints:
+                self._chunks.remove(fingerprint)
+
+    def copy(self) -> "Deduplicator":
+        """An independent copy, so a set of changes can be prepared and then swapped in at once."""
+        other = Deduplicator(self._pages.max_distance, self.min_block_chars)
+        with self.lock:
+            other._blocks = set(self._blocks)
+            other._pages = self._pages.copy()
+            other._chunks = self._chunks.copy()
+            other.duplicate_pages = self.duplicate_pages
+            other.duplicate_chunks = self.duplicate_chunks
+            other.repeated_block_chars = self.repeated_block_chars
+        return other
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "duplicate_pages": self.duplicate_pages,
+                "duplicate_chunks": self.duplicate_chunks,
+                "repeated_block_chars": self.repeated_block_chars,
+            }
@@ -0,0 +1,124 @@
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import DENSE_DIM, DENSE_MIN_SIMILARITY, DENSE_RETRIEVAL, DENSE_WEIGHT
+from utils.helpers import tokenize
+
+try:
+    import numpy as np  # Optional, enables dense retrieval
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+# Reciprocal rank fusion constant: how much the top few ranks dominate
+RRF_K = 60
+CHAR_NGRAMS = (3, 4)
+
+
+def dense_enabled() -> bool:
+    return DENSE_RETRIEVAL and np is not None
+
+
+def _features(text: str) -> Dict[str, float]:
+    """Words plus the character n-grams of each word, so inflections ("price", "pricing") overlap."""
+    features: Dict[str, float] = {}
+    for token in tokenize(text):
+        features["w:" + token] = features.get("w:" + token, 0.0) + 1.0
+        padded = f" {token} "
+        for n in CHAR_NGRAMS:
+            for i in range(len(padded) - n + 1):
+                gram = "c:" + padded[i:i + n]
+                features[gram] = features.get(gram, 0.0) + 0.5
+    return features
+
+
+def embed(text: str, dim: int = DENSE_DIM):
+    """
+    L2-normalized hashing-trick vector of text (float32, length dim).
+    Feature hashes use crc32, so vectors are identical across processes and runs.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, count in _features(text).items():
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += (1.0 + np.log(count)) * (1.0 if h & 0x80000000 else -1.0)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def embed_many(texts: Sequence[str], dim: int = DENSE_DIM):
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        matrix[i] = embed(text, dim)
+    return matrix
+
+
+class DenseIndex:
+    """
+    Chunk vectors in one float32 matrix (row i = chunk i), grown by doubling.
+    A query is scored against every chunk with a single matrix-vector product.
+    """
+
+    def __init__(self, dim: int = DENSE_DIM, matrix=None):
+        self.dim = dim
+        if matrix is not None:
+            self._matrix = matrix
+            self.size = len(matrix)
+        else:
+            self._matrix = np.zeros((64, dim), dtype=np.float32)
+            self.size = 0
+
+    @property
+    def matrix(self):
+        return self._matrix[:self.size]
+
+    def add(self, vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        needed = self.size + len(vectors)
+        if needed > len(self._matrix):
+            grown = np.zeros((max(needed, 2 * len(self._matrix)), self.dim), dtype=np.float32)
+            grown[:self.size] = self._matrix[:self.size]
+            self._matrix = grown
+        self._matrix[self.size:needed] = vectors
+        self.size = needed
+
+    def remove(self, chunk_ids: Sequence[int]) -> None:
+        """Zero the vectors of removed chunks, so they score 0 and fall below min_similarity."""
+        self._matrix[list(chunk_ids)] = 0.0
+
+    def search(self, query: str, k: Optional[int] = None,
+               min_similarity: float = DENSE_MIN_SIMILARITY) -> List[Tuple[int, float]]:
+        """(chunk_id, cosine similarity) of the k most similar chunks, best first."""
+        if not self.size:
+            return []
+        scores = self.matrix @ embed(query, self.dim)
+        if k is not None and k < self.size:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(self.size)
+        ranked = sorted(((int(i), float(scores[i])) for i in top), key=lambda x: (-x[1], x[0]))
+        return [(i, s) for i, s in ranked if s >= min_similarity]
+
+    def approx_bytes(self) -> int:
+        return self._matrix.nbytes
+
+
+class HybridRetriever:
+    """
+    Lexical BM25 and dense rankings fused with reciprocal rank fusion, exposing the same
+    search(query, k) as InvertedIndex so select_excerpts can use either.
+    Chunks that only the dense stage finds (paraphrases, other word forms) still get ranked.
+    """
+
+    def __init__(self, index, dense: DenseIndex, dense_weight: float = DENSE_WEIGHT):
+        self.index = index
+        self.dense = dense
+        self.dense_weight = dense_weight
+
+    def search(self, query: str, k: Optional[int] = None) -> List[Tuple[int, float]]:
+        depth = None if k is None else 2 * k
+        scores: Dict[int, float] = {}
+        for weight, ranking in ((1.0, self.index.search(query, k=depth)),
+                                (self.dense_weight, self.dense.search(query, k=depth))):
+            for rank, (chunk_id, _) in enumerate(ranking):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + weight / (RRF_K + rank + 1)
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return ranked if k is None else ranked[:k]
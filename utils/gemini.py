@@ -0,0 +1,187 @@
+import json
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import requests
+from urllib3.util.retry import Retry
+
+from config import GEMINI_API_KEY, GEMINI_BASE_URL, GEMINI_MODEL, GEMINI_TIMEOUT
+from utils.http import get_session
+from utils.tracing import record_span, span
+
+GENERATION_CONFIG = {
+    "maxOutputTokens": 500,
+    "temperature": 0.2,
+    "topP": 0.9,
+    "topK": 40
+}
+
+
+class GeminiError(Exception):
+    """Base error for Gemini calls."""
+
+
+class GeminiHTTPError(GeminiError):
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"API Error: {status_code} - {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+class GeminiStreamError(GeminiError):
+    """The stream broke off or reported an error after it had started."""
+
+
+class GeminiTimeout(GeminiError):
+    pass
+
+
+# The transport only retries connections that could not be opened; 429/5xx responses are
+# returned as they are, and retried (if at all) by utils.model_client with its quota and circuit
+CONNECT_RETRY = Retry(total=1, connect=1, read=0, status=0, allowed_methods=frozenset(["POST"]))
+
+
+def post_with_retry(url, headers, payload, timeout, stream=False):
+    # One pooled keep-alive session per process; no new TCP/TLS handshake per question
+    session = get_session("gemini", CONNECT_RETRY)
+    return session.post(url, headers=headers, data=json.dumps(payload), timeout=timeout, stream=stream)
+
+
+def endpoint(method: str, model: str = GEMINI_MODEL, base_url: str = GEMINI_BASE_URL,
+             api_key: str = GEMINI_API_KEY) -> str:
+    url = f"{base_url.rstrip('/')}/models/{model}:{method}?key={api_key}"
+    if method == "streamGenerateContent":
+        url += "&alt=sse"
+    return url
+
+
+def build_payload(contents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"contents": contents, "generationConfig": dict(GENERATION_CONFIG)}
+
+
+def extract_text(res_json: Dict[str, Any]) -> str:
+    """Text of the first candidate of a (full or streamed) generateContent response."""
+    candidates = res_json.get("candidates") or [{}]
+    parts = candidates[0].get("content", {}).get("parts") or [{}]
+    return "".join(p.get("text", "") for p in parts)
+
+
+def iter_sse(lines: Iterator[str]) -> Iterator[str]:
+    """Yield the data payload of each server-sent event from an iterator of lines."""
+    data: List[str] = []
+    for line in lines:
+        if line is None:
+            continue
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r")
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+            continue
+        if line.startswith(":"):
+            continue  # comment / keep-alive
+        field, _, value = line.partition(":")
+        if field == "data":
+            data.append(value[1:] if value.startswith(" ") else value)
+    if data:
+        yield "\n".join(data)
+
+
+class GeminiStream:
+    """
+    Iterable over the text deltas of a streamGenerateContent response.
+    Records time to first token and total time; `text` holds everything received so far.
+    on_close, if given, is called once the stream has ended or failed.
+    """
+
+    def __init__(self, response, started_at: float, timeout: float, on_close: Optional[Callable[[], None]] = None):
+        self.response = response
+        self.on_close = on_close
+        self.started_at = started_at
+        self.deadline = started_at + timeout
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.finish_reason: Optional[str] = None
+        self.text = ""
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        return None if self.first_token_at is None else self.first_token_at - self.started_at
+
+    @property
+    def total_time(self) -> Optional[float]:
+        return None if self.finished_at is None else self.finished_at - self.started_at
+
+    def __iter__(self) -> Iterator[str]:
+        error = None
+        try:
+            for data in iter_sse(self.response.iter_lines(decode_unicode=True)):
+                if time.time() > self.deadline:
+                    raise GeminiTimeout("The Gemini response did not finish in time.")
+                try:
+                    event = json.loads(data)
+                except ValueError:
+                    raise GeminiStreamError(f"Malformed stream event: {data[:200]}")
+                if "error" in event:
+                    err = event["error"]
+                    raise GeminiStreamError(err.get("message", str(err)) if isinstance(err, dict) else str(err))
+                candidates = event.get("candidates") or [{}]
+                self.finish_reason = candidates[0].get("finishReason") or self.finish_reason
+                delta = extract_text(event)
+                if delta:
+                    if self.first_token_at is None:
+                        self.first_token_at = time.time()
+                        record_span("first_token", self.time_to_first_token, stream=True)
+                    self.text += delta
+                    yield delta
+        except requests.exceptions.RequestException as e:
+            error = "GeminiStreamError"
+            raise GeminiStreamError(f"The answer stream was interrupted: {e}")
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.finished_at = time.time()
+            self.response.close()
+            record_span("generation", self.total_time, error=error, stream=True, chars=len(self.text),
+                        finish_reason=self.finish_reason)
+            if self.on_close is not None:
+                self.on_close()
+                self.on_close = None
+
+
+def stream_generate(payload: Dict[str, Any], timeout: float = GEMINI_TIMEOUT, **endpoint_kwargs) -> GeminiStream:
+    """
+    Start a streamed generation. HTTP errors before the first byte raise GeminiHTTPError;
+    errors after that surface while iterating the returned GeminiStream.
+    """
+    headers = {"Content-Type": "application/json"}
+    started_at = time.time()
+    try:
+        # The read timeout applies between chunks; GeminiStream enforces the overall deadline
+        response = post_with_retry(endpoint("streamGenerateContent", **endpoint_kwargs), headers, payload,
+                                   timeout=(10, timeout), stream=True)
+    except requests.exceptions.Timeout:
+        raise GeminiTimeout("The request to Gemini timed out.")
+    if response.status_code != 200:
+        body = response.text
+        response.close()
+        raise GeminiHTTPError(response.status_code, body)
+    return GeminiStream(response, started_at, timeout)
+
+
+def generate(payload: Dict[str, Any], timeout: float = GEMINI_TIMEOUT, **endpoint_kwargs) -> str:
+    """Non-streamed generation; returns the answer text."""
+    headers = {"Content-Type": "application/json"}
+    with span("generation", stream=False) as generation:
+        try:
+            response = post_with_retry(endpoint("generateContent", **endpoint_kwargs), headers, payload, timeout=timeout)
+        except requests.exceptions.Timeout:
+            raise GeminiTimeout("The request to Gemini timed out.")
+        if response.status_code != 200:
+            raise GeminiHTTPError(response.status_code, response.text)
+        text = extract_text(response.json())
+        generation.set(chars=len(text))
+        return text
@@ -62,10 +62,51 @@ def chunk_text_smart(text: str, chunk_size_words: int = CHUNK_SIZE, overlap_word
 
     return chunks
 
+def chunk_spans(text: str, chunk_size_words: int = CHUNK_SIZE, overlap_words: int = 100):
+    """
+    Same packing as chunk_text_smart, but returns (start, end) character spans into text
+    instead of copied strings, so overlapping chunks share the page text.
+    """
+    import re
+
+    words = [(m.start(), m.end()) for m in re.finditer(r"\S+", text)]
+    if not words:
+        return []
+
+    # Sentences as word-index ranges; a sentence ends at a word ending in . ! or ?
+    sentences = []
+    start = 0
+    for i, (_, end) in enumerate(words):
+        if text[end - 1] in ".!?":
+            sentences.append((start, i + 1))
+            start = i + 1
+    if start < len(words):
+        sentences.append((start, len(words)))
+
+    ranges = []
+    cur_start = None
+    cur_len = 0
+    for a, b in sentences:
+        wlen = b - a
+        # If adding this sentence exceeds the limit, finalize current chunk
+        if cur_start is not None and cur_len + wlen > chunk_size_words:
+            ranges.append((cur_start, a))
+            # The next chunk starts overlap_words back from the end of this one
+            cur_start = max(a - overlap_words, cur_start) if overlap_words > 0 else a
+            cur_len = a - cur_start
+        if cur_start is None:
+            cur_start = a
+        cur_len += wlen
+    if cur_start is not None:
+        ranges.append((cur_start, len(words)))
+
+    return [(words[i][0], words[j - 1][1]) for i, j in ranges]
+
 # --- Retrieval helpers for better grounding ---
 import re
 import math
-from typing import List, Dict, Tuple
+from itertools import chain
+from typing import Callable, Container, List, Dict, Optional, Tuple
 
 STOPWORDS = {
     "the","a","an","and","or","if","to","in","on","for","of","is","are","was","were","be",
@@ -80,6 +121,14 @@ def tokenize(text: str) -> List[str]:
     tokens = re.findall(r"[a-zA-Z0-9]+", text.lower())
     return [t for t in tokens if t not in STOPWORDS and len(t) > 2]
 
+def term_counts(text: str) -> Tuple[Dict[str, int], int]:
+    """Term frequencies of a chunk and its token count (what the index stores per chunk)."""
+    tokens = tokenize(text)
+    tf: Dict[str, int] = {}
+    for t in tokens:
+        tf[t] = tf.get(t, 0) + 1
+    return tf, len(tokens)
+
 def build_idf(chunks: List[str]) -> Dict[str, float]:
     """Compute a simple IDF for tokens across chunks."""
     N = len(chunks) or 1
@@ -93,8 +142,14 @@ def build_idf(chunks: List[str]) -> Dict[str, float]:
         idf[t] = math.log(1.0 + (N / (1.0 + d)))
     return idf
 
-def score_chunks(query: str, chunks: List[str], idf: Dict[str, float]) -> List[Tuple[int, float]]:
-    """Score chunks using a simple TF-IDF overlap with the query."""
+def score_chunks(query: str, chunks: List[str], idf: Dict[str, float], index=None, k: Optional[int] = None) -> List[Tuple[int, float]]:
+    """
+    Score chunks using a simple TF-IDF overlap with the query.
+    When an InvertedIndex is given, BM25 scores come from its postings instead and only
+    matching chunks (at most k) are returned.
+    """
+    if index is not None:
+        return index.search(query, k=k)
     q_tokens = tokenize(query)
     if not q_tokens:
         return [(i, 0.0) for i in range(len(chunks))]
@@ -112,9 +167,14 @@ def score_chunks(query: str, chunks: List[str], idf: Dict[str, float]) -> List[T
         scores.append((i, score))
     return sorted(scores, key=lambda x: x[1], reverse=True)
 
-def select_top_chunks(question: str, chunks: List[str], idf: Dict[str, float], k: int = 7, max_chars: int = 4000) -> str:
-    """Select top-k chunks by score, respecting a character budget. Falls back to sequential if scores are zero."""
-    ranked = score_chunks(question, chunks, idf)
+def select_top_chunks(question: str, chunks: List[str], idf: Dict[str, float], k: int = 7, max_chars: int = 4000, index=None,
+                      measure: Callable[[str], int] = len) -> str:
+    """
+    Select top-k chunks by score, respecting a character budget. Falls back to sequential if scores are zero.
+    Pass measure (e.g. a token counter) to budget in other units; max_chars is then in those units.
+    """
+    # With an index only a few candidates are ranked; extra ones cover chunks skipped for size
+    ranked = score_chunks(question, chunks, idf, index=index, k=k * 4)
     selected: List[str] = []
     total = 0
     count = 0
@@ -126,31 +186,128 @@ def select_top_chunks(question: str, chunks: List[str], idf: Dict[str, float], k
         k = min(10, len(chunks))  # Select up to 10 chunks if no matches
         for i in range(len(chunks)):
             piece = f"Chunk {i+1}:\n{chunks[i].strip()}\n"
-            if total + len(piece) > max_chars:
+            cost = measure(piece)
+            if total + cost > max_chars:
                 continue
             selected.append(piece)
-            total += len(piece)
+            total += cost
             count += 1
             if count >= k:
                 break
     else:
         for idx, _ in ranked:
             piece = f"Chunk {idx+1}:\n{chunks[idx].strip()}\n"
-            if total + len(piece) > max_chars:
+            cost = measure(piece)
+            if total + cost > max_chars:
                 continue
             selected.append(piece)
-            total += len(piece)
+            total += cost
             count += 1
             if count >= k:
                 break
+        # Indexed search omits zero-score chunks; pad in order like the full ranking would
+        if index is not None and count < k:
+            ranked_ids = {idx for idx, _ in ranked}
+            for i in range(len(chunks)):
+                if i in ranked_ids:
+                    continue
+                piece = f"Chunk {i+1}:\n{chunks[i].strip()}\n"
+                cost = measure(piece)
+                if total + cost > max_chars:
+                    continue
+                selected.append(piece)
+                total += cost
+                count += 1
+                if count >= k:
+                    break
 
     # Always include the first chunk if not already selected
     if chunks and not any("Chunk 1:" in s for s in selected):
         first_piece = f"Chunk 1:\n{chunks[0].strip()}\n"
-        if total + len(first_piece) <= max_chars:
+        if total + measure(first_piece) <= max_chars:
             selected.insert(0, first_piece)
 
     # Fallback: if nothing selected, include the first chunk
     if not selected and chunks:
         selected.append(f"Chunk 1:\n{chunks[0].strip()}\n")
     return "\n".join(selected)
+
+
+def coalesce_chunks(chunk_ids: List[int], spans: List[Tuple[int, int, int]],
+                    span_text: Optional[Callable[[int, int, int], str]] = None) -> List[Tuple[List[int], int, int, int]]:
+    """
+    Merge selected chunks that overlap or follow each other in the same page into one excerpt.
+    spans[i] is (page, start, end) of chunk i. Consecutive ids are not enough: chunks dropped
+    as duplicates leave gaps between the spans of chunks with consecutive ids. Chunks only
+    separated by whitespace are merged when span_text is given to check the gap.
+    Returns (chunk_ids, page, start, end) per excerpt, in chunk order.
+    """
+    excerpts: List[Tuple[List[int], int, int, int]] = []
+    for idx in sorted(set(chunk_ids)):
+        page, start, end = spans[idx]
+        if excerpts:
+            ids, prev_page, prev_start, prev_end = excerpts[-1]
+            if prev_page == page and (start <= prev_end or (
+                    span_text is not None and not span_text(page, prev_end, start).strip())):
+                excerpts[-1] = (ids + [idx], page, prev_start, max(prev_end, end))
+                continue
+        excerpts.append(([idx], page, start, end))
+    return excerpts
+
+def select_excerpts(question: str, spans: List[Tuple[int, int, int]], span_text: Callable[[int, int, int], str],
+                    k: int = 7, max_chars: int = 4000, index=None, measure: Callable[[str], int] = len,
+                    removed: Container[int] = (), lead: int = 0) -> str:
+    """
+    Span-based select_top_chunks: picks the top-k chunks within the budget, but adjacent or
+    overlapping chunks are sent as one contiguous excerpt, so overlap text is not repeated and
+    more distinct content fits. span_text(page, start, end) returns the text of a span.
+    Chunk ids in removed are never selected; lead is the chunk always included (the start page's first).
+    """
+    ranked = index.search(question, k=k * 4) if index is not None else []
+    # Generators: candidates past the ranked ones are only visited while the budget has room
+    if ranked and ranked[0][1] > 0.0:
+        ranked_ids = {idx for idx, _ in ranked}
+        # Indexed search omits zero-score chunks; pad in order like the full ranking would
+        candidates = chain((idx for idx, _ in ranked),
+                           (i for i in range(len(spans)) if i not in ranked_ids and i not in removed))
+    else:
+        # No matches: fall back to sequential selection with higher k
+        candidates = (i for i in range(len(spans)) if i not in removed)
+        k = 10
+
+    costs: Dict[Tuple[int, int, int], int] = {}
+
+    def render(excerpt) -> str:
+        ids, page, start, end = excerpt
+        label = f"Chunk {ids[0]+1}" if len(ids) == 1 else f"Chunks {ids[0]+1}-{ids[-1]+1}"
+        return f"{label}:\n{span_text(page, start, end).strip()}\n"
+
+    def cost_of(chosen: List[int]) -> int:
+        total = 0
+        for excerpt in coalesce_chunks(chosen, spans, span_text):
+            key = excerpt[1:]
+            if key not in costs:
+                costs[key] = measure(render(excerpt))
+            total += costs[key]
+        return total
+
+    chosen: List[int] = []
+    for idx in candidates:
+        if cost_of(chosen + [idx]) > max_chars:
+            continue
+        chosen.append(idx)
+        if len(chosen) >= k:
+            break
+
+    # Always include the first chunk if not already selected
+    has_lead = lead < len(spans) and lead not in removed
+    if has_lead and lead not in chosen and cost_of(chosen + [lead]) <= max_chars:
+        chosen.insert(0, lead)
+    # Fallback: if nothing selected, include the first chunk
+    if not chosen and has_lead:
+        chosen = [lead]
+
+    # Excerpts in rank order of their best chunk, the first chunk leading as before
+    rank = {idx: pos for pos, idx in enumerate(chosen)}
+    excerpts = sorted(coalesce_chunks(chosen, spans, span_text), key=lambda e: min(rank[i] for i in e[0]))
+    return "\n".join(render(e) for e in excerpts)
@@ -0,0 +1,70 @@
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE
+
+
+def make_session(retry: Optional[Retry] = None, pool_connections: int = HTTP_POOL_CONNECTIONS,
+                 pool_maxsize: int = HTTP_POOL_MAXSIZE) -> requests.Session:
+    """A requests.Session whose adapters keep up to pool_maxsize keep-alive connections per host."""
+    adapter = HTTPAdapter(
+        max_retries=retry if retry is not None else 0,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=False,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(name: str, retry: Optional[Retry] = None) -> requests.Session:
+    """
+    Process-wide pooled session by name (e.g. "gemini", "crawler").
+    Sessions are created once and shared by every Streamlit session and crawler worker,
+    so repeated calls to the same host reuse TCP/TLS connections.
+    """
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = make_session(retry)
+            _sessions[name] = session
+        return session
+
+
+def session_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-session connection pool counters: requests sent, connections opened and reused."""
+    stats = {}
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    for name, session in sessions.items():
+        hosts = requests_count = connections = 0
+        seen = set()
+        for adapter in session.adapters.values():
+            if id(adapter) in seen:
+                continue
+            seen.add(id(adapter))
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                hosts += 1
+                requests_count += getattr(pool, "num_requests", 0)
+                connections += getattr(pool, "num_connections", 0)
+        stats[name] = {
+            "hosts": hosts,
+            "requests": requests_count,
+            "connections": connections,
+            "reused": max(requests_count - connections, 0),
+        }
+    return stats
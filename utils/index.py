@@ -0,0 +1,159 @@
+import heapq
+import math
+from bisect import bisect_left
+import sys
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.helpers import term_counts, tokenize
+
+
+class InvertedIndex:
+    """
+    BM25 inverted index over chunks, built once per site.
+    - Terms are interned to integer ids (vocab); postings for term id t are two parallel
+      arrays, post_docs[t] (chunk ids, ascending) and post_tfs[t] (term frequencies).
+    - Queries only visit the postings of their own terms, so cost does not grow with corpus size.
+    - Removed chunks are tombstoned: their postings stay in place with tf 0 and no longer count
+      towards df, the number of chunks or the average length, so BM25 statistics stay exact.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.post_docs: List[array] = []
+        self.post_tfs: List[array] = []
+        self.doc_lengths = array("I")
+        self.total_length = 0
+        self.num_deleted = 0
+        # term id -> tombstoned postings of the term
+        self._deleted_postings: Dict[int, int] = {}
+
+    @classmethod
+    def build(cls, chunks: Iterable[str], k1: float = 1.5, b: float = 0.75) -> "InvertedIndex":
+        index = cls(k1=k1, b=b)
+        index.add_documents(chunks)
+        return index
+
+    def add_documents(self, chunks: Iterable[str]) -> List[int]:
+        """Append chunks to the index and return their chunk ids."""
+        return [self.add_term_counts(*term_counts(ch)) for ch in chunks]
+
+    def term_id(self, term: str) -> int:
+        """Id of term, adding it to the vocabulary if needed."""
+        tid = self.vocab.get(term)
+        if tid is None:
+            tid = len(self.post_docs)
+            self.vocab[sys.intern(term)] = tid
+            self.post_docs.append(array("I"))
+            self.post_tfs.append(array("I"))
+        return tid
+
+    def add_term_counts(self, tf: Dict[str, int], length: int) -> int:
+        """Append one chunk from precomputed term frequencies; returns its chunk id."""
+        doc_id = len(self.doc_lengths)
+        for t, count in tf.items():
+            tid = self.term_id(t)
+            self.post_docs[tid].append(doc_id)
+            self.post_tfs[tid].append(count)
+        self.doc_lengths.append(length)
+        self.total_length += length
+        return doc_id
+
+    def remove_term_counts(self, doc_id: int, tf: Dict[str, int]) -> None:
+        """Tombstone one chunk, given the term frequencies it was added with."""
+        for t in tf:
+            tid = self.vocab.get(t)
+            if tid is None:
+                continue
+            docs, tfs = self.post_docs[tid], self.post_tfs[tid]
+            pos = bisect_left(docs, doc_id)
+            if pos < len(docs) and docs[pos] == doc_id and tfs[pos]:
+                tfs[pos] = 0
+                self._deleted_postings[tid] = self._deleted_postings.get(tid, 0) + 1
+        self.total_length -= self.doc_lengths[doc_id]
+        self.doc_lengths[doc_id] = 0
+        self.num_deleted += 1
+
+    @property
+    def num_docs(self) -> int:
+        """Chunks in the index, not counting removed ones (chunk ids go up to len(doc_lengths))."""
+        return len(self.doc_lengths) - self.num_deleted
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self.total_length / self.num_docs if self.num_docs else 0.0
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self.vocab)
+
+    @property
+    def num_postings(self) -> int:
+        return sum(len(docs) for docs in self.post_docs) - sum(self._deleted_postings.values())
+
+    def lookup(self, term: str) -> Optional[Tuple[Sequence[int], Sequence[int]]]:
+        """(chunk ids, term frequencies) of term, or None if it is not in the vocabulary."""
+        tid = self.vocab.get(term)
+        if tid is None:
+            return None
+        return self.post_docs[tid], self.post_tfs[tid]
+
+    def postings(self, term: str) -> List[Tuple[int, int]]:
+        """(chunk_id, tf) pairs for term."""
+        found = self.lookup(term)
+        return [(doc, tf) for doc, tf in zip(*found) if tf] if found is not None else []
+
+    def df(self, term: str) -> int:
+        found = self.lookup(term)
+        if found is None:
+            return 0
+        if self.num_deleted:
+            return len(found[0]) - self._deleted_postings.get(self.vocab[term], 0)
+        return len(found[0])
+
+    def idf(self, term: str) -> float:
+        """BM25 IDF (non-negative variant)."""
+        df = self.df(term)
+        if df == 0:
+            return 0.0
+        return math.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        Score chunks matching any query term with BM25.
+        Returns (chunk_id, score) pairs sorted by score descending (ties by chunk_id);
+        chunks without any query term are not included.
+        """
+        q_terms = set(tokenize(query))
+        if not q_terms or not self.num_docs:
+            return []
+        avgdl = self.avg_doc_length or 1.0
+        k1, b = self.k1, self.b
+        doc_lengths = self.doc_lengths
+        scores: Dict[int, float] = {}
+        for t in q_terms:
+            found = self.lookup(t)
+            if found is None:
+                continue
+            idf = self.idf(t)
+            for doc_id, tf in zip(*found):
+                norm = k1 * (1.0 - b + b * doc_lengths[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1.0) / (tf + norm)
+        if self.num_deleted:
+            # Tombstoned postings (tf 0) scored 0; every live match scores above it
+            scores = {doc_id: score for doc_id, score in scores.items() if score > 0.0}
+        if k is None or k >= len(scores):
+            return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return heapq.nsmallest(k, scores.items(), key=lambda x: (-x[1], x[0]))
+
+    def approx_bytes(self) -> int:
+        """Memory used by postings, lengths and vocabulary (approximate)."""
+        arrays = sum(a.buffer_info()[1] * a.itemsize + 64 for a in self.post_docs)
+        arrays += sum(a.buffer_info()[1] * a.itemsize + 64 for a in self.post_tfs)
+        vocab = sys.getsizeof(self.vocab) + sum(sys.getsizeof(t) for t in self.vocab)
+        return arrays + vocab + self.doc_lengths.buffer_info()[1] * self.doc_lengths.itemsize
@@ -0,0 +1,519 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import (
+    CHUNK_SIZE, CHUNK_OVERLAP_WORDS, CRAWL_MAX_DEPTH, CRAWL_DELAY, CRAWL_WORKERS,
+    CRAWL_RATE_PER_HOST, CRAWL_BURST, CRAWL_SKIP_NON_HTML, CRAWL_MAX_PAGES, CRAWL_RESPECT_ROBOTS,
+    CRAWL_USE_SITEMAPS, CRAWL_MAX_SITEMAPS, PAGE_STORE_PATH, INGEST_PROCESSES, SITE_REFRESH_REBUILD_RATIO,
+)
+from scraper.page_store import content_hash, get_page_store
+from scraper.urls import canonicalize_url
+from scraper.web_scraper import iter_crawl
+from utils.cache import site_cache, site_cache_key
+from utils.corpus import Corpus
+from utils.dedup import Deduplicator, simhash
+from utils.dense import embed_many
+from utils.helpers import chunk_spans, term_counts
+from utils.refresh import refresh_scheduler
+from utils.snapshot import Snapshot, find_snapshot
+from utils.tracing import record_span, span
+
+# Result of the CPU-bound work on one page (see analyze_page)
+PageAnalysis = namedtuple("PageAnalysis", "fingerprint spans terms chunk_fingerprints vectors seconds")
+# What a crawled URL left in the index: the hash of its text as fetched, its page id (None if it
+# was skipped) and what it added to the Deduplicator, so a refresh can take it out again
+IndexedPage = namedtuple("IndexedPage", "text_hash page_id fingerprint blocks chunk_fingerprints")
+
+
+def chunk_params(chunk_size: int = CHUNK_SIZE, overlap_words: int = CHUNK_OVERLAP_WORDS) -> str:
+    """Key of the chunking parameters in the page store."""
+    return f"{chunk_size}:{overlap_words}:spans"
+
+
+def analyze_page(raw_text: str, text: str, chunk_size: int = CHUNK_SIZE, overlap_words: int = CHUNK_OVERLAP_WORDS,
+                 chunks: Optional[Tuple[List, List]] = None, dense_dim: int = 0) -> PageAnalysis:
+    """
+    Everything per page that does not depend on other pages: the SimHash of the page as
+    fetched, the chunk spans of the cleaned text with their term counts (unless chunks
+    were loaded from the page store), each chunk's SimHash and, with dense_dim, its vector.
+    A pure function, so it gives the same result inline or in a worker process.
+    """
+    started = time.perf_counter()
+    if chunks is None:
+        spans = chunk_spans(text, chunk_size, overlap_words)
+        terms = [term_counts(text[start:end]) for start, end in spans]
+    else:
+        spans, terms = chunks
+    vectors = embed_many([text[start:end] for start, end in spans], dense_dim) if dense_dim else None
+    fingerprints = [simhash(text[start:end]) for start, end in spans]
+    return PageAnalysis(simhash(raw_text), spans, terms, fingerprints, vectors, time.perf_counter() - started)
+
+
+def load_chunks(store, page_hash: Optional[str], chunk_size: int = CHUNK_SIZE,
+                overlap_words: int = CHUNK_OVERLAP_WORDS) -> Optional[Tuple[List, List]]:
+    """Stored (spans, terms) of a page version, so an unchanged page is never re-chunked or re-tokenized."""
+    if store is None or not page_hash:
+        return None
+    stored = store.get_chunks(page_hash, chunk_params(chunk_size, overlap_words))
+    if stored is None:
+        return None
+    spans, terms = stored
+    return [tuple(span) for span in spans], [(tf, length) for tf, length in terms]
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def resolve_processes(processes: int = INGEST_PROCESSES) -> int:
+    """Worker processes for ingest: 0 = run inline, a negative value = one per CPU core."""
+    return (os.cpu_count() or 1) if processes < 0 else processes
+
+
+def get_process_pool(processes: int = INGEST_PROCESSES) -> Optional[ProcessPoolExecutor]:
+    """Process-wide pool for CPU-bound ingest work (sized on first use), or None when ingest runs inline."""
+    global _process_pool
+    processes = resolve_processes(processes)
+    if processes <= 0:
+        return None
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn: forking a process that runs crawler and UI threads is not safe
+            _process_pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_process_pool.shutdown, wait=False, cancel_futures=True)
+        return _process_pool
+
+
+class SiteIngest:
+    """
+    Retrieval data for one site, built incrementally while the crawl runs.
+    - Pages are chunked and appended to the index as they arrive; IDF/BM25 statistics
+      are derived from the postings, so they are always current.
+    - Text, chunk spans and postings live in one Corpus (utils.corpus); the SiteIngest is
+      cached per site, so every session shares it instead of holding its own copies.
+    - Readers go through select()/full_text(), which take the same lock as the writer,
+      so questions can be answered against whatever has been indexed so far.
+      The corpus is frozen into a single text buffer when the crawl ends.
+    - Blocks repeated across pages, near-duplicate pages and near-duplicate chunks are
+      indexed only once (utils.dedup).
+    - With processes > 0, HTML extraction and analyze_page run in a process pool. Everything
+      that depends on earlier pages (block removal, duplicate decisions, merging term counts
+      into the index) stays on this thread in crawl order, so the result is identical to
+      the inline path.
+    - refresh() re-crawls a finished site and patches the index with the pages that changed
+      (utils.refresh schedules it in the background).
+    """
+
+    def __init__(self, url: str, store=None, on_done: Optional[Callable[["SiteIngest"], None]] = None,
+                 processes: int = INGEST_PROCESSES):
+        self.url = url
+        self.store = store
+        self.on_done = on_done
+        self.processes = resolve_processes(processes)
+        self.corpus = Corpus()
+        self.dedup = Deduplicator()
+        self.lock = self.corpus.lock
+        self.page_status: Counter = Counter()
+        self.pages: Dict[str, IndexedPage] = {}
+        self.pages_processed = 0
+        self.pages_discovered = 1
+        self.version = 0
+        self.refreshes = 0
+        self.refreshed_at: Optional[float] = None
+        self.error: Optional[str] = None
+        # Set instead of error when the crawl broke off after some pages were indexed
+        self.warning: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._done = threading.Event()
+        self._first_chunk = threading.Event()
+        self.snapshot: Optional[Snapshot] = None
+
+    @property
+    def dense_dim(self) -> int:
+        """Dimensions of the chunk vectors analyze_page should compute (0 = none)."""
+        return self.corpus.dense.dim if self.corpus.dense is not None else 0
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot) -> "SiteIngest":
+        """A finished SiteIngest serving a memory-mapped snapshot (see utils.snapshot)."""
+        site = cls(snapshot.url)
+        site.snapshot = snapshot
+        site.corpus = snapshot.corpus
+        site.lock = site.corpus.lock
+        site.page_status = Counter(snapshot.meta.get("page_status", {}))
+        site.pages_processed = site.pages_discovered = snapshot.meta.get("pages_processed", site.corpus.num_pages)
+        site.started_at = site.finished_at = time.time()
+        site._done.set()
+        site._first_chunk.set()
+        return site
+
+    def snapshot_meta(self) -> Dict[str, Any]:
+        """Crawl statistics stored alongside a snapshot of this site."""
+        return {
+            "page_status": dict(self.page_status),
+            "pages_processed": self.pages_processed,
+            "build_seconds": (self.finished_at or time.time()) - self.started_at,
+        }
+
+    def start(self) -> "SiteIngest":
+        """Run the crawl on a background thread and return immediately."""
+        threading.Thread(target=self.run, name=f"ingest-{self.url}", daemon=True).start()
+        return self
+
+    def _crawl(self, executor, progress=None, on_error=None):
+        return iter_crawl(
+            self.url,
+            max_depth=CRAWL_MAX_DEPTH,
+            delay=CRAWL_DELAY,
+            workers=CRAWL_WORKERS,
+            rate=CRAWL_RATE_PER_HOST or None,
+            burst=CRAWL_BURST,
+            skip_non_html=CRAWL_SKIP_NON_HTML,
+            store=self.store,
+            progress=progress,
+            executor=executor,
+            max_pages=CRAWL_MAX_PAGES or None,
+            respect_robots=CRAWL_RESPECT_ROBOTS,
+            use_sitemaps=CRAWL_USE_SITEMAPS,
+            max_sitemaps=CRAWL_MAX_SITEMAPS,
+            on_error=on_error,
+        )
+
+    def run(self) -> "SiteIngest":
+        executor = get_process_pool(self.processes)
+        # Pages being analyzed in the pool, applied strictly in crawl order
+        pending = deque()
+        try:
+            for page in self._crawl(executor, progress=self._on_progress):
+                if executor is None:
+                    self.add_page(page)
+                    continue
+                prepared = self._prepare(page)
+                if prepared is None:
+                    continue
+                page, raw_text, chunks, record = prepared
+                pending.append((page, chunks, record, executor.submit(analyze_page, raw_text, page.text,
+                                                                      chunks=chunks, dense_dim=self.dense_dim)))
+                while pending and (pending[0][3].done() or len(pending) > 2 * self.processes):
+                    page, chunks, record, future = pending.popleft()
+                    self._apply(page, chunks, future.result(), record)
+            while pending:
+                page, chunks, record, future = pending.popleft()
+                self._apply(page, chunks, future.result(), record)
+        except Exception as e:
+            for *_, future in pending:
+                future.cancel()
+            if self.corpus.num_chunks:
+                # What was indexed before the failure is still worth answering from
+                self.warning = (f"The crawl stopped early ({e}); only the {self.corpus.live_pages} pages "
+                                f"indexed so far are used.")
+            else:
+                self.error = f"Error while scraping the website: {e}"
+        if not self.corpus.num_chunks and self.error is None:
+            self.error = "Error: no content could be scraped from this website."
+        self.corpus.freeze()
+        self.finished_at = time.time()
+        record_span("crawl", self.finished_at - self.started_at, error="CrawlError" if self.error else None,
+                    partial=self.warning is not None, url=self.url, pages=self.pages_processed,
+                    indexed_pages=self.corpus.live_pages, chunks=self.corpus.live_chunks, processes=self.processes)
+        self._done.set()
+        self._first_chunk.set()
+        if self.on_done is not None:
+            self.on_done(self)
+        return self
+
+    def _on_progress(self, processed: int, discovered: int) -> None:
+        self.pages_processed = processed
+        self.pages_discovered = discovered
+
+    def add_page(self, page) -> None:
+        """Index one page inline."""
+        prepared = self._prepare(page)
+        if prepared is not None:
+            page, raw_text, chunks, record = prepared
+            self._apply(page, chunks, analyze_page(raw_text, page.text, chunks=chunks, dense_dim=self.dense_dim),
+                        record)
+
+    def _prepare(self, page, dedup: Optional[Deduplicator] = None, on_skip=None):
+        """
+        Drop blocks already seen on earlier pages; returns (cleaned page, raw text, stored chunks,
+        IndexedPage so far), or None after on_skip(url, record, duplicate) for a page that adds
+        nothing. dedup and on_skip default to this site's (see refresh() for the others).
+        """
+        dedup = self.dedup if dedup is None else dedup
+        on_skip = self._skip if on_skip is None else on_skip
+        record = IndexedPage(content_hash(page.text), None, None, (), ())
+        if not page.text.strip():
+            on_skip(page.url, record, False)
+            return None
+        text, blocks = dedup.claim_blocks(page.text)
+        record = record._replace(blocks=blocks)
+        if not text.strip():
+            on_skip(page.url, record, True)
+            return None
+        raw_text = page.text
+        # Stored chunks are keyed by the text actually indexed, never by the response body:
+        # rendered pages of a single-page app share one HTML shell but not their text
+        text_hash = record.text_hash if text == raw_text else content_hash(text)
+        page = page._replace(text=text, content_hash=text_hash)
+        return page, raw_text, load_chunks(self.store, page.content_hash), record
+
+    def _apply(self, page, chunks, analysis: PageAnalysis, record: IndexedPage) -> None:
+        accepted = self._accept(page, chunks, analysis, record)
+        if accepted is None:
+            return
+        with span("index", url=page.url, chunks=len(accepted[1])), self.lock:
+            self._commit(*accepted)
+            self.page_status[page.status] += 1
+            self.version += 1
+        self._first_chunk.set()
+
+    def _accept(self, page, chunks, analysis: PageAnalysis, record: IndexedPage,
+                dedup: Optional[Deduplicator] = None, on_skip=None):
+        """Duplicate decisions for an analyzed page; returns what _commit() should add, or None."""
+        dedup = self.dedup if dedup is None else dedup
+        on_skip = self._skip if on_skip is None else on_skip
+        # Timed where it ran, possibly in a worker process
+        record_span("chunk", analysis.seconds, url=page.url, chunks=len(analysis.spans), cached=chunks is not None)
+        # The page check uses the text as fetched, so mirrors and near-copies are caught
+        # even though most of their blocks were just removed as repeats
+        if dedup.is_duplicate_page(analysis.fingerprint):
+            on_skip(page.url, record, True)
+            return None
+        record = record._replace(fingerprint=analysis.fingerprint)
+        if chunks is None and self.store is not None and page.content_hash:
+            self.store.put_chunks(page.content_hash, chunk_params(), analysis.spans, analysis.terms)
+        kept = dedup.filter_chunks(analysis.chunk_fingerprints)
+        if not kept:
+            on_skip(page.url, record, True)
+            return None
+        spans = [analysis.spans[i] for i in kept]
+        terms = [analysis.terms[i] for i in kept]
+        vectors = analysis.vectors[kept] if analysis.vectors is not None else None
+        record = record._replace(chunk_fingerprints=[analysis.chunk_fingerprints[i] for i in kept])
+        return page, spans, terms, vectors, record
+
+    def _commit(self, page, spans, terms, vectors, record: IndexedPage) -> None:
+        page_id = self.corpus.add_page(page.url, page.text, spans, terms, vectors)
+        self.pages[page.url] = record._replace(page_id=page_id)
+
+    def _skip(self, url: str, record: IndexedPage, duplicate: bool) -> None:
+        """Remember a page that added nothing to the index (empty, or a duplicate)."""
+        with self.lock:
+            self.pages[url] = record
+            if duplicate:
+                self.page_status["duplicate"] += 1
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        Re-crawl the site and apply only what changed: pages whose text hash differs, new pages
+        and pages no longer found. Unchanged pages are neither re-chunked nor re-indexed (with
+        the page store they are not even re-downloaded). Duplicate decisions are made on a copy
+        of the Deduplicator, and every change (index, dedup state, page records) is made in one
+        step under the site lock, so a question sees either the old or the new version and a
+        failed refresh changes nothing. Pages that are gone (404/410) are removed; pages that
+        failed otherwise are kept. Snapshot-backed sites, and sites with many removed chunks,
+        are rebuilt instead. Returns page counts by outcome.
+        """
+        self.wait()
+        corpus = self.corpus
+        if self.snapshot is not None or (corpus.num_chunks and
+                                         len(corpus.deleted_chunks) > SITE_REFRESH_REBUILD_RATIO * corpus.num_chunks):
+            return self.rebuild()
+        executor = get_process_pool(self.processes)
+        seen, failed = set(), set()
+        changed = []
+        processed = 0
+        for page in self._crawl(executor, on_error=failed.add):
+            processed += 1
+            seen.add(page.url)
+            known = self.pages.get(page.url)
+            if known is None or known.text_hash != content_hash(page.text):
+                changed.append(page)
+        new = sum(1 for page in changed if page.url not in self.pages)
+        # Without the start page the crawl found few links; do not mistake that for removals
+        found_start = canonicalize_url(self.url) in seen
+        removed = [url for url in self.pages if url not in seen and url not in failed] if found_start else []
+        stale = [self.pages[url] for url in removed] + [self.pages[p.url] for p in changed if p.url in self.pages]
+        dedup = self.dedup.copy()
+        # A changed page must not count as a duplicate of its old version
+        for record in stale:
+            dedup.forget(record.blocks, record.fingerprint, record.chunk_fingerprints)
+        skipped: Dict[str, Tuple[IndexedPage, bool]] = {}
+
+        def skip(url, record, duplicate):
+            skipped[url] = (record, duplicate)
+
+        prepared = [p for p in (self._prepare(page, dedup, skip) for page in changed) if p is not None]
+        if executor is None:
+            analyses = [analyze_page(raw_text, page.text, chunks=chunks, dense_dim=self.dense_dim)
+                        for page, raw_text, chunks, _ in prepared]
+        else:
+            futures = [executor.submit(analyze_page, raw_text, page.text, chunks=chunks, dense_dim=self.dense_dim)
+                       for page, raw_text, chunks, _ in prepared]
+            analyses = [future.result() for future in futures]
+        accepted = [a for a in (self._accept(page, chunks, analysis, record, dedup, skip)
+                                for (page, _, chunks, record), analysis in zip(prepared, analyses)) if a is not None]
+
+        stale_pages = [record.page_id for record in stale if record.page_id is not None]
+        with span("index", url=self.url, chunks=sum(len(a[1]) for a in accepted), refresh=True), self.lock:
+            if stale_pages or accepted:
+                for page_id in stale_pages:
+                    corpus.remove_page(page_id)
+                # Drops the text of the removed pages; freeze() joins the rest with the new ones
+                corpus.thaw()
+                for page, spans, terms, vectors, record in accepted:
+                    self._commit(page, spans, terms, vectors, record)
+                    self.page_status[page.status] += 1
+                corpus.freeze()
+                self.version += 1
+            self.dedup = dedup
+            for url in removed:
+                del self.pages[url]
+            for url, (record, duplicate) in skipped.items():
+                self.pages[url] = record
+                if duplicate:
+                    self.page_status["duplicate"] += 1
+            self.page_status["removed"] += len(removed)
+            self.pages_processed = processed + len(failed)
+            self.refreshes += 1
+            self.refreshed_at = time.time()
+        return {
+            "pages": processed,
+            "changed": len(changed) - new,
+            "new": new,
+            "removed": len(removed),
+            "failed": len(failed),
+            "indexed": len(accepted),
+        }
+
+    def rebuild(self) -> Dict[str, int]:
+        """Crawl the site from scratch and switch to the result; the old version serves until then."""
+        fresh = SiteIngest(self.url, self.store, processes=self.processes).run()
+        if fresh.error or fresh.warning:
+            # A partial crawl must not replace a complete index
+            raise RuntimeError(fresh.error or fresh.warning)
+        with self.lock:
+            # Nothing else uses the finished build; its corpus takes over this site's lock, so
+            # everyone who synchronizes on the site (and its corpus) keeps using the same lock
+            fresh.corpus.lock = self.lock
+            self.corpus = fresh.corpus
+            self.dedup = fresh.dedup
+            self.pages = fresh.pages
+            self.page_status = fresh.page_status
+            self.pages_processed = fresh.pages_processed
+            self.pages_discovered = fresh.pages_discovered
+            self.snapshot = None
+            self.version += 1
+            self.refreshes += 1
+            self.refreshed_at = time.time()
+        return {"pages": fresh.pages_processed, "rebuilt": fresh.corpus.live_pages}
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until the first page is indexed (or the crawl ends). Returns False on timeout."""
+        return self._first_chunk.wait(timeout)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    @property
+    def index(self):
+        return self.corpus.index
+
+    @property
+    def num_chunks(self) -> int:
+        return self.corpus.live_chunks
+
+    def chunk_text(self, chunk_id: int) -> str:
+        return self.corpus.chunk_text(chunk_id)
+
+    def select(self, question: str, k: int = 7, max_chars: int = 4000, measure: Callable[[str], int] = len) -> str:
+        return self.corpus.select(question, k=k, max_chars=max_chars, measure=measure)
+
+    def full_text(self) -> str:
+        return self.corpus.full_text()
+
+    def chunk_lengths(self) -> List[int]:
+        return self.corpus.chunk_lengths()
+
+    def chunk_stats(self) -> Optional[Dict[str, float]]:
+        return self.corpus.chunk_stats()
+
+    def progress(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "pages_indexed": self.corpus.live_pages,
+                "pages_processed": self.pages_processed,
+                "pages_discovered": self.pages_discovered,
+                "chunks": self.corpus.live_chunks,
+                "done": self.done,
+                "elapsed": (self.finished_at or time.time()) - self.started_at,
+                "refreshed_at": self.refreshed_at,
+            }
+
+    def approx_bytes(self) -> int:
+        return self.corpus.approx_bytes()
+
+
+def build_site(url: str, store=None) -> SiteIngest:
+    """Crawl and index a site synchronously."""
+    return SiteIngest(url, store).run()
+
+
+def load_site(url: str, store: Optional[Any] = None) -> SiteIngest:
+    """
+    Return the shared SiteIngest for url. On the first request it is opened from a snapshot
+    when one exists (tools/snapshot.py builds them), otherwise a background crawl is started.
+    Callers should wait_until_ready() before the first question.
+    Crawled sites are then kept fresh by utils.refresh, in the background, while they are used.
+    """
+    if store is None:
+        store = get_page_store(PAGE_STORE_PATH)
+    key = site_cache_key(
+        url,
+        max_depth=CRAWL_MAX_DEPTH,
+        delay=CRAWL_DELAY,
+        max_pages=CRAWL_MAX_PAGES,
+        sitemaps=CRAWL_USE_SITEMAPS,
+        chunk_size=CHUNK_SIZE,
+        overlap=CHUNK_OVERLAP_WORDS,
+    )
+
+    def finished(site: SiteIngest) -> None:
+        if site.error:
+            # Failed crawls are not cached so the next attempt retries
+            site_cache.invalidate(key)
+        elif site_cache.peek(key) is site:
+            # Re-insert so the memory cap accounts for the final size
+            site_cache.set(key, site)
+            refresh_scheduler.track(key, site)
+
+    def create() -> SiteIngest:
+        # A tracked site stays fresh even after it left the cache; never crawl it again here
+        tracked = refresh_scheduler.get(key)
+        if tracked is not None:
+            return tracked
+        snapshot = find_snapshot(url)
+        if snapshot is not None:
+            return SiteIngest.from_snapshot(snapshot)
+        return SiteIngest(url, store, on_done=finished).start()
+
+    site = site_cache.get_or_create(key, create)
+    if site.done and site.error:
+        # The crawl may have failed before it was cached; make sure the next load retries
+        site_cache.invalidate(key)
+    elif site.done and site.snapshot is None:
+        # Snapshots are refreshed by rebuilding them (tools/snapshot.py)
+        refresh_scheduler.track(key, site)
+    return site
@@ -0,0 +1,336 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+from config import (
+    GEMINI_TIMEOUT,
+    MODEL_BREAKER_FAILURES,
+    MODEL_BREAKER_RESET,
+    MODEL_BURST,
+    MODEL_HEDGE_AFTER,
+    MODEL_MAX_ATTEMPTS,
+    MODEL_MAX_CONCURRENT,
+    MODEL_QUEUE_TIMEOUT,
+    MODEL_RATE_PER_MINUTE,
+)
+from utils.gemini import (
+    CONNECT_RETRY,
+    GeminiError,
+    GeminiHTTPError,
+    GeminiStream,
+    GeminiTimeout,
+    endpoint,
+    extract_text,
+)
+from utils.http import get_session
+from utils.tracing import metrics, record_span, span
+from utils.rate_limit import TokenBucket, parse_retry_after
+
+# Retries of 429/5xx are decided here, with the shared quota and circuit in mind;
+# the transport only retries connections that could not be opened (utils.gemini.CONNECT_RETRY)
+# 5xx responses and timeouts count against the circuit; 429 is a quota signal and pauses the bucket
+OVERLOAD_STATUSES = frozenset([500, 502, 503, 504])
+RETRY_STATUSES = OVERLOAD_STATUSES | {429}
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 8.0
+
+
+class ModelBusy(GeminiError):
+    """No request slot or quota became free within the queue timeout."""
+
+
+class CircuitOpen(GeminiError):
+    """Gemini has been failing; calls fail fast until the circuit's trial request succeeds."""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"The model is unavailable; retrying in {retry_in:.0f}s.")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After failure_threshold consecutive failures it opens and calls
+    fail fast. After reset_after seconds one trial call is let through (half open): success
+    closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = MODEL_BREAKER_FAILURES, reset_after: float = MODEL_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opens = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed" or self.failure_threshold <= 0:
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_after:
+                self.state = "half_open"
+                return True
+            return False
+
+    def retry_in(self) -> float:
+        with self._lock:
+            return max(0.0, self._opened_at + self.reset_after - time.monotonic())
+
+    def abandon(self) -> None:
+        """A trial call that never reached the service: let the next call be the trial instead."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self._opened_at = time.monotonic() - self.reset_after
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and 0 < self.failure_threshold <= self.failures):
+                self.state = "open"
+                self.opens += 1
+                self._opened_at = time.monotonic()
+
+
+class ModelClient:
+    """
+    Process-wide gate in front of Gemini, shared by every session.
+    - At most max_concurrent requests are in flight; further calls queue for up to queue_timeout.
+    - A token bucket keeps the process within the API quota (rate_per_minute), and a 429
+      pauses it for Retry-After seconds for everyone instead of each session retrying on its own.
+    - A call that has not answered (streams: started) after hedge_after seconds gets one
+      duplicate request if a slot and quota are free right away; the first answer wins.
+    - 429/5xx and timeouts are retried with jittered backoff within the call's timeout,
+      up to max_attempts. Sustained 5xx/timeouts open the circuit breaker, which makes
+      calls fail fast with CircuitOpen until a trial request succeeds.
+    """
+
+    def __init__(self, max_concurrent: int = MODEL_MAX_CONCURRENT, queue_timeout: float = MODEL_QUEUE_TIMEOUT,
+                 rate_per_minute: float = MODEL_RATE_PER_MINUTE, burst: int = MODEL_BURST,
+                 max_attempts: int = MODEL_MAX_ATTEMPTS, hedge_after: float = MODEL_HEDGE_AFTER,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.max_concurrent = max(1, max_concurrent)
+        self.queue_timeout = queue_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.hedge_after = hedge_after
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="model")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.counts: Dict[str, int] = {
+            "calls": 0, "requests": 0, "hedges": 0, "hedge_wins": 0, "retries": 0,
+            "rejected": 0, "fast_failed": 0, "peak_in_flight": 0, "peak_waiting": 0,
+        }
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += n
+
+    # --- Slots and quota ---
+
+    def _acquire(self, deadline: float, block: bool = True) -> bool:
+        """Take a request slot and a quota token; False if not possible in time (or at once, if not block)."""
+        if not block:
+            if not self._slots.acquire(blocking=False):
+                return False
+            if not self.bucket.acquire(timeout=0):
+                self._slots.release()
+                return False
+        else:
+            with self._lock:
+                self.waiting += 1
+                self.counts["peak_waiting"] = max(self.counts["peak_waiting"], self.waiting)
+            queued_at = time.perf_counter()
+            try:
+                wait_limit = max(0.0, min(self.queue_timeout, deadline - time.monotonic()))
+                if not self._slots.acquire(timeout=wait_limit):
+                    return False
+                if not self.bucket.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    self._slots.release()
+                    return False
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+                record_span("model_queue", time.perf_counter() - queued_at)
+        with self._lock:
+            self.in_flight += 1
+            self.counts["requests"] += 1
+            self.counts["peak_in_flight"] = max(self.counts["peak_in_flight"], self.in_flight)
+        return True
+
+    def _release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _discard(self, future) -> None:
+        """Clean up a request that lost the race or was abandoned: close it and free its slot."""
+        try:
+            response = future.result()
+        except Exception:
+            response = None
+        if response is not None:
+            response.close()
+        self._release()
+
+    # --- Requests ---
+
+    def _send(self, method: str, payload: Dict[str, Any], timeout: float, stream: bool,
+              endpoint_kwargs: Dict[str, Any]) -> requests.Response:
+        session = get_session("gemini-client", CONNECT_RETRY)
+        response = session.post(endpoint(method, **endpoint_kwargs), headers={"Content-Type": "application/json"},
+                                data=json.dumps(payload), timeout=(10, timeout) if stream else timeout, stream=stream)
+        if not stream:
+            response.content  # read the body inside the slot; hedging covers the whole answer
+        return response
+
+    def _race(self, send: Callable[[], requests.Response], deadline: float):
+        """
+        Run send() in a slot and, if it is slow, one hedged duplicate.
+        Returns (response, release) for the first request to answer; the slot is released by release().
+        """
+        if not self._acquire(deadline):
+            self._count("rejected")
+            raise ModelBusy("The model is busy; too many questions are waiting. Please try again shortly.")
+        primary = self._executor.submit(send)
+        pending = {primary}
+        if self.hedge_after > 0:
+            done, _ = wait(pending, timeout=max(0.0, min(self.hedge_after, deadline - time.monotonic())))
+            if not done and time.monotonic() < deadline and self._acquire(deadline, block=False):
+                self._count("hedges")
+                pending.add(self._executor.submit(send))
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    for other in pending:
+                        other.add_done_callback(self._discard)
+                    return future.result(), self._release
+                error = future.exception()
+                self._release()
+        for other in pending:
+            other.add_done_callback(self._discard)
+        if error is not None and not isinstance(error, requests.exceptions.Timeout):
+            raise error
+        raise GeminiTimeout("The request to Gemini timed out.")
+
+    def _attempt(self, method: str, payload: Dict[str, Any], remaining: float, deadline: float, stream: bool,
+                 endpoint_kwargs: Dict[str, Any]):
+        """
+        One try, with its outcome recorded on the breaker: (response, release, None, None) for
+        a 200, else (None, None, error, retry_after) for a retryable failure. Other errors raise.
+        """
+        try:
+            response, release = self._race(
+                lambda: self._send(method, payload, remaining, stream, endpoint_kwargs), deadline)
+        except (GeminiTimeout, requests.exceptions.RequestException) as e:
+            metrics.inc("model_responses_total", status=type(e).__name__)
+            self.breaker.record_failure()
+            return None, None, e if isinstance(e, GeminiTimeout) else GeminiError(f"Request failed: {e}"), None
+        metrics.inc("model_responses_total", status=response.status_code)
+        if response.status_code == 200:
+            self.breaker.record_success()
+            return response, release, None, None
+        try:
+            status, body = response.status_code, response.text
+        finally:
+            response.close()
+            release()
+        error = GeminiHTTPError(status, body)
+        if status not in RETRY_STATUSES:
+            # The service answered; the request itself is at fault
+            self.breaker.record_success()
+            raise error
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if status == 429:
+            self.bucket.pause(retry_after if retry_after is not None else BACKOFF_BASE)
+            # Says nothing about the service's health; the next call is the trial instead
+            self.breaker.abandon()
+        else:
+            self.breaker.record_failure()
+        return None, None, error, retry_after
+
+    def _call(self, method: str, payload: Dict[str, Any], timeout: float, stream: bool,
+              endpoint_kwargs: Dict[str, Any]):
+        """The first 200 response of up to max_attempts tries, with its slot release function."""
+        self._count("calls")
+        deadline = time.monotonic() + timeout
+        last_error: GeminiError = GeminiTimeout("The request to Gemini timed out.")
+        for attempt in range(1, self.max_attempts + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.breaker.allow():
+                self._count("fast_failed")
+                raise CircuitOpen(self.breaker.retry_in())
+            try:
+                response, release, error, retry_after = self._attempt(
+                    method, payload, remaining, deadline, stream, endpoint_kwargs)
+            except BaseException:
+                # ModelBusy, or anything unexpected: a half-open trial that got no verdict must
+                # not leave the circuit half open, failing every call fast (no-op otherwise)
+                self.breaker.abandon()
+                raise
+            if response is not None:
+                return response, release
+            last_error = error
+            if attempt == self.max_attempts:
+                break
+            backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            if retry_after is not None:
+                backoff = max(backoff, retry_after)
+            if time.monotonic() + backoff >= deadline:
+                break
+            self._count("retries")
+            time.sleep(backoff)
+        raise last_error
+
+    def generate(self, payload: Dict[str, Any], timeout: float = GEMINI_TIMEOUT, **endpoint_kwargs) -> str:
+        """Non-streamed generation through the shared limits; returns the answer text."""
+        with span("generation", stream=False) as generation:
+            response, release = self._call("generateContent", payload, timeout, False, endpoint_kwargs)
+            try:
+                text = extract_text(response.json())
+            finally:
+                release()
+            generation.set(chars=len(text))
+            return text
+
+    def stream_generate(self, payload: Dict[str, Any], timeout: float = GEMINI_TIMEOUT, **endpoint_kwargs) -> GeminiStream:
+        """
+        Streamed generation through the shared limits. The request slot is held until the
+        returned stream has been consumed (or fails), so callers must iterate it.
+        """
+        started_at = time.time()
+        response, release = self._call("streamGenerateContent", payload, timeout, True, endpoint_kwargs)
+        return GeminiStream(response, started_at, timeout, on_close=release)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counts, in_flight=self.in_flight, waiting=self.waiting)
+        stats["circuit"] = self.breaker.state
+        stats["circuit_opens"] = self.breaker.opens
+        return stats
+
+
+# Shared by every session in the process
+model_client = ModelClient()
+metrics.describe("model_responses_total", "Gemini responses by HTTP status, or the exception of failed requests.")
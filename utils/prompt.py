@@ -0,0 +1,137 @@
+from typing import Any, Callable, Dict, List, Sequence
+
+from config import PROMPT_TOKEN_BUDGET, PROMPT_HISTORY_SHARE, TOKENIZER_ENCODING
+from utils.tracing import span
+
+try:
+    import tiktoken  # Optional, for exact token counts
+except ImportError:  # pragma: no cover - depends on the environment
+    tiktoken = None
+
+_encoding = None
+
+INSTRUCTIONS = (
+    "You are answering strictly from the provided website snippets.\n"
+    "Instructions:\n"
+    "- If the question is a greeting (like 'hi' or 'hello'), respond with a friendly welcome and invite them to ask about the website.\n"
+    "- Otherwise, base the answer only on the snippets. Do not use outside knowledge.\n"
+    "- If the snippets do not contain the answer, say: "
+    "\"I don't know based on the provided website content.\"\n"
+    "- Keep the answer concise and relevant."
+)
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception:
+            _encoding = False  # encoding files unavailable (e.g. offline); use the estimate
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when available, else a ~4 characters per token estimate."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens tokens, marking the cut with an ellipsis."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens - 1]) + "…"
+    return text[:max(0, max_tokens * 4 - 1)] + "…"
+
+
+def fit_history(history: Sequence[Dict[str, str]], max_tokens: int) -> List[Dict[str, str]]:
+    """
+    Keep the most recent messages that fit in max_tokens.
+    Older messages that do not fit are replaced by a one-line summary of the questions asked,
+    and a single oversized message is truncated.
+    """
+    kept: List[Dict[str, str]] = []
+    used = 0
+    dropped = list(history)
+    while dropped:
+        m = dropped[-1]
+        cost = count_tokens(m["content"])
+        if used + cost > max_tokens:
+            if not kept:
+                # The latest message alone is too large; keep a truncated copy of it
+                kept.insert(0, {"role": m["role"], "content": truncate_to_tokens(m["content"], max_tokens)})
+                dropped.pop()
+            break
+        kept.insert(0, m)
+        used += cost
+        dropped.pop()
+
+    earlier = [m["content"] for m in dropped if m["role"] == "user"]
+    if earlier:
+        summary = "Earlier in this conversation the user asked: " + "; ".join(q.strip() for q in earlier)
+        remaining = max_tokens - sum(count_tokens(m["content"]) for m in kept)
+        summary = truncate_to_tokens(summary, min(remaining, max_tokens // 4))
+    else:
+        summary = ""
+    # Gemini expects the conversation to start with a user turn
+    while kept and kept[0]["role"] != "user":
+        kept.pop(0)
+    if summary:
+        if kept:
+            kept[0] = {"role": "user", "content": f"{summary}\n\n{kept[0]['content']}"}
+        else:
+            kept = [{"role": "user", "content": summary}]
+    return kept
+
+
+def build_prompt(question: str, select_snippets: Callable[[int, Callable[[str], int]], str],
+                 history: Sequence[Dict[str, str]] = (), budget: int = PROMPT_TOKEN_BUDGET,
+                 history_share: float = PROMPT_HISTORY_SHARE) -> Dict[str, Any]:
+    """
+    Assemble the Gemini `contents` within one token budget.
+    - Instructions and the question are always sent, once.
+    - History gets at most history_share of the budget (see fit_history).
+    - Snippets get everything that is left: select_snippets(max_tokens, count_tokens) must
+      return the retrieved context measured with the given counter.
+    Returns the contents, the selected context, the history actually sent and per-section token counts.
+    """
+    with span("prompt_build", budget=budget) as prompt_span:
+        question_text = f"Question: {question}"
+        fixed_tokens = count_tokens(INSTRUCTIONS) + count_tokens(question_text) + count_tokens("Snippets:\n")
+        history_used = fit_history(history, int(budget * history_share))
+        history_tokens = sum(count_tokens(m["content"]) for m in history_used)
+        snippet_budget = max(budget - fixed_tokens - history_tokens, 0)
+        context = select_snippets(snippet_budget, count_tokens)
+
+        contents = [
+            {"role": "user" if m["role"] == "user" else "model", "parts": [{"text": m["content"]}]}
+            for m in history_used
+        ]
+        contents.append({
+            "role": "user",
+            "parts": [{"text": f"{INSTRUCTIONS}\n\nSnippets:\n{context}\n\n{question_text}"}]
+        })
+        snippet_tokens = count_tokens(context)
+        prompt_span.set(tokens=fixed_tokens + history_tokens + snippet_tokens, history_messages=len(history_used))
+        return {
+            "contents": contents,
+            "context": context,
+            "history": history_used,
+            "tokens": {
+                "instructions": count_tokens(INSTRUCTIONS),
+                "question": count_tokens(question_text),
+                "history": history_tokens,
+                "snippets": snippet_tokens,
+                "total": fixed_tokens + history_tokens + snippet_tokens,
+                "budget": budget,
+            },
+        }
@@ -0,0 +1,134 @@
+import email.utils
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to `capacity`.
+    A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take tokens and return how long the caller must wait before using them."""
+        if self.rate <= 0:
+            with self._lock:
+                return max(0.0, self._paused_until - time.monotonic())
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(wait, self._paused_until - now)
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Block until tokens are available. Returns False if that would exceed timeout."""
+        wait = self.reserve(tokens)
+        if timeout is not None and wait > timeout:
+            # Give the tokens back; the caller will not use them
+            with self._lock:
+                self._tokens += tokens
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for the given number of seconds (e.g. after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class HostRateLimiter:
+    """
+    Per-host token buckets with adaptive backoff.
+    - backoff() pauses a host and halves its rate (never below min_rate).
+    - success() slowly restores the rate towards the configured value.
+    - cap() lowers the rate of one host for good, e.g. to honour a robots.txt Crawl-delay.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, min_rate: float = 0.1):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._failures: Dict[str, int] = {}
+        self._caps: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[host] = bucket
+            return bucket
+
+    def max_rate(self, host: str) -> float:
+        cap = self._caps.get(host)
+        if cap is None:
+            return self.rate
+        return cap if self.rate <= 0 else min(self.rate, cap)
+
+    def cap(self, host: str, rate: float) -> None:
+        """Never send more than rate requests/second to host, and no bursts."""
+        bucket = self.bucket(host)
+        with self._lock:
+            self._caps[host] = rate
+            bucket.rate = self.max_rate(host) if bucket.rate <= 0 else min(bucket.rate, rate)
+        with bucket._lock:
+            bucket.capacity = 1.0
+            bucket._tokens = min(bucket._tokens, 1.0)
+
+    def acquire(self, host: str) -> None:
+        self.bucket(host).acquire()
+
+    def backoff(self, host: str, retry_after: Optional[float] = None) -> float:
+        """Slow a host down after a 429/503; returns the pause applied in seconds."""
+        bucket = self.bucket(host)
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if bucket.rate > 0:
+                bucket.rate = max(self.min_rate, bucket.rate / 2.0)
+        delay = retry_after if retry_after is not None else min(60.0, 2.0 ** failures)
+        bucket.pause(delay)
+        return delay
+
+    def success(self, host: str) -> None:
+        bucket = self.bucket(host)
+        with self._lock:
+            self._failures.pop(host, None)
+            max_rate = self.max_rate(host)
+            if 0 < bucket.rate < max_rate:
+                bucket.rate = min(max_rate, bucket.rate * 1.25)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
@@ -0,0 +1,153 @@
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional
+
+from config import SITE_CACHE_TTL, SITE_REFRESH_INTERVAL, SITE_REFRESH_WORKERS
+from utils.cache import site_cache
+from utils.tracing import metrics, trace
+
+
+class TrackedSite:
+    """Refresh state of one site in the scheduler."""
+
+    def __init__(self, site, interval: float):
+        self.site = site
+        self.interval = interval
+        self.due = time.monotonic() + interval
+        self.last_used = time.monotonic()
+        self.running = False
+        self.refreshes = 0
+        self.failures = 0
+        self.last_result: Dict[str, int] = {}
+        self.last_error: Optional[str] = None
+
+
+class RefreshScheduler:
+    """
+    Re-crawls tracked sites in the background, so sessions never wait on a crawl for them.
+    - Each site is refreshed every interval seconds (per site; SITE_REFRESH_INTERVAL by
+      default). site.refresh() re-crawls it off the request path and applies only the pages
+      that changed, in one step that live sessions see atomically (see SiteIngest.refresh).
+    - After a refresh the site is stored in site_cache again, so its TTL and size are current.
+    - A site nobody asked for in idle_after seconds is dropped and left to expire.
+    - At most `workers` refreshes run at once, and never two of the same site.
+    """
+
+    def __init__(self, interval: float = SITE_REFRESH_INTERVAL, idle_after: float = SITE_CACHE_TTL,
+                 workers: int = SITE_REFRESH_WORKERS):
+        self.interval = interval
+        self.idle_after = idle_after
+        self.workers = max(1, workers)
+        self._sites: Dict[Hashable, TrackedSite] = {}
+        self._running = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, key: Hashable, site, interval: Optional[float] = None) -> None:
+        """Keep a finished site fresh under its site_cache key; called again whenever the site is used."""
+        interval = self.interval if interval is None else interval
+        if interval <= 0:
+            return
+        with self._cond:
+            tracked = self._sites.get(key)
+            if tracked is None or tracked.site is not site:
+                self._sites[key] = TrackedSite(site, interval)
+                self._start()
+                self._cond.notify()
+            else:
+                tracked.last_used = time.monotonic()
+
+    def untrack(self, key: Hashable) -> None:
+        with self._cond:
+            self._sites.pop(key, None)
+
+    def get(self, key: Hashable):
+        """The tracked site for key, or None; lets a cache miss reuse it instead of crawling again."""
+        with self._cond:
+            tracked = self._sites.get(key)
+            if tracked is None:
+                return None
+            tracked.last_used = time.monotonic()
+            return tracked.site
+
+    def refresh_now(self, key: Hashable) -> bool:
+        """Make a tracked site due right away; False if it is not tracked."""
+        with self._cond:
+            tracked = self._sites.get(key)
+            if tracked is None:
+                return False
+            tracked.due = time.monotonic()
+            self._cond.notify()
+            return True
+
+    def _start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="site-refresh", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                for key, tracked in list(self._sites.items()):
+                    if tracked.running or tracked.due > now:
+                        continue
+                    if self.idle_after > 0 and now - tracked.last_used > self.idle_after:
+                        del self._sites[key]
+                        continue
+                    if self._running >= self.workers:
+                        break
+                    tracked.running = True
+                    self._running += 1
+                    threading.Thread(target=self._refresh, args=(key, tracked),
+                                     name=f"refresh-{tracked.site.url}", daemon=True).start()
+                waiting = [t.due for t in self._sites.values() if not t.running]
+                timeout = max(0.0, min(waiting) - now) if waiting and self._running < self.workers else None
+                self._cond.wait(timeout)
+
+    def _refresh(self, key: Hashable, tracked: TrackedSite) -> None:
+        site = tracked.site
+        try:
+            with trace("refresh", url=site.url) as root:
+                result = site.refresh()
+                root.set(**result)
+            tracked.refreshes += 1
+            tracked.last_result = result
+            tracked.last_error = None
+            metrics.inc("site_refreshes_total", result="rebuilt" if result.get("rebuilt") else "ok")
+            with self._cond:
+                still_tracked = self._sites.get(key) is tracked
+            if still_tracked:
+                site_cache.set(key, site)
+        except Exception as e:
+            tracked.failures += 1
+            tracked.last_error = str(e)
+            metrics.inc("site_refreshes_total", result="error")
+            print(f"Warning: could not refresh {site.url} ({e}); serving the previous version.")
+        finally:
+            with self._cond:
+                tracked.running = False
+                tracked.due = time.monotonic() + tracked.interval
+                self._running -= 1
+                self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            return {
+                tracked.site.url: {
+                    "interval": tracked.interval,
+                    "next_in": max(0.0, tracked.due - now),
+                    "running": tracked.running,
+                    "refreshes": tracked.refreshes,
+                    "failures": tracked.failures,
+                    "last_result": dict(tracked.last_result),
+                    "last_error": tracked.last_error,
+                }
+                for tracked in self._sites.values()
+            }
+
+
+# Shared by every session in the process
+refresh_scheduler = RefreshScheduler()
+metrics.describe("site_refreshes_total", "Background site re-crawls by outcome (ok, rebuilt, error).")
@@ -0,0 +1,140 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from config import GEMINI_TIMEOUT, MAX_HISTORY_TURNS
+from utils.answer_cache import answer_cache
+from utils.gemini import GeminiError, GeminiHTTPError, build_payload
+from utils.ingest import SiteIngest, load_site
+from utils.model_client import ModelClient, model_client
+from utils.prompt import build_prompt
+from utils.tracing import trace
+
+NO_ANSWER = "No answer returned."
+
+
+class ServiceError(Exception):
+    """The site could not be loaded (crawl failed or timed out)."""
+
+
+class ChatService:
+    """
+    The ingest -> retrieve -> prompt -> answer pipeline, shared by app.py and the batch tools.
+    Sites come from load_site(), so they share the process-wide site cache (and snapshots);
+    model calls go through one ModelClient, so concurrent questions respect its limits.
+    Thread-safe: answer() may be called from many threads against the same site.
+    """
+
+    def __init__(self, client: ModelClient = model_client, stream: bool = False, use_answer_cache: bool = True,
+                 k: int = 7, timeout: float = GEMINI_TIMEOUT, batch: bool = True, **endpoint_kwargs):
+        self.client = client
+        self.stream = stream
+        self.batch = batch
+        self.use_answer_cache = use_answer_cache
+        self.k = k
+        self.timeout = timeout
+        self.endpoint_kwargs = endpoint_kwargs
+
+    def load(self, url: str, wait: bool = True, timeout: Optional[float] = None) -> SiteIngest:
+        """
+        The shared SiteIngest for url. With wait, block until the crawl has finished so every
+        question sees the whole site; otherwise only until the first page is indexed.
+        """
+        site = load_site(url)
+        ready = site.wait(timeout) if wait else site.wait_until_ready(timeout)
+        if not ready:
+            raise ServiceError(f"{url} was not indexed within {timeout:g}s.")
+        if site.error:
+            raise ServiceError(site.error)
+        return site
+
+    def answer(self, site: SiteIngest, question: str, history: Sequence[Dict[str, str]] = (),
+               on_delta: Optional[Callable[[str], None]] = None,
+               on_prompt: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Answer one question from the site's content (history is the prior chat messages).
+        Returns a JSON-serializable result with per-stage timings in ms; model errors are
+        reported in "error" (and "error_type", plus "status_code" for HTTP errors) rather
+        than raised. If a stream breaks off, "answer" keeps the text received so far.
+        on_prompt(prompt_build) is called once the prompt is built, before generation;
+        on_delta(text) with every streamed text delta, as it arrives.
+        """
+        result: Dict[str, Any] = {"question": question, "answer": None, "error": None, "cached": False}
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        with trace("question", url=site.url, stream=self.stream, batch=self.batch):
+            retrieval = []
+
+            def select(budget, measure):
+                t = time.perf_counter()
+                context = site.select(question, k=self.k, max_chars=budget, measure=measure)
+                retrieval.append(time.perf_counter() - t)
+                return context
+
+            prompt_build = build_prompt(question, select, list(history)[-MAX_HISTORY_TURNS:])
+            built = time.perf_counter()
+            timings["retrieval_ms"] = sum(retrieval) * 1000
+            timings["prompt_ms"] = (built - started) * 1000 - timings["retrieval_ms"]
+            result["tokens"] = prompt_build["tokens"]
+            context, cache_history = prompt_build["context"], prompt_build["history"]
+            if on_prompt is not None:
+                on_prompt(prompt_build)
+
+            cached = answer_cache.get(question, context, cache_history) if self.use_answer_cache else None
+            if cached is not None:
+                result["answer"], result["cached"] = cached, True
+            else:
+                payload = build_payload(prompt_build["contents"])
+                stream = None
+                try:
+                    if self.stream:
+                        stream = self.client.stream_generate(payload, timeout=self.timeout, **self.endpoint_kwargs)
+                        for delta in stream:
+                            if on_delta is not None:
+                                on_delta(delta)
+                        text = stream.text
+                    else:
+                        text = self.client.generate(payload, timeout=self.timeout, **self.endpoint_kwargs)
+                    timings["generation_ms"] = (time.perf_counter() - built) * 1000
+                    if text and self.use_answer_cache:
+                        answer_cache.put(question, context, text, cache_history, timings["generation_ms"] / 1000)
+                    result["answer"] = text or NO_ANSWER
+                except GeminiError as e:
+                    result["error"] = f"{type(e).__name__}: {e}"
+                    result["error_type"] = type(e).__name__
+                    if isinstance(e, GeminiHTTPError):
+                        result["status_code"] = e.status_code
+                    if stream is not None and stream.text:
+                        result["answer"] = stream.text
+                if stream is not None and stream.time_to_first_token is not None:
+                    timings["first_token_ms"] = stream.time_to_first_token * 1000
+        timings["total_ms"] = (time.perf_counter() - started) * 1000
+        result["timings"] = {name: round(ms, 2) for name, ms in timings.items()}
+        return result
+
+    def answer_many(self, site: SiteIngest, questions: Iterable[str], concurrency: int = 8,
+                    on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Answer independent questions concurrently against one site and yield the results in
+        input order, each as soon as it and all earlier ones are done. Each result carries
+        its "index"; on_result(index, result) is called as results complete, in any order.
+        """
+        questions = list(questions)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="ask") as pool:
+            futures = [pool.submit(self._answer_indexed, site, i, q, on_result) for i, q in enumerate(questions)]
+            for future in futures:
+                yield future.result()
+
+    def _answer_indexed(self, site: SiteIngest, index: int, question: str,
+                        on_result: Optional[Callable[[int, Dict[str, Any]], None]]) -> Dict[str, Any]:
+        result = dict(self.answer(site, question), index=index)
+        if on_result is not None:
+            on_result(index, result)
+        return result
+
+
+def answer_questions(url: str, questions: List[str], concurrency: int = 8, **kwargs) -> List[Dict[str, Any]]:
+    """Load url and answer all questions against it; a convenience wrapper around ChatService."""
+    service = ChatService(**kwargs)
+    site = service.load(url)
+    return list(service.answer_many(site, questions, concurrency))
@@ -0,0 +1,316 @@
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import SNAPSHOT_DIR
+from utils.cache import normalize_url
+from utils.corpus import PAGE_SEPARATOR, ChunkSpans, Corpus
+from utils.dense import DenseIndex, dense_enabled, np
+from utils.index import InvertedIndex
+
+MAGIC = b"DCSNAP\0\0"
+FORMAT_VERSION = 1
+# magic, format version, reserved, metadata offset, metadata length
+HEADER = struct.Struct("<8sIIQQ")
+
+# A loaded snapshot: the read-only corpus plus the metadata it was written with
+Snapshot = namedtuple("Snapshot", "path url created_at corpus meta")
+
+
+class SnapshotError(Exception):
+    """The file is not a snapshot this version can read."""
+
+
+class _SortedTerms:
+    """The sorted vocabulary as a sequence of UTF-8 byte strings, decoded on access (for bisect)."""
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+
+class SnapshotIndex(InvertedIndex):
+    """
+    Read-only InvertedIndex over memory-mapped arrays.
+    The vocabulary is stored sorted, so terms are found by binary search without building a dict;
+    postings are CSR: term i owns post_docs/post_tfs[post_offsets[i]:post_offsets[i + 1]].
+    """
+
+    def __init__(self, sections: Dict[str, memoryview], total_length: int, k1: float, b: float):
+        super().__init__(k1=k1, b=b)
+        self.vocab_offsets = sections["vocab_offsets"]
+        self.vocab_bytes = sections["vocab"]
+        self.post_offsets = sections["post_offsets"]
+        self.post_docs = sections["post_docs"]
+        self.post_tfs = sections["post_tfs"]
+        self.idf_values = sections["idf"]
+        self.doc_lengths = sections["doc_lengths"]
+        self.total_length = total_length
+        self._terms = _SortedTerms(self.vocab_offsets, self.vocab_bytes)
+
+    def term_index(self, term: str) -> Optional[int]:
+        key = term.encode("utf-8")
+        i = bisect.bisect_left(self._terms, key)
+        return i if i < len(self._terms) and self._terms[i] == key else None
+
+    def term_id(self, term: str) -> int:
+        raise TypeError("A snapshot index is read-only")
+
+    def add_term_counts(self, tf: Dict[str, int], length: int) -> int:
+        raise TypeError("A snapshot index is read-only")
+
+    def remove_term_counts(self, doc_id: int, tf: Dict[str, int]) -> None:
+        raise TypeError("A snapshot index is read-only")
+
+    def lookup(self, term: str):
+        i = self.term_index(term)
+        if i is None:
+            return None
+        start, end = self.post_offsets[i], self.post_offsets[i + 1]
+        return self.post_docs[start:end], self.post_tfs[start:end]
+
+    def idf(self, term: str) -> float:
+        i = self.term_index(term)
+        return 0.0 if i is None else self.idf_values[i]
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self.vocab_offsets) - 1
+
+    @property
+    def num_postings(self) -> int:
+        return len(self.post_docs)
+
+    def approx_bytes(self) -> int:
+        return sum(view.nbytes for view in (self.vocab_offsets, self.vocab_bytes, self.post_offsets,
+                                            self.post_docs, self.post_tfs, self.idf_values, self.doc_lengths))
+
+
+class SnapshotCorpus(Corpus):
+    """
+    Read-only Corpus over a memory-mapped snapshot.
+    The text stays UTF-8 in the mapping and page/chunk offsets are byte offsets, so only
+    the excerpts actually sent to the model are decoded.
+    """
+
+    def __init__(self, index: SnapshotIndex, sections: Dict[str, memoryview], urls: List[str], num_chars: int,
+                 dense: Optional[DenseIndex] = None):
+        super().__init__(index, dense)
+        self.urls = urls
+        self.page_starts = sections["page_starts"]
+        self.chunk_pages = sections["chunk_pages"]
+        self.chunk_starts = sections["chunk_starts"]
+        self.chunk_ends = sections["chunk_ends"]
+        self.spans = ChunkSpans(self.chunk_pages, self.chunk_starts, self.chunk_ends)
+        self._buffer = sections["text"]
+        self._parts = None
+        self._length = len(self._buffer)
+        self._num_chars = num_chars
+
+    @property
+    def frozen(self) -> bool:
+        return True
+
+    def thaw(self) -> "Corpus":
+        raise TypeError("A snapshot corpus is read-only")
+
+    @property
+    def num_chars(self) -> int:
+        return self._num_chars
+
+    def span_text(self, page: int, start: int, end: int) -> str:
+        offset = self.page_starts[page]
+        return str(self._buffer[offset + start:offset + end], "utf-8", "replace")
+
+    def page_text(self, page: int) -> str:
+        end = self.page_starts[page + 1] - len(PAGE_SEPARATOR) if page + 1 < self.num_pages else self._length
+        return self.span_text(page, 0, end - self.page_starts[page])
+
+    def chunk_lengths(self) -> List[int]:
+        return [len(self.chunk_text(i)) for i in range(self.num_chunks)]
+
+    def full_text(self) -> str:
+        return str(self._buffer, "utf-8", "replace")
+
+    def approx_bytes(self) -> int:
+        offsets = sum(view.nbytes for view in (self.page_starts, self.chunk_pages, self.chunk_starts, self.chunk_ends))
+        dense = self.dense.approx_bytes() if self.dense is not None else 0
+        return self._buffer.nbytes + offsets + sum(len(u) + 50 for u in self.urls) + self.index.approx_bytes() + dense
+
+
+def snapshot_path(url: str, directory: str = SNAPSHOT_DIR) -> str:
+    """Where the snapshot of url lives; one file per normalized URL."""
+    digest = hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()[:24]
+    return os.path.join(directory, f"{digest}.snap")
+
+
+def _byte_offsets(text: str, char_offsets: Sequence[int]) -> List[int]:
+    """UTF-8 byte offsets of the given character offsets into text."""
+    if text.isascii():
+        return list(char_offsets)
+    return [len(text[:offset].encode("utf-8")) for offset in char_offsets]
+
+
+def _sections(corpus: Corpus) -> Tuple[Dict[str, array], bytes, bytes]:
+    index = corpus.index
+    page_texts = [corpus.page_text(page) for page in range(corpus.num_pages)]
+    encoded = [text.encode("utf-8") for text in page_texts]
+    text = PAGE_SEPARATOR.encode("utf-8").join(encoded)
+
+    page_starts = array("q")
+    position = 0
+    for body in encoded:
+        page_starts.append(position)
+        position += len(body) + len(PAGE_SEPARATOR.encode("utf-8"))
+
+    chunk_pages = array("I", corpus.chunk_pages)
+    chunk_starts, chunk_ends = array("I"), array("I")
+    for page, start, end in corpus.spans:
+        s, e = _byte_offsets(page_texts[page], (start, end))
+        chunk_starts.append(s)
+        chunk_ends.append(e)
+
+    terms = sorted(index.vocab, key=lambda t: t.encode("utf-8"))
+    vocab = bytearray()
+    vocab_offsets, post_offsets = array("q", [0]), array("q", [0])
+    post_docs, post_tfs, idf = array("I"), array("I"), array("d")
+    for term in terms:
+        tid = index.vocab[term]
+        vocab += term.encode("utf-8")
+        vocab_offsets.append(len(vocab))
+        post_docs.extend(index.post_docs[tid])
+        post_tfs.extend(index.post_tfs[tid])
+        post_offsets.append(len(post_docs))
+        idf.append(index.idf(term))
+
+    arrays = {
+        "page_starts": page_starts,
+        "chunk_pages": chunk_pages,
+        "chunk_starts": chunk_starts,
+        "chunk_ends": chunk_ends,
+        "doc_lengths": array("I", index.doc_lengths),
+        "vocab_offsets": vocab_offsets,
+        "post_offsets": post_offsets,
+        "post_docs": post_docs,
+        "post_tfs": post_tfs,
+        "idf": idf,
+    }
+    return arrays, text, bytes(vocab)
+
+
+def save_snapshot(corpus: Corpus, url: str, path: Optional[str] = None, meta: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Write a frozen corpus to path (default: snapshot_path(url)) and return the path.
+    The file is written next to its destination and renamed into place, so readers
+    never see a partial snapshot.
+    """
+    path = path or snapshot_path(url)
+    with corpus.lock:
+        if corpus.deleted_pages:
+            # Tombstoned postings would skew the stored statistics; snapshot a fresh build instead
+            raise ValueError("Cannot snapshot a corpus with removed pages")
+        arrays, text, vocab = _sections(corpus)
+        num_chars = corpus.num_chars
+        urls = list(corpus.urls)
+        index = corpus.index
+        dense = corpus.dense.matrix.tobytes() if corpus.dense is not None else None
+        dense_dim = corpus.dense.dim if corpus.dense is not None else None
+    blobs = [("text", "B", text), ("vocab", "B", vocab)] + [(name, a.typecode, a.tobytes()) for name, a in arrays.items()]
+    if dense is not None:
+        blobs.append(("dense", "f", dense))
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snap-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+            sections = {}
+            for name, typecode, data in blobs:
+                f.write(b"\0" * (-f.tell() % 8))  # keep every array 8-byte aligned
+                sections[name] = {"offset": f.tell(), "length": len(data), "type": typecode}
+                f.write(data)
+            metadata = dict(meta or {})
+            metadata.update({
+                "url": normalize_url(url),
+                "created_at": time.time(),
+                "byteorder": sys.byteorder,
+                "num_chars": num_chars,
+                "urls": urls,
+                "total_length": index.total_length,
+                "k1": index.k1,
+                "b": index.b,
+                "dense_dim": dense_dim,
+                "sections": sections,
+            })
+            meta_bytes = json.dumps(metadata).encode("utf-8")
+            meta_offset = f.tell()
+            f.write(meta_bytes)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, meta_offset, len(meta_bytes)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def load_snapshot(path: str) -> Snapshot:
+    """Memory-map a snapshot; nothing but the metadata is read until it is queried."""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    buffer = memoryview(mapped)
+    if len(buffer) < HEADER.size:
+        raise SnapshotError(f"{path} is too short to be a snapshot")
+    magic, version, _, meta_offset, meta_length = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise SnapshotError(f"{path} is not a snapshot")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+    meta = json.loads(bytes(buffer[meta_offset:meta_offset + meta_length]))
+    if meta["byteorder"] != sys.byteorder:
+        raise SnapshotError(f"{path} was written on a {meta['byteorder']}-endian machine")
+    sections = {}
+    for name, info in meta["sections"].items():
+        view = buffer[info["offset"]:info["offset"] + info["length"]]
+        sections[name] = view if info["type"] == "B" else view.cast(info["type"])
+    index = SnapshotIndex(sections, meta["total_length"], meta["k1"], meta["b"])
+    dense = None
+    if "dense" in sections and dense_enabled():
+        # Zero-copy: the matrix rows are read straight from the mapping
+        dim = meta["dense_dim"]
+        dense = DenseIndex(dim, np.frombuffer(sections["dense"], dtype=np.float32).reshape(-1, dim))
+    corpus = SnapshotCorpus(index, sections, meta["urls"], meta["num_chars"], dense)
+    return Snapshot(path, meta["url"], meta["created_at"], corpus, meta)
+
+
+def find_snapshot(url: str, directory: str = SNAPSHOT_DIR) -> Optional[Snapshot]:
+    """The snapshot for url, if there is a readable one."""
+    if not directory:
+        return None
+    path = snapshot_path(url, directory)
+    if not os.path.exists(path):
+        return None
+    try:
+        return load_snapshot(path)
+    except (OSError, ValueError, KeyError, SnapshotError) as e:
+        print(f"Warning: ignoring snapshot {path} ({e}).")
+        return None
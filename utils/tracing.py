@@ -0,0 +1,288 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import METRICS_FILE, METRICS_PORT, TRACE_DIR
+
+METRIC_PREFIX = "chatbot_"
+# Upper bounds (seconds) of the stage duration histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Span attributes that also label the stage metrics; everything else stays in traces only
+METRIC_LABELS = ("method",)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Span:
+    """One timed stage. Attributes (url, bytes, chunks, cache_hit, ...) are free-form."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "started_at", "start", "end", "attrs", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attrs = attrs
+        self.error: Optional[str] = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attrs,
+            "error": self.error,
+        }
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """Process-wide counters and histograms, rendered in the Prometheus text exposition format."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help: Dict[str, str] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        # name -> labels -> [per-bucket counts..., sum, count]
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[METRIC_PREFIX + name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(METRIC_PREFIX + name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(METRIC_PREFIX + name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+                    break
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, values in sorted(series.items()):
+                    cumulative = 0.0
+                    for bound, count in zip(self.buckets, values):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', f'{bound:g}'),))} {cumulative:g}")
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {values[-1]:g}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {values[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {values[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Write the metrics to path atomically (e.g. for node_exporter's textfile collector)."""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+metrics.describe("stage_duration_seconds", "Duration of pipeline stages (fetch, parse, chunk, index, retrieval, ...).")
+metrics.describe("stage_errors_total", "Stages that ended with an exception.")
+metrics.describe("stage_bytes_total", "Bytes handled by stages that report them (fetch, parse).")
+
+_local = threading.local()
+
+
+def _stack() -> List[Span]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current_span() -> Optional[Span]:
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def _start(name: str, attrs: Dict[str, Any]) -> Span:
+    parent = current_span()
+    span_ = Span(name, parent.trace_id if parent else os.urandom(8).hex(), parent.span_id if parent else None, attrs)
+    _stack().append(span_)
+    return span_
+
+
+def _finish(span_: Span) -> None:
+    if span_.end is None:
+        span_.end = time.perf_counter()
+    labels = {k: span_.attrs[k] for k in METRIC_LABELS if k in span_.attrs}
+    metrics.observe("stage_duration_seconds", span_.duration, stage=span_.name, **labels)
+    if span_.error:
+        metrics.inc("stage_errors_total", stage=span_.name, error=span_.error)
+    if isinstance(span_.attrs.get("bytes"), int):
+        metrics.inc("stage_bytes_total", span_.attrs["bytes"], stage=span_.name)
+    collected = getattr(_local, "trace", None)
+    if collected is not None:
+        collected.append(span_)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span]:
+    """
+    Time a stage. Nested spans on the same thread become children; the duration is recorded
+    in the stage histogram, and in the active trace if there is one.
+    """
+    span_ = _start(name, attrs)
+    try:
+        yield span_
+    except BaseException as e:
+        span_.error = type(e).__name__
+        raise
+    finally:
+        stack = _stack()
+        if stack and stack[-1] is span_:
+            stack.pop()
+        _finish(span_)
+
+
+def record_span(name: str, seconds: float, error: Optional[str] = None, **attrs: Any) -> Span:
+    """Record a stage timed elsewhere (e.g. in a worker process) as a child of the current span."""
+    span_ = _start(name, attrs)
+    _stack().pop()
+    span_.error = error
+    span_.end = span_.start
+    span_.start -= seconds
+    span_.started_at -= seconds
+    _finish(span_)
+    return span_
+
+
+@contextmanager
+def trace(name: str, **attrs: Any) -> Iterator[Span]:
+    """
+    A root span for one request (e.g. answering a question). The spans finished under it on
+    this thread are collected and, with TRACE_DIR set, written there as one JSON file;
+    with METRICS_FILE set, the metrics file is refreshed afterwards.
+    Inside another trace it is just a span.
+    """
+    if getattr(_local, "trace", None) is not None:
+        with span(name, **attrs) as root:
+            yield root
+        return
+    _local.trace = []
+    try:
+        with span(name, **attrs) as root:
+            yield root
+    finally:
+        spans, _local.trace = _local.trace, None
+        if TRACE_DIR:
+            dump_trace(spans, TRACE_DIR)
+        if METRICS_FILE:
+            try:
+                metrics.write(METRICS_FILE)
+            except OSError as e:
+                print(f"Warning: could not write metrics to {METRICS_FILE} ({e}).")
+
+
+def dump_trace(spans: List[Span], directory: str) -> Optional[str]:
+    """Write the spans of one trace, root first, to directory/<time>-<trace id>.json."""
+    if not spans:
+        return None
+    ordered = sorted(spans, key=lambda s: s.start)
+    root = ordered[0]
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(root.started_at))}-{root.trace_id}.json")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"trace_id": root.trace_id, "name": root.name, "spans": [s.to_dict() for s in ordered]},
+                      f, indent=2, default=str)
+    except OSError as e:
+        print(f"Warning: could not write trace to {directory} ({e}).")
+        return None
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        data = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_failed = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on a background thread, once per process; None if disabled or the port is taken."""
+    global _server, _server_failed
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None and not _server_failed:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                # Usually another process already serves this port; do not retry on every rerun
+                _server_failed = True
+                print(f"Warning: could not serve metrics on port {port} ({e}).")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server